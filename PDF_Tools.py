@@ -1,133 +1,4425 @@
+import time
+
+_STARTUP_STARTED = time.perf_counter()  # 启动计时起点，尽量早于其他导入
+
 import sys
 import os
+import io
+import importlib
+import importlib.util
+import json
+import math
+import zlib
+import argparse
+import re
+import heapq
+import hashlib
+import tempfile
+import shutil
+import signal
+import subprocess
+import multiprocessing
+import multiprocessing.connection
+import threading
 import webbrowser
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor, as_completed, CancelledError
+from concurrent.futures.process import BrokenProcessPool
+from collections import OrderedDict, deque, namedtuple
+from contextlib import ExitStack
 from PyQt5.QtWidgets import (QApplication, QMainWindow, QWidget, QVBoxLayout,
                              QHBoxLayout, QPushButton, QListWidget, QLabel,
                              QFileDialog, QMessageBox, QProgressBar, QListWidgetItem,
                              QGroupBox, QSplitter, QGridLayout, QComboBox,
                              QTabWidget, QSpinBox, QRadioButton, QButtonGroup,
-                             QTextEdit)
-from PyQt5.QtCore import Qt, QThread, pyqtSignal, QSettings, QPoint
-from PyQt5.QtGui import (QIcon, QPixmap, QColor, QPalette, QDragEnterEvent,
+                             QTextEdit, QCheckBox, QDoubleSpinBox, QListView,
+                             QAbstractItemView, QInputDialog, QLineEdit)
+from PyQt5.QtCore import (Qt, QThread, pyqtSignal, QSettings, QPoint, QStandardPaths, QTimer,
+                          QObject, QAbstractListModel, QModelIndex, QSize, QT_VERSION_STR, PYQT_VERSION_STR)
+from PyQt5.QtGui import (QIcon, QPixmap, QImage, QColor, QPalette, QDragEnterEvent,
                          QDropEvent, QPainter, QPen, QBrush, QFont)
-import PyPDF2
 from datetime import datetime
-import fitz  # PyMuPDF，用于PDF预览
 
-# 忽略警告
-import warnings
+# 忽略警告
+import warnings
+
+warnings.filterwarnings("ignore", category=DeprecationWarning)
+
+
+class LazyModule:
+    """首次访问属性时才导入的模块代理，缩短程序启动时间"""
+
+    def __init__(self, name):
+        self._name = name
+        self._module = None
+
+    def _load(self):
+        if self._module is None:
+            self._module = importlib.import_module(self._name)
+        return self._module
+
+    def __getattr__(self, attr):
+        return getattr(self._load(), attr)
+
+
+PyPDF2 = LazyModule("PyPDF2")
+fitz = LazyModule("fitz")  # PyMuPDF，用于PDF预览
+numpy = LazyModule("numpy")  # 可选，空白页检测按批向量化统计；检测重复页时需要
+ctypes = LazyModule("ctypes")  # 监视模式的 inotify 和 Windows 上识别网络驱动器时才用到
+select = LazyModule("select")
+uuid = LazyModule("uuid")  # 以下只在作业服务中用到
+urllib_parse = LazyModule("urllib.parse")
+zipfile = LazyModule("zipfile")  # 拆分输出到归档时才用到
+tarfile = LazyModule("tarfile")
+
+
+# ========== 启动 ==========
+
+STARTUP_BUDGET_MS = 1500  # 启动时间预算：从进程导入到窗口首次显示
+STARTUP_PROFILE_ENV = "PDFTOOLS_STARTUP_PROFILE"  # 设为1时总是输出各阶段耗时
+ICON_SIZES = [16, 24, 32, 48, 64, 128, 256]
+ICON_CACHE_VERSION = 1  # 图标绘制方式改变时递增，使磁盘缓存失效
+
+
+class StartupTimer:
+    """记录启动各阶段耗时，超出预算时输出明细"""
+
+    def __init__(self, started=_STARTUP_STARTED, budget_ms=STARTUP_BUDGET_MS):
+        self.started = started
+        self.budget_ms = budget_ms
+        self.marks = []
+
+    def mark(self, stage):
+        self.marks.append((stage, (time.perf_counter() - self.started) * 1000))
+
+    @property
+    def elapsed_ms(self):
+        return self.marks[-1][1] if self.marks else 0.0
+
+    def report(self):
+        """返回是否在预算内；超出预算或开启分析时打印各阶段耗时"""
+        within_budget = self.elapsed_ms <= self.budget_ms
+        if not within_budget or os.environ.get(STARTUP_PROFILE_ENV) == "1":
+            stages = ", ".join(f"{stage}: {ms:.0f}ms" for stage, ms in self.marks)
+            print(f"启动耗时 {self.elapsed_ms:.0f}ms (预算 {self.budget_ms}ms) - {stages}",
+                  file=sys.stderr)
+        return within_budget
+
+
+def paint_icon_pixmap(size):
+    """绘制一个尺寸的红色PDF文档图标"""
+    pixmap = QPixmap(size, size)
+    pixmap.fill(Qt.transparent)
+
+    painter = QPainter(pixmap)
+    painter.setRenderHint(QPainter.Antialiasing)
+
+    # 红色PDF图标
+    red_color = QColor(220, 50, 50)
+
+    # 绘制文档形状
+    margin = size * 0.15
+    doc_width = size - 2 * margin
+    doc_height = doc_width * 1.2  # 略高的矩形
+
+    # 文档主体
+    painter.setBrush(QBrush(red_color))
+    painter.setPen(QPen(red_color.darker(130), max(1, size * 0.02)))
+    painter.drawRoundedRect(int(margin), int(margin),
+                            int(doc_width), int(doc_height),
+                            int(size * 0.1), int(size * 0.1))
+
+    # 文档折角
+    fold_size = min(doc_width * 0.3, doc_height * 0.3)
+    painter.setBrush(QBrush(red_color.darker(120)))
+    fold_points = [
+        QPoint(int(margin + doc_width - fold_size), int(margin)),
+        QPoint(int(margin + doc_width), int(margin)),
+        QPoint(int(margin + doc_width), int(margin + fold_size))
+    ]
+    painter.drawPolygon(fold_points)
+
+    # 在中心绘制白色"P"
+    painter.setPen(QPen(Qt.white, max(1, size * 0.02)))
+    font_size = int(size * 0.3)
+    font = QFont("Arial", font_size, QFont.Bold)
+    painter.setFont(font)
+    text = "P"
+    text_rect = painter.fontMetrics().boundingRect(text)
+    text_x = int((size - text_rect.width()) / 2)
+    text_y = int((size + text_rect.height()) / 2)
+    painter.drawText(text_x, text_y, text)
+
+    painter.end()
+    return pixmap
+
+
+_app_icon = None
+
+
+def app_icon():
+    """应用图标，进程内只构建一次
+
+    各尺寸首次绘制后保存为PNG缓存，之后的启动直接加载，不再用QPainter绘制。
+    """
+    global _app_icon
+    if _app_icon is not None:
+        return _app_icon
+
+    cache_dir = QStandardPaths.writableLocation(QStandardPaths.CacheLocation)
+    icon = QIcon()
+    for size in ICON_SIZES:
+        cache_path = os.path.join(cache_dir, f"icon_v{ICON_CACHE_VERSION}_{size}.png") if cache_dir else None
+        pixmap = QPixmap()
+        if not (cache_path and pixmap.load(cache_path)):
+            pixmap = paint_icon_pixmap(size)
+            if cache_path:
+                try:
+                    os.makedirs(cache_dir, exist_ok=True)
+                    pixmap.save(cache_path, "PNG")
+                except OSError:
+                    pass
+        icon.addPixmap(pixmap)
+
+    _app_icon = icon
+    return icon
+
+
+# ========== 加密文件 ==========
+
+class EncryptedPDFError(ValueError):
+    """加密文件没有可用的密码"""
+
+    def __init__(self, pdf_file):
+        super().__init__(f"{os.path.basename(pdf_file)}: 文件已加密，未提供正确的密码")
+        self.pdf_file = pdf_file
+
+
+class PasswordProvider:
+    """本次会话的PDF密码：已解密文件的钥匙串加一组候选密码
+
+    打开加密文件时依次尝试钥匙串中该文件的密码、空密码和候选密码，试出的
+    密码记入钥匙串，之后再打开同一文件只需一次密钥推导。密码只保存在内存中。
+    """
+
+    def __init__(self, candidates=(), keyring=None):
+        self._lock = threading.Lock()
+        self._keyring = {}  # 绝对路径 -> 密码
+        self._candidates = []
+        self.add_candidates(candidates)
+        for pdf_file, password in (keyring or {}).items():
+            self.remember(pdf_file, password)
+
+    def add_candidates(self, passwords):
+        with self._lock:
+            for password in passwords:
+                if password not in self._candidates:
+                    self._candidates.append(password)
+
+    @property
+    def has_candidates(self):
+        with self._lock:
+            return bool(self._candidates)
+
+    def remember(self, pdf_file, password):
+        with self._lock:
+            self._keyring[os.path.abspath(pdf_file)] = password
+
+    def share(self, pdf_file, copy_file):
+        """副本（本地暂存副本、修复副本）沿用原文件已知的密码"""
+        password = self.password_for(pdf_file)
+        if password is not None:
+            self.remember(copy_file, password)
+
+    def password_for(self, pdf_file):
+        """钥匙串中的密码，未解密过的文件返回 None"""
+        with self._lock:
+            return self._keyring.get(os.path.abspath(pdf_file))
+
+    def candidates_for(self, pdf_file):
+        """按尝试顺序返回文件的候选密码"""
+        known = self.password_for(pdf_file)
+        with self._lock:
+            passwords = [] if known is None else [known]
+            passwords += [password for password in [""] + self._candidates if password != known]
+        return passwords
+
+    def snapshot(self, pdf_files=None):
+        """可传给子进程的纯数据副本；给出 pdf_files 时只带这些文件的钥匙串"""
+        with self._lock:
+            keyring = dict(self._keyring)
+            candidates = list(self._candidates)
+        if pdf_files is not None:
+            wanted = {os.path.abspath(pdf_file) for pdf_file in pdf_files}
+            keyring = {path: password for path, password in keyring.items() if path in wanted}
+        return {"candidates": candidates, "keyring": keyring}
+
+    @classmethod
+    def from_snapshot(cls, snapshot):
+        if not snapshot:
+            return cls()
+        return cls(snapshot.get("candidates", ()), snapshot.get("keyring"))
+
+    def unlock_document(self, doc, pdf_file):
+        """解密MuPDF文档，成功时记住密码；未加密的文档直接返回 True"""
+        if not doc.needs_pass:
+            return True
+        for password in self.candidates_for(pdf_file):
+            if doc.authenticate(password):
+                self.remember(pdf_file, password)
+                return True
+        return False
+
+    def unlock_reader(self, reader, pdf_file):
+        """解密PyPDF2读取器，成功时记住密码；未加密的文件直接返回 True"""
+        if not reader.is_encrypted:
+            return True
+        for password in self.candidates_for(pdf_file):
+            if reader.decrypt(password):
+                self.remember(pdf_file, password)
+                return True
+        return False
+
+
+def open_pdf_document(pdf_file, passwords=None, data=None):
+    """用MuPDF打开并按需解密文件，没有可用密码时抛出 EncryptedPDFError
+
+    data 为已读入内存的文件内容，此时 pdf_file 只用于查找密码和报错。
+    """
+    doc = fitz.open(pdf_file) if data is None else fitz.open("pdf", data)
+    if not (passwords or PasswordProvider()).unlock_document(doc, pdf_file):
+        doc.close()
+        raise EncryptedPDFError(pdf_file)
+    return doc
+
+
+def open_pdf_reader(stream, pdf_file, passwords=None):
+    """创建并按需解密PyPDF2读取器，没有可用密码时抛出 EncryptedPDFError"""
+    reader = PyPDF2.PdfReader(stream)
+    if not (passwords or PasswordProvider()).unlock_reader(reader, pdf_file):
+        raise EncryptedPDFError(pdf_file)
+    return reader
+
+
+# ========== 页面复制后端 ==========
+
+BACKEND_PYPDF2 = 'pypdf2'  # PyPDF2: 解析为Python对象后重新写出
+BACKEND_RAW = 'raw'  # MuPDF: 原始流直通复制
+
+
+def iter_page_runs(page_numbers):
+    """将有序页码序列合并为连续区间 (start, end)，end 为闭区间"""
+    start = prev = None
+    for page_num in page_numbers:
+        if start is None:
+            start = prev = page_num
+        elif page_num == prev + 1:
+            prev = page_num
+        else:
+            yield start, prev
+            start = prev = page_num
+    if start is not None:
+        yield start, prev
+
+
+class RawPageCopier:
+    """基于MuPDF的原始流直通复制
+
+    insert_pdf 在对象层面嫁接页面，已压缩的图像流和内容流按原始字节
+    复制到输出文件，不经过解压、重新压缩，也不构建中间的Python字典。
+    """
+
+    def __init__(self, source, passwords=None):
+        self.source = open_pdf_document(source, passwords) if isinstance(source, str) else source
+
+    @property
+    def page_count(self):
+        return self.source.page_count
+
+    def copy_pages(self, target, page_numbers, rotate=0, final=True):
+        """把指定页复制到目标文档，连续页一次嫁接
+
+        rotate 为在原有旋转基础上再顺时针旋转的角度；同一来源还会再次
+        插入时传入 final=False，保留对象映射使共享资源只复制一次。
+        """
+        first_new_page = target.page_count
+        runs = list(iter_page_runs(page_numbers))
+        for i, (start, end) in enumerate(runs):
+            target.insert_pdf(self.source, from_page=start, to_page=end,
+                              final=final and i == len(runs) - 1)
+
+        if rotate:
+            for page_num in range(first_new_page, target.page_count):
+                page = target[page_num]
+                page.set_rotation((page.rotation + rotate) % 360)
+
+    def copy_all(self, target):
+        target.insert_pdf(self.source)
+
+    @staticmethod
+    def save(target, output):
+        """保存文档，不解压(expand=0)也不重新压缩(deflate=False)"""
+        target.save(output, garbage=0, deflate=False, expand=0)
+
+    @staticmethod
+    def to_bytes(target):
+        """序列化为字节，选项与 save 相同"""
+        return target.tobytes(garbage=0, deflate=False, expand=0)
+
+    def close(self):
+        self.source.close()
+
+
+# ========== 页面盖章 ==========
+
+STAMP_POSITIONS = ('bottom-right', 'bottom-center', 'bottom-left', 'top-right', 'top-center', 'top-left')
+DEFAULT_STAMP_POSITION = 'bottom-right'
+DEFAULT_BATES_DIGITS = 6
+DEFAULT_WATERMARK_OPACITY = 0.15
+STAMP_FONT_SIZE = 9
+STAMP_MARGIN = 20  # Bates 编号到页边的距离（点）
+WATERMARK_BOX = 600  # 水印表单的边长，放到页面上时按页面大小缩放
+
+
+def _pdf_number(value):
+    text = f"{value:.4f}".rstrip('0').rstrip('.')
+    return "0" if text in ("", "-0") else text
+
+
+def _pdf_matrix(matrix):
+    return " ".join(_pdf_number(value) for value in matrix)
+
+
+def _pdf_string(text):
+    return "(" + text.replace("\\", "\\\\").replace("(", "\\(").replace(")", "\\)") + ")"
+
+
+def _ref_xref(value):
+    """间接引用 '12 0 R' 的对象编号"""
+    return int(value.split()[0])
+
+
+def stamper_from_options(options):
+    """把 watermark、bates、bates_start、bates_digits、stamp_position 选项（含义同命令行参数）转换为
+    PageStamper，既没有水印也不编号时返回 None
+
+    bates 为编号前缀，空字符串或 true 表示只有数字。
+    """
+    watermark = options.get("watermark") or None
+    bates = options.get("bates")
+    if bates is False:
+        bates = None
+    elif bates is True:
+        bates = ""
+    if watermark is None and bates is None:
+        return None
+    return PageStamper(watermark, None if bates is None else str(bates),
+                       int(options.get("bates_start", 1)),
+                       int(options.get("bates_digits", DEFAULT_BATES_DIGITS)),
+                       options.get("stamp_position") or DEFAULT_STAMP_POSITION)
+
+
+class PageStamper:
+    """在页面上叠加水印和 Bates 编号
+
+    水印在每个文档中只生成一次，作为共享的表单 XObject 被每一页引用；
+    每页只新增一段几十字节的内容流画出编号，页面原有的内容流不解压、
+    不改写。修改全部在对象层面进行：修改对象后再载入 Page 会重建页面
+    引用，大文件上每页要多花毫秒级的时间，所以页面几何信息在修改之前
+    一次读出。
+    """
+
+    def __init__(self, watermark=None, bates_prefix=None, bates_start=1,
+                 bates_digits=DEFAULT_BATES_DIGITS, position=DEFAULT_STAMP_POSITION,
+                 opacity=DEFAULT_WATERMARK_OPACITY):
+        if position not in STAMP_POSITIONS:
+            raise ValueError(f"未知的编号位置: {position}")
+        if bates_prefix and not (bates_prefix.isascii() and bates_prefix.isprintable()):
+            # 编号使用不嵌入的 Helvetica 字体，只能显示 ASCII 字符
+            raise ValueError("Bates 编号前缀只能包含 ASCII 字符")
+        self.watermark = watermark or None  # 水印文字，None 表示不加水印
+        self.bates_prefix = bates_prefix  # Bates 编号前缀，None 表示不编号，空字符串表示只有数字
+        self.bates_start = bates_start
+        self.bates_digits = bates_digits
+        self.position = position
+        self.opacity = opacity
+        self._watermark_pdf = None
+
+    def bates_number(self, index):
+        """第 index 页（从 0 开始）的 Bates 编号"""
+        return f"{self.bates_prefix}{self.bates_start + index:0{self.bates_digits}d}"
+
+    def to_dict(self):
+        return {"watermark": self.watermark, "bates_prefix": self.bates_prefix,
+                "bates_start": self.bates_start, "bates_digits": self.bates_digits,
+                "position": self.position, "opacity": self.opacity}
+
+    @classmethod
+    def from_dict(cls, data):
+        return cls(**data) if data else None
+
+    def watermark_pdf(self):
+        """水印的单页PDF：边长 WATERMARK_BOX 的正方形，文字沿对角线居中"""
+        if self._watermark_pdf is None:
+            fontname = 'helv' if self.watermark.isascii() else 'china-s'
+            font = fitz.Font(fontname)
+            font_size = min(72, WATERMARK_BOX * 1.1 / font.text_length(self.watermark, 1))
+            center = fitz.Point(WATERMARK_BOX / 2, WATERMARK_BOX / 2)
+            origin = center + (-font.text_length(self.watermark, font_size) / 2, font_size * 0.35)
+            doc = fitz.open()
+            try:
+                page = doc.new_page(width=WATERMARK_BOX, height=WATERMARK_BOX)
+                page.insert_text(origin, self.watermark, fontname=fontname, fontsize=font_size,
+                                 color=(0.5, 0.5, 0.5), fill_opacity=self.opacity,
+                                 morph=(center, fitz.Matrix(45)))
+                self._watermark_pdf = doc.tobytes()
+            finally:
+                doc.close()
+        return self._watermark_pdf
+
+    def stamp(self, doc, first_page=0, numbers=None):
+        """给 doc 中从 first_page 起的各页盖章
+
+        numbers 为这些页的 Bates 序号（相对 bates_start），默认为页码，即输出中
+        的第几页；拆分时传入各页在原文件中的页码。
+        """
+        # 第一遍只读取几何信息：页面坐标（左上角为原点、已按 /Rotate 旋转）到 PDF 用户空间的变换
+        geometry = []
+        for page_num in range(first_page, doc.page_count):
+            page = doc[page_num]
+            geometry.append((page.xref, page.rect, page.derotation_matrix * ~page.transformation_matrix))
+        if not geometry:
+            return
+        numbers = range(first_page, doc.page_count) if numbers is None else list(numbers)
+
+        resources = {}
+        if self.watermark:
+            resources["XObject"] = self._add_watermark(doc)
+        if self.bates_prefix is not None:
+            resources["Font"] = self._add_object(doc, "<</Type/Font/Subtype/Type1/BaseFont/Helvetica"
+                                                      "/Encoding/WinAnsiEncoding>>")
+        names = {category: f"Stamp{category[0]}{xref}" for category, xref in resources.items()}
+        # 原有内容包在 q ... Q 之间，其中遗留的坐标变换不影响盖章
+        save_xref = self._add_stream(doc, b"q\n")
+        restore_xref = self._add_stream(doc, b"Q\n")
+        # 页面几何相同时共用画水印的内容流和编号的位置，大多数文档只有少数几种页面
+        placements = {}
+        text_matrices = {}
+        shared_resources = set()
+
+        for (page_xref, rect, to_pdf), number in zip(geometry, numbers):
+            contents = [f"{save_xref} 0 R", self._content_refs(doc, page_xref), f"{restore_xref} 0 R"]
+            layout = (tuple(rect), tuple(to_pdf))
+            if self.watermark:
+                if layout not in placements:
+                    placements[layout] = self._add_stream(
+                        doc, self.watermark_content(rect, to_pdf, names['XObject']))
+                contents.append(f"{placements[layout]} 0 R")
+            if self.bates_prefix is not None:
+                text = self.bates_number(number)
+                # Helvetica 的数字等宽，前缀相同时编号的宽度只取决于长度
+                key = (layout, len(text))
+                if key not in text_matrices:
+                    x, y = self.bates_origin(rect, fitz.get_text_length(text, 'helv', STAMP_FONT_SIZE))
+                    text_matrices[key] = _pdf_matrix(fitz.Matrix(1, 0, 0, -1, x, y) * to_pdf)
+                content = f"BT /{names['Font']} {STAMP_FONT_SIZE} Tf {text_matrices[key]} Tm {_pdf_string(text)} Tj ET\n"
+                contents.append(f"{self._add_stream(doc, content.encode())} 0 R")
+            doc.xref_set_key(page_xref, "Contents", f"[{' '.join(contents)}]")
+            self._add_resources(doc, page_xref, resources, names, shared_resources)
+
+    def stamp_file(self, path):
+        """给已写出的PDF文件盖章，以增量更新追加到文件末尾"""
+        doc = fitz.open(path)
+        try:
+            self.stamp(doc)
+            if doc.can_save_incrementally():
+                doc.saveIncr()
+                return
+            temp_path = f"{path}.{os.getpid()}.tmp"
+            RawPageCopier.save(doc, temp_path)
+        finally:
+            doc.close()
+        os.replace(temp_path, path)
+
+    def stamp_bytes(self, data, numbers=None):
+        """给PDF字节内容盖章，返回新的字节内容"""
+        doc = fitz.open("pdf", data)
+        try:
+            self.stamp(doc, numbers=numbers)
+            return RawPageCopier.to_bytes(doc)
+        finally:
+            doc.close()
+
+    def bates_origin(self, rect, width):
+        """编号文字基线起点（页面坐标）"""
+        vertical, horizontal = self.position.split('-')
+        if horizontal == 'left':
+            x = rect.x0 + STAMP_MARGIN
+        elif horizontal == 'right':
+            x = rect.x1 - STAMP_MARGIN - width
+        else:
+            x = (rect.x0 + rect.x1 - width) / 2
+        y = rect.y0 + STAMP_MARGIN + STAMP_FONT_SIZE if vertical == 'top' else rect.y1 - STAMP_MARGIN
+        return x, y
+
+    @staticmethod
+    def watermark_content(rect, to_pdf, name):
+        """把水印表单缩放到页面短边、居中放置的内容流"""
+        side = min(rect.width, rect.height)
+        scale = side / WATERMARK_BOX
+        matrix = fitz.Matrix(scale, 0, 0, -scale, rect.x0 + (rect.width - side) / 2,
+                             rect.y0 + (rect.height + side) / 2) * to_pdf
+        return f"q {_pdf_matrix(matrix)} cm /{name} Do Q\n".encode()
+
+    def _add_watermark(self, doc):
+        """把水印作为表单 XObject 放进文档，返回其 xref"""
+        source = fitz.open("pdf", self.watermark_pdf())
+        try:
+            # show_pdf_page 把源页面转换为表单 XObject；借用一张临时页，完成后删除
+            page = doc.new_page(width=WATERMARK_BOX, height=WATERMARK_BOX)
+            xref = page.show_pdf_page(page.rect, source, 0)
+            doc.delete_page(page.number)
+        finally:
+            source.close()
+        return xref
+
+    @staticmethod
+    def _add_object(doc, source):
+        xref = doc.get_new_xref()
+        doc.update_object(xref, source)
+        return xref
+
+    @classmethod
+    def _add_stream(cls, doc, data):
+        xref = cls._add_object(doc, "<<>>")
+        doc.update_stream(xref, data, compress=False)
+        return xref
+
+    @staticmethod
+    def _content_refs(doc, page_xref):
+        """页面原有内容流的引用，空页面为空字符串"""
+        kind, value = doc.xref_get_key(page_xref, "Contents")
+        if kind == 'array':
+            return value[1:-1].strip()
+        if kind == 'xref' and not doc.xref_is_stream(_ref_xref(value)):
+            # 间接引用的内容流数组
+            return doc.xref_object(_ref_xref(value), compressed=True).strip()[1:-1].strip()
+        return value if kind == 'xref' else ""
+
+    @staticmethod
+    def _add_resources(doc, page_xref, resources, names, shared_resources):
+        """把盖章用到的对象登记到页面资源；xref_set_key 的路径不能穿过间接引用，逐级解析"""
+        kind, value = doc.xref_get_key(page_xref, "Resources")
+        if kind == 'null':
+            # 继承自页面树的资源复制到页面上，再在其中登记
+            holder = page_xref
+            while kind == 'null':
+                kind, parent = doc.xref_get_key(holder, "Parent")
+                if kind != 'xref':
+                    value = "<<>>"
+                    break
+                holder = _ref_xref(parent)
+                kind, value = doc.xref_get_key(holder, "Resources")
+            doc.xref_set_key(page_xref, "Resources", value)
+            kind, value = doc.xref_get_key(page_xref, "Resources")
+
+        for category, xref in resources.items():
+            holder, path = (_ref_xref(value), category) if kind == 'xref' else (page_xref, f"Resources/{category}")
+            if (holder, path) in shared_resources:
+                continue
+            sub_kind, sub_value = doc.xref_get_key(holder, path)
+            if sub_kind == 'xref':
+                target, key = _ref_xref(sub_value), names[category]
+            else:
+                target, key = holder, f"{path}/{names[category]}"
+            doc.xref_set_key(target, key, f"{xref} 0 R")
+            if holder != page_xref:
+                # 多个页面共用的资源字典只需登记一次
+                shared_resources.add((holder, path))
+
+
+# ========== 图像压缩 ==========
+
+IMAGE_FORMATS = ('auto', 'jpeg', 'flate')
+DEFAULT_IMAGE_DPI = 150
+DEFAULT_IMAGE_QUALITY = 75
+IMAGE_DOWNSAMPLE_THRESHOLD = 1.5  # 有效分辨率超过目标的 1.5 倍才降采样，略高的不重新编码
+IMAGE_KEEP_COLORSPACES = ('DeviceGray', 'DeviceRGB', 'ICCBased')  # 解码后分量数不变时沿用原色彩空间
+IMAGES_PER_TASK = 4
+
+
+def image_optimizer_from_options(options):
+    """把 image_dpi、image_format、image_quality 选项转换为 ImageOptimizer，未给出 image_dpi 时返回 None"""
+    dpi = options.get("image_dpi")
+    if not dpi:
+        return None
+    return ImageOptimizer(int(dpi), options.get("image_format") or 'auto',
+                          int(options.get("image_quality", DEFAULT_IMAGE_QUALITY)))
+
+
+def _plan_images_worker(pdf_file, optimizer, passwords=None):
+    """找出一个文件中需要缩小的图像
+
+    返回 {xref: (图像文件名, 原始数据长度, 目标宽, 目标高, 是否用JPEG, 可沿用原色彩空间)}；
+    图像文件名由原始数据的哈希和目标尺寸组成，相同的图像在各文件中同名。
+    """
+    optimizer = ImageOptimizer.from_dict(optimizer)
+    planned = {}
+    doc = open_pdf_document(pdf_file, PasswordProvider.from_snapshot(passwords))
+    try:
+        for xref, (width, height, use_jpeg, keep_colorspace) in optimizer.plan_images(doc).items():
+            raw = doc.xref_stream_raw(xref)
+            name = f"{hashlib.sha256(raw).hexdigest()}_{width}x{height}.{'jpg' if use_jpeg else 'zz'}"
+            planned[xref] = (name, len(raw), width, height, use_jpeg, keep_colorspace)
+    finally:
+        doc.close()
+    return planned
+
+
+def _optimize_images_worker(pdf_file, images, quality, output_dir, passwords=None):
+    """子进程中解码一批图像，缩小并重新编码后写入 output_dir
+
+    images 为 [(xref, 目标宽, 目标高, 是否用JPEG, 文件名)]，返回
+    [(编码, 分量数, 宽, 高, 是否转换了色彩空间) 或 None]；编码后的数据写入文件，
+    不经进程间传递。无法解码的图像为 None，保持原样。
+    """
+    results = []
+    doc = open_pdf_document(pdf_file, PasswordProvider.from_snapshot(passwords))
+    try:
+        for xref, width, height, use_jpeg, name in images:
+            try:
+                pix = fitz.Pixmap(doc, xref)
+                if pix.alpha:
+                    pix = fitz.Pixmap(pix, 0)
+                converted = pix.n not in (1, 3)
+                if converted:
+                    pix = fitz.Pixmap(fitz.csRGB, pix)
+                pix = fitz.Pixmap(pix, width, height, None)
+                data = pix.tobytes("jpeg", jpg_quality=quality) if use_jpeg else zlib.compress(pix.samples)
+            except (RuntimeError, ValueError):
+                results.append(None)
+                continue
+            with open(os.path.join(output_dir, name), 'wb') as f:
+                f.write(data)
+            results.append(("jpeg" if use_jpeg else "flate", pix.n, pix.width, pix.height, converted))
+    finally:
+        doc.close()
+    return results
+
+
+def _replace_images_worker(pdf_file, optimized_path, replacements, output_dir, passwords=None):
+    """把 output_dir 中重新编码的图像写入文件的副本 optimized_path
+
+    replacements 为 [(xref, 图像文件名, 编码结果, 可沿用原色彩空间)]。
+    """
+    os.makedirs(os.path.dirname(optimized_path), exist_ok=True)
+    doc = open_pdf_document(pdf_file, PasswordProvider.from_snapshot(passwords))
+    try:
+        for xref, name, result, keep_colorspace in replacements:
+            with open(os.path.join(output_dir, name), 'rb') as f:
+                ImageOptimizer.replace_image(doc, xref, f.read(), result, keep_colorspace)
+        doc.save(optimized_path, garbage=1)
+    finally:
+        doc.close()
+    return optimized_path
+
+
+class ImageOptimizer:
+    """降低输入文件中高分辨率图像的分辨率并重新压缩，减小合并、拆分的输出
+
+    按图像在页面上的最大显示尺寸计算有效分辨率，超过 dpi 的 IMAGE_DOWNSAMPLE_THRESHOLD
+    倍时缩小到 dpi。image_format 为 'jpeg'、'flate' 或 'auto'（原来是 JPEG/JPEG 2000 的
+    仍用 JPEG，其余用无损的 Flate）；quality 为 JPEG 质量。非 8 位图像（黑白扫描页、
+    图像遮罩）和带颜色键遮罩的图像不处理，软遮罩（SMask）保持原样。
+    """
+
+    def __init__(self, dpi=DEFAULT_IMAGE_DPI, image_format='auto', quality=DEFAULT_IMAGE_QUALITY):
+        if image_format not in IMAGE_FORMATS:
+            raise ValueError(f"不支持的图像格式: {image_format}")
+        if dpi <= 0:
+            raise ValueError("目标分辨率应大于0")
+        if not 1 <= quality <= 100:
+            raise ValueError("JPEG 质量应在 1-100 之间")
+        self.dpi = dpi
+        self.image_format = image_format
+        self.quality = quality
+
+    def to_dict(self):
+        return {"dpi": self.dpi, "image_format": self.image_format, "quality": self.quality}
+
+    @classmethod
+    def from_dict(cls, data):
+        return cls(**data) if data else None
+
+    def plan_images(self, doc):
+        """找出需要缩小的图像，返回 {xref: (目标宽, 目标高, 是否用JPEG, 可沿用原色彩空间)}
+
+        显示尺寸取自不解码图像的 get_image_info，按像素尺寸对应到页面资源中的图像；
+        同一页上像素尺寸相同的几个图像取其中最大的显示尺寸，宁可少缩小。
+        """
+        images = {}  # xref -> get_images 条目
+        display = {}  # xref -> 最大显示尺寸（点）
+        for page in doc:
+            by_size = {}
+            for item in page.get_images(full=True):
+                images[item[0]] = item
+                by_size.setdefault((item[2], item[3]), []).append(item[0])
+            for info in page.get_image_info():
+                a, b, c, d = info["transform"][:4]
+                size = (math.hypot(a, b), math.hypot(c, d))
+                for xref in by_size.get((info["width"], info["height"]), ()):
+                    known = display.get(xref)
+                    if known is None or size[0] * size[1] > known[0] * known[1]:
+                        display[xref] = size
+
+        planned = {}
+        for xref, (shown_width, shown_height) in display.items():
+            _, _, width, height, bpc, colorspace, _, _, filters, _ = images[xref]
+            if bpc != 8 or shown_width < 1 or shown_height < 1 or doc.xref_get_key(xref, "Mask")[0] != "null":
+                continue
+            dpi = min(width / shown_width, height / shown_height) * 72
+            if dpi <= self.dpi * IMAGE_DOWNSAMPLE_THRESHOLD:
+                continue
+            scale = self.dpi / dpi
+            lossy = 'DCTDecode' in filters or 'JPXDecode' in filters
+            use_jpeg = self.image_format == 'jpeg' or (self.image_format == 'auto' and lossy)
+            planned[xref] = (max(1, round(width * scale)), max(1, round(height * scale)), use_jpeg,
+                             colorspace in IMAGE_KEEP_COLORSPACES)
+        return planned
+
+    def optimize(self, paths, output_dir, passwords=None, max_workers=None, pool=None, on_error=None):
+        """在进程池中压缩各文件的图像，返回 (各文件压缩后的副本路径, 统计)
+
+        相同的图像（原始数据和目标尺寸都相同）不论出现在哪个文件中只处理一次。
+        没有可压缩图像的文件返回原路径；副本写入 output_dir 下按序号分开的子目录，
+        保留原文件名和加密。统计为 {"images": 替换的图像数, "saved_bytes": 减小的字节数}。
+        给出 IsolatedTaskPool 时查找、解码和写回图像都在受监督的子进程中进行，出错的
+        文件或图像保持原样，并调用 on_error(文件, 错误信息)。
+        """
+        passwords = passwords or PasswordProvider()
+        planned = []  # 每个文件: {xref: (图像文件名, 原长度, 目标宽, 目标高, 是否用JPEG, 可沿用原色彩空间)}
+        tasks = {}  # 图像文件名 -> (文件, xref, 目标宽, 目标高, 是否用JPEG)
+        results = run_analysis_tasks('plan_images', [(path, self.to_dict(), passwords.snapshot([path]))
+                                                     for path in paths], pool, max_workers)
+        for path, result in zip(paths, results):
+            if not result.ok:
+                report_task_error(path, result.error, on_error)
+                planned.append({})
+                continue
+            planned.append(result.value)
+            for xref, (name, _, width, height, use_jpeg, _) in result.value.items():
+                tasks.setdefault(name, (path, xref, width, height, use_jpeg))
+
+        by_file = {}
+        for name, (path, xref, width, height, use_jpeg) in tasks.items():
+            by_file.setdefault(path, []).append((xref, width, height, use_jpeg, name))
+        chunks = [(path, images[start:start + IMAGES_PER_TASK])
+                  for path, images in by_file.items() for start in range(0, len(images), IMAGES_PER_TASK)]
+        results = run_analysis_tasks('optimize_images', [(path, images, self.quality, output_dir,
+                                                          passwords.snapshot([path])) for path, images in chunks],
+                                     pool, max_workers)
+        encoded = {}
+        for (path, images), result in zip(chunks, results):
+            if not result.ok:
+                report_task_error(path, result.error, on_error)
+                continue
+            encoded.update((image[-1], value) for image, value in zip(images, result.value))
+
+        rewrites = []  # (序号, 文件, 副本路径, 替换的图像, 减小的字节数)
+        for index, (path, entries) in enumerate(zip(paths, planned)):
+            replacements = []
+            saved_bytes = 0
+            for xref, (name, length, _, _, _, keep_colorspace) in entries.items():
+                result = encoded.get(name)
+                if result is None:
+                    continue
+                size = os.path.getsize(os.path.join(output_dir, name))
+                if size < length:
+                    replacements.append((xref, name, result, keep_colorspace))
+                    saved_bytes += length - size
+            if replacements:
+                optimized_path = os.path.join(output_dir, str(index), os.path.basename(path))
+                rewrites.append((index, path, optimized_path, replacements, saved_bytes))
+
+        results = run_analysis_tasks('replace_images', [(path, optimized_path, replacements, output_dir,
+                                                         passwords.snapshot([path]))
+                                                        for _, path, optimized_path, replacements, _ in rewrites],
+                                     pool, max_workers)
+        stats = {"images": 0, "saved_bytes": 0}
+        optimized_paths = list(paths)
+        for (index, path, optimized_path, replacements, saved_bytes), result in zip(rewrites, results):
+            if not result.ok:
+                report_task_error(path, result.error, on_error)
+                continue
+            passwords.share(path, optimized_path)
+            optimized_paths[index] = optimized_path
+            stats["images"] += len(replacements)
+            stats["saved_bytes"] += saved_bytes
+        return optimized_paths, stats
+
+    @staticmethod
+    def replace_image(doc, xref, data, result, keep_colorspace):
+        """用重新编码的数据替换图像对象的流，并更新尺寸、滤镜和色彩空间"""
+        kind, components, width, height, converted = result
+        doc.update_stream(xref, data, compress=False)
+        doc.xref_set_key(xref, "Filter", "/DCTDecode" if kind == "jpeg" else "/FlateDecode")
+        # 解码数组、调色板等已在解码时应用
+        for key in ("DecodeParms", "Decode", "SMaskInData"):
+            doc.xref_set_key(xref, key, "null")
+        doc.xref_set_key(xref, "Width", str(width))
+        doc.xref_set_key(xref, "Height", str(height))
+        doc.xref_set_key(xref, "BitsPerComponent", "8")
+        if converted or not keep_colorspace:
+            doc.xref_set_key(xref, "ColorSpace", "/DeviceGray" if components == 1 else "/DeviceRGB")
+
+
+# ========== 页数范围 ==========
+
+class PageRangeError(ValueError):
+    """页数范围语法或取值错误"""
+
+    def __init__(self, message, line=None, term=None):
+        self.message = message
+        self.line = line
+        self.term = term
+        location = ""
+        if line is not None:
+            location += f"第{line}行"
+        if term is not None:
+            location += f" “{term}”"
+        super().__init__(f"{location.strip()}: {message}" if location else message)
+
+
+class PageSet:
+    """页码集合（0-based）
+
+    以 range 对象（等差区间）列表存储，不展开为页码列表；迭代时按升序
+    惰性合并各区间并跳过排除的页，大文档的宽范围也只占常数内存。
+    """
+
+    def __init__(self, ranges=(), excluded=()):
+        self.ranges = self._coalesce(r for r in ranges if len(r))
+        self.excluded = self._coalesce(r for r in excluded if len(r))
+
+    @staticmethod
+    def _coalesce(ranges):
+        """合并相邻或重叠的连续区间"""
+        result = []
+        for r in sorted(ranges, key=lambda r: (r.start, r.step)):
+            if r.step == 1 and result and result[-1].step == 1 and r.start <= result[-1].stop:
+                last = result[-1]
+                result[-1] = range(last.start, max(last.stop, r.stop))
+            else:
+                result.append(r)
+        return result
+
+    @classmethod
+    def from_pages(cls, pages):
+        """由页码序列构建"""
+        return cls(range(start, end + 1) for start, end in iter_page_runs(sorted(set(pages))))
+
+    def __iter__(self):
+        previous = None
+        for page_num in heapq.merge(*self.ranges):
+            if page_num != previous and not any(page_num in r for r in self.excluded):
+                yield page_num
+            previous = page_num
+
+    def __contains__(self, page_num):
+        return (any(page_num in r for r in self.ranges) and
+                not any(page_num in r for r in self.excluded))
+
+    def __bool__(self):
+        return next(iter(self), None) is not None
+
+    def __len__(self):
+        if not self.excluded and len(self.ranges) == 1:
+            return len(self.ranges[0])
+        return sum(1 for _ in self)
+
+    def __or__(self, other):
+        if self.excluded or other.excluded:
+            return PageSet.from_pages(heapq.merge(self, other))
+        return PageSet(self.ranges + other.ranges)
+
+    def __sub__(self, other):
+        if other.excluded:
+            return PageSet.from_pages(p for p in self if p not in other)
+        return PageSet(self.ranges, self.excluded + other.ranges)
+
+    def __eq__(self, other):
+        return isinstance(other, PageSet) and list(self) == list(other)
+
+    def __repr__(self):
+        return f"PageSet({self.ranges!r}, excluded={self.excluded!r})"
+
+    def clip(self, total_pages):
+        """截取到 [0, total_pages) 之内"""
+        clipped = []
+        for r in self.ranges:
+            start = r.start
+            if start < 0:
+                start += -(start // r.step) * r.step
+            clipped.append(range(start, min(r.stop, total_pages), r.step))
+        return PageSet(clipped, self.excluded)
+
+
+_PAGE_BOUND = r'(?:last|-?\d+)'
+_PAGE_TERM_RE = re.compile(
+    rf'^(?P<start>{_PAGE_BOUND})(?:\s*(?P<dash>-)\s*(?P<end>{_PAGE_BOUND})?)?'
+    r'(?:\s*:\s*(?P<step>\d+))?$',
+    re.IGNORECASE)
+_PAGE_TERM_SEPARATOR_RE = re.compile(r'[,，;；]')
+
+
+def _resolve_page_bound(bound, total_pages, line, term, clamp=False):
+    """把 1-based 页码、负数索引或 last 解析为 0-based 索引
+
+    clamp 为真时（范围的结束页）超出总页数的页码截到末页。
+    """
+    if bound.lower() == 'last':
+        return total_pages - 1
+
+    value = int(bound)
+    if value == 0:
+        raise PageRangeError("页码从1开始", line, term)
+    if value < 0:
+        if -value > total_pages:
+            raise PageRangeError(f"倒数第{-value}页超出总页数{total_pages}", line, term)
+        return total_pages + value
+    if value > total_pages:
+        if clamp:
+            return total_pages - 1
+        raise PageRangeError(f"页码{value}超出总页数{total_pages}，末页可写作“last”", line, term)
+    return value - 1
+
+
+def parse_page_term(term, total_pages, line=None):
+    """解析单个范围项，返回 range 对象（0-based）"""
+    keyword = term.lower()
+    if keyword in ('odd', '奇数'):
+        return range(0, total_pages, 2)
+    if keyword in ('even', '偶数'):
+        return range(1, total_pages, 2)
+
+    match = _PAGE_TERM_RE.match(term)
+    if not match:
+        raise PageRangeError("无法识别的范围格式", line, term)
+
+    start = _resolve_page_bound(match.group('start'), total_pages, line, term)
+    if match.group('dash'):
+        end = total_pages - 1 if match.group('end') is None else \
+            _resolve_page_bound(match.group('end'), total_pages, line, term, clamp=True)
+    else:
+        end = start
+
+    step = int(match.group('step') or 1)
+    if step == 0:
+        raise PageRangeError("步长必须大于0", line, term)
+    if not match.group('dash') and match.group('step'):
+        raise PageRangeError("单个页码不能指定步长", line, term)
+    if start > end:
+        raise PageRangeError("起始页大于结束页", line, term)
+
+    return range(start, end + 1, step)
+
+
+def parse_page_spec(text, total_pages, line=None):
+    """解析一行范围表达式为 PageSet
+
+    以逗号或分号分隔多个范围项，支持：
+    "5"、"1-10"、"50-"（到末页）、"1-100:2"（步长）、"odd"/"even"、
+    "last"、负数索引（"-1" 为末页）以及以 "!" 开头的排除项（"1-20, !5-7"）。
+    范围的结束页超出总页数时截到末页，只有起始页超出时才报错。
+    """
+    included = []
+    excluded = []
+    for raw_term in _PAGE_TERM_SEPARATOR_RE.split(text):
+        term = raw_term.strip()
+        if not term:
+            continue
+        if term.startswith('!'):
+            excluded.append(parse_page_term(term[1:].strip(), total_pages, line))
+        else:
+            included.append(parse_page_term(term, total_pages, line))
+
+    if not included:
+        if excluded:
+            # 只有排除项时，从全部页中排除
+            included.append(range(total_pages))
+        else:
+            raise PageRangeError("范围为空", line, text.strip())
+
+    page_set = PageSet(included, excluded)
+    if not page_set:
+        raise PageRangeError("排除后没有剩余页面", line, text.strip())
+    return page_set
+
+
+def format_page_numbers(pages):
+    """把1-based页码列表格式化为“2, 4-6”"""
+    return format_page_spec(page - 1 for page in pages)
+
+
+def format_page_spec(pages):
+    """把0-based页码序列格式化为范围表达式，如“1-5, 8, 10-12”"""
+    terms = []
+    for start, end in iter_page_runs(sorted(set(pages))):
+        terms.append(f"{start + 1}" if start == end else f"{start + 1}-{end + 1}")
+    return ", ".join(terms)
+
+
+PAGE_RANGES_HELP = ("每行一个输出文件，行内用逗号分隔多个范围，如：\n"
+                    "1-5, 8    50-（到末页）    1-100:2（步长）\n"
+                    "odd / even    last    -1（倒数第1页）    !3-4（排除）")
+
+
+def parse_page_ranges(text, total_pages):
+    """解析多行范围文本，每个非空行对应一个输出部分"""
+    ranges = []
+    for line_number, line in enumerate(text.splitlines(), start=1):
+        if line.strip():
+            ranges.append(parse_page_spec(line, total_pages, line_number))
+    return ranges
+
+
+def split_mode_from_options(options):
+    """把 every、range、outline、blank、max_size、pattern 选项（含义同命令行参数）转换为 (拆分模式, 参数)
+
+    range 为范围表达式字符串列表，拆分时按文件的总页数解析；blank 为墨迹占比（%），
+    可用 blank_max_std 指定灰度标准差上限；
+    pattern 为正则表达式，name_from_match 为真时用匹配内容命名各部分。
+    """
+    if options.get("every") is not None:
+        return 'page', int(options["every"])
+    if options.get("range"):
+        ranges = options["range"]
+        return 'range', [ranges] if isinstance(ranges, str) else list(ranges)
+    if options.get("outline") is not None:
+        return 'outline', int(options["outline"])
+    if options.get("blank") is not None:
+        return 'blank', blank_filter_from_options(options, "blank")
+    if options.get("max_size") is not None:
+        return 'size', int(float(options["max_size"]) * 1024 * 1024)
+    if options.get("pattern"):
+        compile_split_pattern(options["pattern"])
+        return 'text', (options["pattern"], bool(options.get("name_from_match")))
+    raise ValueError("拆分需要 every、range、outline、blank、max_size 或 pattern 之一")
+
+
+# ========== 输出写入 ==========
+
+DEFAULT_WRITER_THREADS = 2
+DEFAULT_INFLIGHT_BYTES = 64 * 1024 * 1024
+
+
+def break_hardlink(path):
+    """已有的输出与输出缓存共用数据（硬链接）时先删除这个名字，覆盖写入不会改动缓存"""
+    try:
+        if os.stat(path).st_nlink > 1:
+            os.remove(path)
+    except OSError:
+        pass
+
+
+def unshare_file(path):
+    """就地修改前把硬链接的文件换成独立的副本，修改不会影响共用数据的其他文件"""
+    if os.stat(path).st_nlink > 1:
+        temp_path = f"{path}.{os.getpid()}.tmp"
+        shutil.copy2(path, temp_path)
+        os.replace(temp_path, path)
+
+
+class PipelinedFileWriter:
+    """带在途字节预算的并行文件写入池
+
+    序列化线程把已生成的字节交给写入线程后立即继续处理下一部分，
+    CPU序列化与磁盘写入因此重叠进行。尚未落盘的字节总量不超过
+    max_inflight_bytes，超出时 submit 阻塞，直到有写入完成。
+    """
+
+    def __init__(self, max_workers=DEFAULT_WRITER_THREADS,
+                 max_inflight_bytes=DEFAULT_INFLIGHT_BYTES, transform=None):
+        self.max_inflight_bytes = max_inflight_bytes
+        self.transform = transform  # 写入前在写入线程中处理内容（如线性化），None 表示原样写入
+        self._executor = ThreadPoolExecutor(max_workers=max_workers,
+                                            thread_name_prefix="pdf-writer")
+        self._condition = threading.Condition()
+        self._inflight_bytes = 0
+        self._futures = []
+        self._error = None
+
+    def submit(self, output_path, data):
+        """提交一个待写入的文件，预算不足时等待"""
+        size = len(data)
+        with self._condition:
+            # 单个超出预算的部分也允许写入，但需等待其他写入全部完成
+            while (self._error is None and self._inflight_bytes and
+                   self._inflight_bytes + size > self.max_inflight_bytes):
+                self._condition.wait()
+            if self._error is not None:
+                raise self._error
+            self._inflight_bytes += size
+
+        self._futures.append(self._executor.submit(self._write, output_path, data))
+
+    def _write(self, output_path, data):
+        size = len(data)
+        try:
+            if self.transform is not None:
+                data = self.transform(data)
+            self.write_file(output_path, data)
+        except Exception as e:
+            with self._condition:
+                if self._error is None:
+                    self._error = e
+            raise
+        finally:
+            with self._condition:
+                self._inflight_bytes -= size
+                self._condition.notify_all()
+
+    def write_file(self, output_path, data):
+        break_hardlink(output_path)
+        with open(output_path, 'wb') as output_file:
+            output_file.write(data)
+
+    def close(self):
+        """等待所有写入完成，有写入失败时抛出第一个错误"""
+        self._executor.shutdown(wait=True)
+        for future in self._futures:
+            future.result()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        if exc_type is None:
+            self.close()
+        else:
+            self._executor.shutdown(wait=True)
+        return False
+
+
+ARCHIVE_FORMATS = ('zip', 'tar')
+
+
+class ArchivePartWriter(PipelinedFileWriter):
+    """把各部分依次写入同一个 ZIP 或 TAR 归档，不产生单独的文件
+
+    归档只能顺序追加，因此只用一个写入线程，成员按提交顺序写入；
+    序列化与写入照样重叠，在途字节预算与 PipelinedFileWriter 相同。
+    PDF 已经压缩过，ZIP 成员以 ZIP_STORED 原样存放：每个成员的偏移和大小
+    记录在中央目录（TAR 为各成员头）中，读取方可以直接定位单个部分。
+    出错时删除写了一半的归档。
+    """
+
+    def __init__(self, archive_path, archive_format, max_inflight_bytes=DEFAULT_INFLIGHT_BYTES,
+                 transform=None):
+        if archive_format not in ARCHIVE_FORMATS:
+            raise ValueError(f"不支持的归档格式: {archive_format}")
+        super().__init__(1, max_inflight_bytes, transform)
+        self.archive_path = archive_path
+        self.archive_format = archive_format
+        self.timestamp = time.time()
+        break_hardlink(archive_path)
+        if archive_format == 'zip':
+            self._archive = zipfile.ZipFile(archive_path, 'w', zipfile.ZIP_STORED, allowZip64=True)
+        else:
+            self._archive = tarfile.open(archive_path, 'w', format=tarfile.PAX_FORMAT)
+
+    def write_file(self, name, data):
+        if self.archive_format == 'zip':
+            info = zipfile.ZipInfo(name, time.localtime(self.timestamp)[:6])
+            info.compress_type = zipfile.ZIP_STORED
+            info.external_attr = 0o644 << 16
+            self._archive.writestr(info, data)
+        else:
+            info = tarfile.TarInfo(name)
+            info.size = len(data)
+            info.mtime = self.timestamp
+            info.mode = 0o644
+            self._archive.addfile(info, io.BytesIO(data))
+
+    def close(self):
+        try:
+            super().close()
+        finally:
+            self._archive.close()
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        failed = exc_type is not None
+        try:
+            super().__exit__(exc_type, exc_value, traceback)
+        except BaseException:
+            failed = True
+            raise
+        finally:
+            if failed:
+                self._archive.close()
+                try:
+                    os.remove(self.archive_path)
+                except OSError:
+                    pass
+        return False
+
+
+def list_archive_members(archive_path):
+    """读取归档中的成员文件名；ZIP 只需读中央目录"""
+    if zipfile.is_zipfile(archive_path):
+        with zipfile.ZipFile(archive_path) as archive:
+            return archive.namelist()
+    with tarfile.open(archive_path) as archive:
+        return archive.getnames()
+
+
+# ========== 线性化输出 ==========
+
+QPDF_EXECUTABLE = "qpdf"
+LINEARIZE_TIMEOUT = 600  # qpdf 处理单个文件的超时（秒）
+
+
+def linearize_backend():
+    """可用的线性化工具：'pikepdf'、'qpdf' 或 None；只检查是否安装，不导入
+
+    MuPDF 1.24 起不再支持线性化，需要 pikepdf 或 qpdf 命令行工具。
+    """
+    if importlib.util.find_spec("pikepdf") is not None:
+        return 'pikepdf'
+    if shutil.which(QPDF_EXECUTABLE):
+        return 'qpdf'
+    return None
+
+
+def require_linearize_backend():
+    backend = linearize_backend()
+    if backend is None:
+        raise RuntimeError("线性化输出需要安装 pikepdf（pip install pikepdf）或 qpdf 命令行工具")
+    return backend
+
+
+def linearize_file(input_path, output_path, backend=None):
+    """把 input_path 重写为线性化（快速网页浏览）的 output_path
+
+    线性化要求第一页用到的对象和提示表位于文件开头，只能在文件完整写出之后
+    进行：第一遍照常写出，第二遍从磁盘读取、重排并写出。两遍之间只经过磁盘
+    上的文件，内存中不会同时有两份文档。与原始流直通复制一样，流按原样复制，
+    不解压也不重新压缩，耗时接近复制一遍文件。
+    """
+    backend = backend or require_linearize_backend()
+    if backend == 'pikepdf':
+        import pikepdf
+        with pikepdf.open(input_path) as pdf:
+            pdf.save(output_path, linearize=True, compress_streams=False,
+                     stream_decode_level=pikepdf.StreamDecodeLevel.none)
+        return
+
+    completed = subprocess.run([QPDF_EXECUTABLE, "--linearize", "--stream-data=preserve",
+                                input_path, output_path],
+                               capture_output=True, timeout=LINEARIZE_TIMEOUT)
+    # qpdf 退出码 3 表示有警告，但输出已正常写出
+    if completed.returncode not in (0, 3):
+        message = completed.stderr.decode('utf-8', 'replace').strip()
+        raise RuntimeError(f"qpdf 线性化失败: {message}")
+
+
+def linearize_in_place(path):
+    """线性化已写出的文件，先写临时文件再替换"""
+    temp_path = f"{path}.{os.getpid()}.linear.tmp"
+    try:
+        linearize_file(path, temp_path)
+        os.replace(temp_path, path)
+    except BaseException:
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+        raise
+
+
+def linearize_bytes(data):
+    """线性化内存中的一个PDF（拆分出的单个部分），返回新的字节内容"""
+    backend = require_linearize_backend()
+    if backend == 'pikepdf':
+        import pikepdf
+        output = io.BytesIO()
+        with pikepdf.open(io.BytesIO(data)) as pdf:
+            pdf.save(output, linearize=True, compress_streams=False,
+                     stream_decode_level=pikepdf.StreamDecodeLevel.none)
+        return output.getvalue()
+
+    with tempfile.TemporaryDirectory(prefix="pdftools-linear-") as temp_dir:
+        input_path = os.path.join(temp_dir, "input.pdf")
+        output_path = os.path.join(temp_dir, "output.pdf")
+        with open(input_path, 'wb') as f:
+            f.write(data)
+        linearize_file(input_path, output_path, backend)
+        with open(output_path, 'rb') as f:
+            return f.read()
+
+
+# ========== 输入预读 ==========
+
+DEFAULT_READ_AHEAD = 4  # 同时预读的输入文件数
+DEFAULT_READ_AHEAD_BYTES = 256 * 1024 * 1024  # 预读窗口：已读入内存、尚未用完的字节上限
+
+
+class ReadAheadLoader:
+    """按使用顺序预读后续输入文件
+
+    读取线程把接下来 depth 个来源读入内存，并在同一线程中调用 parse(路径, 内容)
+    （PyPDF2 后端借此提前完成解析和解密），合并线程处理当前文件时，
+    网络存储上后续文件的读取与之重叠。已读入、尚未 release 的字节不超过
+    max_bytes，窗口满时暂停预读；大于 max_bytes 的文件不读入内存，get 返回
+    parse(路径, None)，由调用方直接从磁盘打开。depth 为 0 时不预读。
+    读取或解析中的异常在 get 时抛出。
+    """
+
+    def __init__(self, sources, parse=None, depth=DEFAULT_READ_AHEAD,
+                 max_bytes=DEFAULT_READ_AHEAD_BYTES):
+        self.sources = list(dict.fromkeys(sources))
+        self.parse = parse
+        self.depth = max(0, depth)
+        self.max_bytes = max_bytes
+        self._executor = ThreadPoolExecutor(max_workers=self.depth, thread_name_prefix="pdf-reader") \
+            if self.depth else None
+        self._futures = {}  # 来源 -> future
+        self._reserved = {}  # 来源 -> 占用的窗口字节
+        self._window_bytes = 0
+        self._next = 0
+        self._fill()
+
+    def _read(self, source, size):
+        data = None
+        if size <= self.max_bytes:
+            with open(source, 'rb') as f:
+                data = f.read()
+        return self.parse(source, data) if self.parse else data
+
+    def _submit(self, source):
+        try:
+            size = os.path.getsize(source)
+        except OSError:
+            size = 0  # 读取时再报告错误
+        reserved = size if size <= self.max_bytes else 0
+        if self._futures and self._window_bytes + reserved > self.max_bytes:
+            return False
+        self._reserved[source] = reserved
+        self._window_bytes += reserved
+        self._futures[source] = self._executor.submit(self._read, source, size)
+        return True
+
+    def _fill(self):
+        while self.depth and self._next < len(self.sources) and len(self._futures) < self.depth:
+            if not self._submit(self.sources[self._next]):
+                break
+            self._next += 1
+
+    def get(self, source):
+        """返回来源的预读结果；没有预读到的文件（窗口已满或不预读）返回 parse(路径, None)"""
+        future = self._futures.get(source)
+        if future is None:
+            if source in self.sources[self._next:]:
+                self._next = self.sources.index(source, self._next) + 1
+            self._fill()
+            return self.parse(source, None) if self.parse else None
+        try:
+            return future.result()
+        finally:
+            self._fill()
+
+    def release(self, source):
+        """来源用完后释放其窗口，继续预读后面的文件"""
+        self._futures.pop(source, None)
+        self._window_bytes -= self._reserved.pop(source, 0)
+        self._fill()
+
+    def close(self):
+        if self._executor is not None:
+            for future in self._futures.values():
+                future.cancel()
+            self._executor.shutdown(wait=True)
+        self._futures.clear()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+        return False
+
+
+# ========== 页面分析 ==========
+
+DEFAULT_BLANK_INK_RATIO = 0.002  # 深色像素占比低于此值视为空白页
+DEFAULT_BLANK_MAX_STD = 8.0  # 灰度标准差高于此值的页面有浅色内容，不视为空白
+BLANK_RENDER_ZOOM = 24 / 72  # 空白检测渲染分辨率 24 DPI
+BLANK_DARK_LEVEL = 200  # 灰度低于此值的像素计为“有墨迹”
+BLANK_INK_CONTRAST = 255 - BLANK_DARK_LEVEL  # 比纸张底色暗这么多的像素计为“有墨迹”
+BLANK_MARGIN_RATIO = 0.05  # 检测时忽略的页边（扫描黑边、装订孔）
+BLANK_PAGES_PER_TASK = 64
+
+
+def _dark_pixel_table(level=BLANK_DARK_LEVEL):
+    """灰度值到 0/1 的映射表，配合 bytes.translate 在C层统计深色像素"""
+    return bytes(1 if value < level else 0 for value in range(256))
+
+
+def classify_blank_images(images, ink_ratio=DEFAULT_BLANK_INK_RATIO, max_std=DEFAULT_BLANK_MAX_STD):
+    """按批判断一组灰度图像（二维 uint8 数组）是否空白，返回布尔列表
+
+    大小相同的图像叠成一个三维数组，一次算出每张的纸张底色（90% 分位）、
+    墨迹占比和灰度标准差：墨迹按比底色暗 BLANK_INK_CONTRAST 以上计，有底色
+    的纸张也能判断；标准差用来发现墨迹阈值以下的浅色内容。
+    """
+    flags = [False] * len(images)
+    by_shape = {}
+    for index, image in enumerate(images):
+        by_shape.setdefault(image.shape, []).append(index)
+
+    for indexes in by_shape.values():
+        # 保持 uint8 参与运算，分位数用 partition 取，避免整批转成浮点数
+        pixels = numpy.stack([images[index] for index in indexes]).reshape(len(indexes), -1)
+        kth = int(pixels.shape[1] * 0.9)
+        paper = numpy.partition(pixels, kth, axis=1)[:, kth].astype(numpy.int16)
+        ink = (pixels < (paper - BLANK_INK_CONTRAST)[:, None]).mean(axis=1)
+        blank = (ink <= ink_ratio) & (pixels.std(axis=1, dtype=numpy.float32) <= max_std)
+        for index, is_blank in zip(indexes, blank):
+            flags[index] = bool(is_blank)
+    return flags
+
+
+def _detect_blank_pages_worker(pdf_file, page_numbers, ink_ratio, max_std=DEFAULT_BLANK_MAX_STD,
+                               passwords=None):
+    """子进程中检测一批页面是否空白，返回空白页页码列表
+
+    先用内容流启发式快速判断：无内容流或有文本的页无需渲染；其余页面去掉
+    页边后以低分辨率灰度渲染，整批交给 classify_blank_images。没有安装
+    numpy 时逐页按固定灰度阈值统计深色像素占比，不检查标准差。
+    """
+    use_numpy = importlib.util.find_spec("numpy") is not None
+    table = None if use_numpy else _dark_pixel_table()
+    blank_pages = []
+    rendered_pages = []
+    images = []
+    doc = open_pdf_document(pdf_file, PasswordProvider.from_snapshot(passwords))
+    try:
+        for page_num in page_numbers:
+            page = doc[page_num]
+            if not any(doc.xref_stream(xref).strip() for xref in page.get_contents()):
+                blank_pages.append(page_num)
+                continue
+            if page.get_text("text").strip():
+                continue
+
+            rect = page.rect
+            margin_x, margin_y = rect.width * BLANK_MARGIN_RATIO, rect.height * BLANK_MARGIN_RATIO
+            pix = page.get_pixmap(matrix=fitz.Matrix(BLANK_RENDER_ZOOM, BLANK_RENDER_ZOOM),
+                                  colorspace=fitz.csGRAY, alpha=False,
+                                  clip=fitz.Rect(rect.x0 + margin_x, rect.y0 + margin_y,
+                                                 rect.x1 - margin_x, rect.y1 - margin_y))
+            if use_numpy:
+                samples = numpy.frombuffer(pix.samples, dtype=numpy.uint8)
+                images.append(samples.reshape(pix.height, pix.stride)[:, :pix.width])
+                rendered_pages.append(page_num)
+            elif pix.samples.translate(table).count(1) <= ink_ratio * pix.width * pix.height:
+                blank_pages.append(page_num)
+    finally:
+        doc.close()
+
+    if images:
+        blank_pages += [page_num for page_num, is_blank
+                        in zip(rendered_pages, classify_blank_images(images, ink_ratio, max_std)) if is_blank]
+    return sorted(blank_pages)
+
+
+def blank_filter_from_options(options, key):
+    """把墨迹占比选项 key（%，true 表示默认值）和 blank_max_std 转换为 BlankPageFilter，未给出时返回 None"""
+    value = options.get(key)
+    if value is None or value is False:
+        return None
+    ink_ratio = DEFAULT_BLANK_INK_RATIO if value is True else float(value) / 100
+    return BlankPageFilter(ink_ratio, float(options.get("blank_max_std", DEFAULT_BLANK_MAX_STD)))
+
+
+class BlankPageFilter:
+    """空白页判定阈值：墨迹占比不超过 ink_ratio 且灰度标准差不超过 max_std 的页面视为空白
+
+    既用于按空白分隔页拆分，也用于合并、拆分时去掉空白页（如双面扫描的空白背面）。
+    """
+
+    def __init__(self, ink_ratio=DEFAULT_BLANK_INK_RATIO, max_std=DEFAULT_BLANK_MAX_STD):
+        self.ink_ratio = ink_ratio
+        self.max_std = max_std
+
+    def to_dict(self):
+        return {"ink_ratio": self.ink_ratio, "max_std": self.max_std}
+
+    @classmethod
+    def from_dict(cls, data):
+        return cls(**data) if data else None
+
+    def detect(self, pages_by_file, passwords=None, max_workers=None, pool=None, on_error=None):
+        """在进程池中并行检测空白页
+
+        pages_by_file 为 {文件: 要检测的页码}，各文件的页面按批分给同一个进程池；
+        返回 {文件: 升序的空白页码}。passwords 为 PasswordProvider.snapshot() 的结果，
+        供子进程解密文件。给出 IsolatedTaskPool 时在受监督的子进程中检测，出错的一批
+        页面按非空白处理，并调用 on_error(文件, 错误信息)。
+        """
+        chunks = []
+        for pdf_file, page_numbers in pages_by_file.items():
+            page_numbers = sorted(set(page_numbers))
+            chunks += [(pdf_file, page_numbers[start:start + BLANK_PAGES_PER_TASK])
+                       for start in range(0, len(page_numbers), BLANK_PAGES_PER_TASK)]
+
+        blank_pages = {pdf_file: [] for pdf_file in pages_by_file}
+        results = run_analysis_tasks('blank_pages', [(pdf_file, page_numbers, self.ink_ratio, self.max_std, passwords)
+                                                     for pdf_file, page_numbers in chunks], pool, max_workers)
+        for (pdf_file, _), result in zip(chunks, results):
+            if result.ok:
+                blank_pages[pdf_file] += result.value
+            else:
+                report_task_error(pdf_file, result.error, on_error)
+        return {pdf_file: sorted(pages) for pdf_file, pages in blank_pages.items()}
+
+
+PAGE_HASH_RENDER_SIZE = 128  # 感知哈希的渲染边长（像素），页面缩放为正方形
+PAGE_HASH_DCT_SIZE = 16  # 取左上角 16×16 个低频 DCT 系数，哈希共 256 位
+PAGE_HASH_PAGES_PER_TASK = 64
+PAGE_HASH_CACHE_KEY = 'page_hash_v1'
+DEFAULT_DUPLICATE_DISTANCE = 32  # 感知哈希的汉明距离不超过此值的两页视为重复
+DUPLICATE_LSH_TABLES = 32  # 局部敏感哈希的表数
+DUPLICATE_LSH_BITS = 16  # 每张表从哈希中抽取的位数
+DUPLICATE_SMALL_BUCKET = 64  # 不超过此大小的桶错位配对比较，更大的桶分块两两比较
+DUPLICATE_BLOCK_BYTES = 16 * 1024 * 1024  # 大桶分块比较时异或结果占用的内存上限
+
+
+def require_numpy():
+    if importlib.util.find_spec("numpy") is None:
+        raise RuntimeError("检测重复页需要安装 numpy（pip install numpy）")
+
+
+def perceptual_hashes(images):
+    """一批 PAGE_HASH_RENDER_SIZE 见方的灰度图像的感知哈希，返回按位压缩的 uint8 数组（每行一页）
+
+    整批做二维 DCT，低频系数高于中位数（不计直流分量）的位记为 1。
+    """
+    size, count = PAGE_HASH_RENDER_SIZE, PAGE_HASH_DCT_SIZE
+    u = numpy.arange(count, dtype=numpy.float32)[:, None]
+    x = numpy.arange(size, dtype=numpy.float32)[None, :]
+    dct = numpy.cos(numpy.pi * (2 * x + 1) * u / (2 * size))
+    coefficients = (dct @ numpy.stack(images).astype(numpy.float32) @ dct.T).reshape(len(images), -1)
+    median = numpy.median(coefficients[:, 1:], axis=1)
+    return numpy.packbits(coefficients > median[:, None], axis=1)
+
+
+def page_text_key(text):
+    """空白归一化后的页面文本摘要，没有文本时为空字符串"""
+    text = " ".join(text.split())
+    return hashlib.blake2b(text.encode('utf-8'), digest_size=8).hexdigest() if text else ""
+
+
+def _page_fingerprint_worker(pdf_file, page_numbers, passwords=None):
+    """子进程中计算一批页面的指纹，返回 (是否需要密码, [[感知哈希, 文本摘要]])
+
+    页面缩放为 PAGE_HASH_RENDER_SIZE 见方的灰度图像后计算感知哈希（十六进制）；
+    渲染结果几乎没有明暗变化的页面（空白页）感知哈希为 None，不参与重复检测。
+    """
+    size = PAGE_HASH_RENDER_SIZE
+    text_keys = []
+    images = {}
+    doc = open_pdf_document(pdf_file, PasswordProvider.from_snapshot(passwords))
+    try:
+        for index, page_num in enumerate(page_numbers):
+            page = doc[page_num]
+            text_keys.append(page_text_key(page.get_text("text")))
+            rect = page.rect
+            pix = page.get_pixmap(matrix=fitz.Matrix(size / rect.width, size / rect.height),
+                                  colorspace=fitz.csGRAY, alpha=False)
+            if (pix.width, pix.height) != (size, size):
+                pix = fitz.Pixmap(pix, size, size, None)
+            image = numpy.frombuffer(pix.samples, dtype=numpy.uint8).reshape(pix.height, pix.stride)[:, :size]
+            if image.std() >= 1:
+                images[index] = image
+        needs_pass = bool(doc.needs_pass)
+    finally:
+        doc.close()
+
+    hashes = [None] * len(page_numbers)
+    if images:
+        for index, value in zip(images, perceptual_hashes(list(images.values()))):
+            hashes[index] = value.tobytes().hex()
+    return needs_pass, [[value, text_key] for value, text_key in zip(hashes, text_keys)]
+
+
+def compute_page_fingerprints(pages_by_file, cache=None, passwords=None, max_workers=None, pool=None,
+                              on_error=None):
+    """在进程池中并行计算页面指纹，返回 {文件: {页码: (感知哈希或None, 文本摘要)}}
+
+    给出 MetadataCache 时按文件内容哈希缓存各页的指纹，只计算缓存中还没有的页面；
+    需要密码才能打开的文件不缓存。给出 IsolatedTaskPool 时在受监督的子进程中计算，
+    出错的一批页面没有指纹，并调用 on_error(文件, 错误信息)。
+    """
+    fingerprints = {}
+    digests = {}
+    chunks = []
+    for pdf_file, page_numbers in pages_by_file.items():
+        digest = cache.file_hash(pdf_file) if cache is not None else None
+        stored = cache.load_blob(digest, PAGE_HASH_CACHE_KEY) if digest else None
+        known = {int(page_num): tuple(value) for page_num, value in stored.items()} \
+            if isinstance(stored, dict) else {}
+        fingerprints[pdf_file] = known
+        digests[pdf_file] = digest
+        missing = sorted(set(page_numbers) - known.keys())
+        chunks += [(pdf_file, missing[start:start + PAGE_HASH_PAGES_PER_TASK])
+                   for start in range(0, len(missing), PAGE_HASH_PAGES_PER_TASK)]
+
+    results = run_analysis_tasks('page_fingerprints', [(pdf_file, page_numbers, passwords)
+                                                       for pdf_file, page_numbers in chunks], pool, max_workers)
+
+    computed, locked = set(), set()
+    for (pdf_file, page_numbers), result in zip(chunks, results):
+        if not result.ok:
+            # 缺页的指纹不写入缓存，下次重新计算
+            report_task_error(pdf_file, result.error, on_error)
+            locked.add(pdf_file)
+            continue
+        needs_pass, values = result.value
+        fingerprints[pdf_file].update(zip(page_numbers, map(tuple, values)))
+        (locked if needs_pass else computed).add(pdf_file)
+    for pdf_file in computed - locked:
+        if digests[pdf_file]:
+            cache.save_blob(digests[pdf_file], PAGE_HASH_CACHE_KEY,
+                            {str(page_num): list(value) for page_num, value in fingerprints[pdf_file].items()})
+    return fingerprints
+
+
+def find_near_duplicates(hashes, groups, max_distance=DEFAULT_DUPLICATE_DISTANCE):
+    """找出与更早的某一页近似重复的页面
+
+    hashes 为按顺序排列、按位压缩的感知哈希（每行一页的 uint8 数组），groups 为各页的
+    分组编号，只比较同一组内的页面。哈希完全相同的页面先用 numpy.unique 归并；其余
+    页面用按位抽样的局部敏感哈希分桶找出候选对，再对压缩的哈希做异或、按字节查表
+    统计汉明距离，每次比较一整批候选对。返回各页所重复的最早一页的下标，不重复的为 -1。
+    """
+    count = len(hashes)
+    duplicate_of = numpy.full(count, -1, dtype=numpy.int64)
+    if count < 2:
+        return duplicate_of
+
+    rows = numpy.column_stack([groups.astype(numpy.int64).view(numpy.uint8).reshape(count, -1), hashes])
+    _, first, inverse = numpy.unique(rows, axis=0, return_index=True, return_inverse=True)
+    earliest = first[inverse.reshape(-1)]
+    exact = earliest != numpy.arange(count)
+    duplicate_of[exact] = earliest[exact]
+
+    distinct = numpy.sort(first)
+    if max_distance > 0 and len(distinct) > 1:
+        nearest = _near_duplicate_candidates(hashes[distinct], groups[distinct], max_distance)
+        found = nearest >= 0
+        duplicate_of[distinct[found]] = distinct[nearest[found]]
+
+    # 所重复的页面本身也是重复页时，改为指向最早的那一页
+    while True:
+        flagged = numpy.flatnonzero(duplicate_of >= 0)
+        parent = duplicate_of[duplicate_of[flagged]]
+        chained = parent >= 0
+        if not chained.any():
+            return duplicate_of
+        duplicate_of[flagged[chained]] = parent[chained]
+
+
+def _near_duplicate_candidates(hashes, groups, max_distance):
+    """find_near_duplicates 的局部敏感哈希部分：hashes 各不相同，返回各页最早的近似页下标或 -1"""
+    count = len(hashes)
+    popcount = numpy.array([bin(value).count("1") for value in range(256)], dtype=numpy.uint8)
+    best = numpy.full(count, count, dtype=numpy.int64)
+    bits = numpy.unpackbits(hashes, axis=1)
+    rng = numpy.random.default_rng(0)  # 固定抽样，同样的输入总得到同样的结果
+    weights = 1 << numpy.arange(DUPLICATE_LSH_BITS, dtype=numpy.int64)
+
+    def compare(earlier, later):
+        distance = popcount[hashes[earlier] ^ hashes[later]].sum(axis=1, dtype=numpy.uint16)
+        close = distance <= max_distance
+        numpy.minimum.at(best, later[close], earlier[close])
+
+    for _ in range(DUPLICATE_LSH_TABLES):
+        sample = rng.choice(bits.shape[1], DUPLICATE_LSH_BITS, replace=False)
+        keys = bits[:, sample].astype(numpy.int64) @ weights
+        keys |= groups << DUPLICATE_LSH_BITS
+        # 稳定排序：同一个桶内的页面保持原来的先后顺序
+        order = numpy.argsort(keys, kind='stable')
+        sorted_keys = keys[order]
+        starts = numpy.flatnonzero(numpy.diff(sorted_keys, prepend=-1))
+        sizes = numpy.diff(starts, append=count)
+        bucket_sizes = numpy.repeat(sizes, sizes)
+
+        small = bucket_sizes <= DUPLICATE_SMALL_BUCKET
+        for offset in range(1, min(int(sizes.max()), DUPLICATE_SMALL_BUCKET)):
+            same = (sorted_keys[:-offset] == sorted_keys[offset:]) & small[:-offset]
+            if not same.any():
+                break
+            compare(order[:-offset][same], order[offset:][same])
+
+        for start, size in zip(starts[sizes > DUPLICATE_SMALL_BUCKET], sizes[sizes > DUPLICATE_SMALL_BUCKET]):
+            members = order[start:start + size]
+            step = max(1, DUPLICATE_BLOCK_BYTES // (size * hashes.shape[1]))
+            for row_start in range(1, size, step):
+                rows = members[row_start:row_start + step]
+                distance = popcount[hashes[rows][:, None, :] ^ hashes[members][None, :, :]].sum(
+                    axis=2, dtype=numpy.uint16)
+                close = (distance <= max_distance) & (members[None, :] < rows[:, None])
+                found = close.any(axis=1)
+                first_close = members[close.argmax(axis=1)]
+                best[rows[found]] = numpy.minimum(best[rows[found]], first_close[found])
+
+    return numpy.where(best < count, best, -1)
+
+
+def duplicate_finder_from_options(options):
+    """把 find_duplicates（汉明距离，true 表示默认值）和 remove_duplicates 转换为 DuplicatePageFinder"""
+    value = options.get("find_duplicates")
+    remove = bool(options.get("remove_duplicates"))
+    if (value is None or value is False) and not remove:
+        return None
+    distance = DEFAULT_DUPLICATE_DISTANCE if value is None or isinstance(value, bool) else int(value)
+    return DuplicatePageFinder(distance, remove)
+
+
+class DuplicatePageFinder:
+    """近似重复页检测：感知哈希的汉明距离不超过 max_distance 的页面视为重复
+
+    用于合并重新扫描或转发多次的材料。两页都有文本时还要求文本相同，版式相同、
+    文字不同的页面不会被当作重复；扫描页没有文本，只比较感知哈希。先出现的一页
+    保留，后面的重复页 remove 为真时不输出，否则只在合并报告中列出。需要安装 numpy。
+    """
+
+    def __init__(self, max_distance=DEFAULT_DUPLICATE_DISTANCE, remove=False):
+        if not 0 <= max_distance < PAGE_HASH_DCT_SIZE * PAGE_HASH_DCT_SIZE:
+            raise ValueError(f"重复页的汉明距离应在 0-{PAGE_HASH_DCT_SIZE * PAGE_HASH_DCT_SIZE - 1} 之间")
+        self.max_distance = max_distance
+        self.remove = remove
+
+    def to_dict(self):
+        return {"max_distance": self.max_distance, "remove": self.remove}
+
+    @classmethod
+    def from_dict(cls, data):
+        return cls(**data) if data else None
+
+    def find(self, pages, cache=None, passwords=None, max_workers=None, pool=None, on_error=None):
+        """pages 为按合并顺序排列的 [(文件, 页码)]，返回 {重复页的下标: 它所重复的最早一页的下标}
+
+        pool、on_error 见 compute_page_fingerprints；没有指纹的页面不参与比较。
+        """
+        require_numpy()
+        pages_by_file = {}
+        for pdf_file, page_num in pages:
+            pages_by_file.setdefault(pdf_file, set()).add(page_num)
+        fingerprints = compute_page_fingerprints(pages_by_file, cache, passwords, max_workers, pool, on_error)
+
+        positions, hashes, groups = [], [], []
+        text_groups = {}
+        for position, (pdf_file, page_num) in enumerate(pages):
+            value, text_key = fingerprints[pdf_file].get(page_num, (None, None))
+            if value is None:
+                continue
+            positions.append(position)
+            hashes.append(bytes.fromhex(value))
+            groups.append(text_groups.setdefault(text_key, len(text_groups)))
+        if not positions:
+            return {}
+
+        duplicate_of = find_near_duplicates(
+            numpy.frombuffer(b"".join(hashes), dtype=numpy.uint8).reshape(len(hashes), -1),
+            numpy.array(groups, dtype=numpy.int64), self.max_distance)
+        return {positions[index]: positions[original]
+                for index, original in enumerate(duplicate_of.tolist()) if original >= 0}
+
+
+TEXT_PAGES_PER_TASK = 32
+PAGE_TEXT_CACHE_KEY = 'page_text_v1'
+
+
+def _extract_page_text_worker(pdf_file, page_numbers, passwords=None):
+    """子进程中提取一批页面的文本，返回 (是否需要密码, [文本])"""
+    doc = open_pdf_document(pdf_file, PasswordProvider.from_snapshot(passwords))
+    try:
+        return bool(doc.needs_pass), [doc[page_num].get_text("text") for page_num in page_numbers]
+    finally:
+        doc.close()
+
+
+def extract_page_texts(pdf_file, total_pages, cache=None, max_workers=None, passwords=None):
+    """在进程池中并行提取每页文本，返回按页序的文本列表
+
+    给出 MetadataCache 时按文件内容哈希缓存结果，同一文件换一个规则重新拆分时
+    不必再次提取。需要密码才能打开的文件不缓存，避免明文内容落盘。
+    """
+    digest = cache.file_hash(pdf_file) if cache is not None else None
+    if digest:
+        texts = cache.load_blob(digest, PAGE_TEXT_CACHE_KEY)
+        if isinstance(texts, list) and len(texts) == total_pages:
+            return texts
+
+    chunks = [range(start, min(start + TEXT_PAGES_PER_TASK, total_pages))
+              for start in range(0, total_pages, TEXT_PAGES_PER_TASK)]
+    if len(chunks) <= 1 or not can_use_process_pool():
+        results = [_extract_page_text_worker(pdf_file, chunk, passwords) for chunk in chunks]
+    else:
+        with ProcessPoolExecutor(max_workers=max_workers) as executor:
+            results = list(executor.map(_extract_page_text_worker, [pdf_file] * len(chunks), chunks,
+                                        [passwords] * len(chunks)))
+
+    texts = [text for _, chunk_texts in results for text in chunk_texts]
+    if digest and not any(needs_pass for needs_pass, _ in results):
+        cache.save_blob(digest, PAGE_TEXT_CACHE_KEY, texts)
+    return texts
+
+
+def compile_split_pattern(pattern):
+    """编译文本拆分规则，^ 和 $ 匹配每一行的首尾"""
+    try:
+        return re.compile(pattern, re.MULTILINE)
+    except re.error as e:
+        raise ValueError(f"正则表达式错误: {e}")
+
+
+def text_boundaries(texts, pattern, name_from_match=False):
+    """在文本匹配正则表达式的页面处开始新的部分，返回 [(起始页, 标签或None), ...]
+
+    name_from_match 时标签取第一个捕获组（没有捕获组时取整个匹配）。
+    """
+    regex = compile_split_pattern(pattern) if isinstance(pattern, str) else pattern
+    boundaries = []
+    for page_num, text in enumerate(texts):
+        match = regex.search(text)
+        if match:
+            label = None
+            if name_from_match:
+                label = (match.group(1) if regex.groups else match.group(0)) or None
+            boundaries.append((page_num, label))
+    return boundaries
+
+
+def parts_from_boundaries(boundaries, total_pages):
+    """把各部分的起始页 [(页码, 标签), ...] 转换为 [(页码集合, 标签), ...]
+
+    第一个起始页之前的页面单独成为第一部分。
+    """
+    boundaries = list(boundaries)
+    if boundaries[0][0] > 0:
+        boundaries.insert(0, (0, None))
+    ends = [page for page, _ in boundaries[1:]] + [total_pages]
+    return [(PageSet([range(start, end)]), label)
+            for (start, label), end in zip(boundaries, ends)]
+
+
+def outline_boundaries(doc, level):
+    """返回书签层级不深于 level 的条目所在页 [(page_index, title), ...]"""
+    boundaries = {}
+    for entry_level, title, page in doc.get_toc(simple=True):
+        if entry_level <= level and page >= 1 and page - 1 not in boundaries:
+            boundaries[page - 1] = title
+    return sorted(boundaries.items())
+
+
+class PageSizeEstimator:
+    """按对象统计页面写出后的大小
+
+    每页沿间接引用收集它用到的对象（不追溯 /Parent 等回指和链接的目标，
+    也不进入其他页面），对象大小取其字典长度加原始流长度。同一部分内共享的
+    字体、图像只计一次，因此可以逐页累加，无需试写文件。
+    """
+
+    OBJECT_OVERHEAD = 40  # "n 0 obj ... endobj" 与交叉引用表条目
+    FILE_OVERHEAD = 1024  # 文件头、目录、页面树和尾部
+    _REFERENCE_RE = re.compile(r'(\d+) 0 R')
+    # 回指父节点、所在页面的引用，以及链接、书签指向的目标页
+    _BACK_REFERENCE_RE = re.compile(r'/(?:Parent|P)\s*\d+ 0 R|/(?:Dest|D)\s*(?:\[[^\]]*\]|\d+ 0 R)')
+
+    def __init__(self, doc):
+        self.doc = doc
+        self._object_sizes = {}
+        self._object_refs = {}
+        self._page_nodes = {}
+
+    def object_size(self, xref):
+        if xref not in self._object_sizes:
+            size = len(self.doc.xref_object(xref, compressed=True)) + self.OBJECT_OVERHEAD
+            if self.doc.xref_is_stream(xref):
+                size += self._stream_length(xref)
+            self._object_sizes[xref] = size
+        return self._object_sizes[xref]
+
+    def _stream_length(self, xref):
+        kind, value = self.doc.xref_get_key(xref, "Length")
+        if kind == 'int':
+            return int(value)
+        if kind == 'xref':
+            return int(self.doc.xref_object(int(value.split()[0])).strip() or 0)
+        return len(self.doc.xref_stream_raw(xref) or b"")
+
+    def _references(self, xref):
+        if xref not in self._object_refs:
+            source = self._BACK_REFERENCE_RE.sub('', self.doc.xref_object(xref, compressed=True))
+            self._object_refs[xref] = [int(ref) for ref in self._REFERENCE_RE.findall(source)]
+        return self._object_refs[xref]
+
+    def _is_page_node(self, xref):
+        if xref not in self._page_nodes:
+            self._page_nodes[xref] = self.doc.xref_get_key(xref, "Type")[1] in ("/Page", "/Pages")
+        return self._page_nodes[xref]
+
+    def page_objects(self, page_num):
+        """页面对象及其引用的全部对象的 xref 集合"""
+        page_xref = self.doc.page_xref(page_num)
+        pending = [page_xref]
+        seen = set()
+        while pending:
+            xref = pending.pop()
+            if xref in seen or (xref != page_xref and self._is_page_node(xref)):
+                continue
+            seen.add(xref)
+            pending.extend(ref for ref in self._references(xref) if ref not in seen)
+        return seen
+
+
+def plan_size_bounded_parts(doc, max_bytes):
+    """按估算大小切分，返回各部分的页面区间；单页超限时独占一个部分"""
+    estimator = PageSizeEstimator(doc)
+    parts = []
+    start = 0
+    part_objects = set()
+    part_size = PageSizeEstimator.FILE_OVERHEAD
+
+    for page_num in range(doc.page_count):
+        new_objects = estimator.page_objects(page_num) - part_objects
+        added_size = sum(estimator.object_size(xref) for xref in new_objects)
+
+        if page_num > start and part_size + added_size > max_bytes:
+            parts.append(range(start, page_num))
+            start = page_num
+            new_objects = estimator.page_objects(page_num)
+            part_objects = set()
+            part_size = PageSizeEstimator.FILE_OVERHEAD
+            added_size = sum(estimator.object_size(xref) for xref in new_objects)
+
+        part_objects |= new_objects
+        part_size += added_size
+
+    if start < doc.page_count:
+        parts.append(range(start, doc.page_count))
+    return parts
+
+
+def sanitize_filename(name, max_length=80):
+    """去掉文件名中的非法字符"""
+    name = re.sub(r'[\\/:*?"<>|\r\n\t]+', '_', name).strip(' ._')
+    return name[:max_length]
+
+
+# ========== 合并方案 ==========
+
+class MergePlanItem:
+    """合并方案中的一项：来源文件、页面范围和旋转角度"""
+
+    def __init__(self, source, pages=None, rotate=0, title=None):
+        if rotate % 90:
+            raise ValueError(f"{os.path.basename(source)}: 旋转角度必须是90的倍数")
+        self.source = source
+        self.pages = pages.strip() if pages else None  # 范围表达式，None 表示全部页面
+        self.rotate = rotate % 360
+        self.title = title
+
+    @property
+    def label(self):
+        """书签标题：指定的 title 或不含扩展名的文件名"""
+        return self.title or os.path.splitext(os.path.basename(self.source))[0]
+
+    def page_set(self, total_pages):
+        if not self.pages:
+            return PageSet([range(total_pages)])
+        try:
+            return parse_page_spec(self.pages, total_pages)
+        except PageRangeError as e:
+            raise PageRangeError(f"{os.path.basename(self.source)}: {e}") from e
+
+    def to_dict(self):
+        data = {"source": self.source}
+        if self.pages:
+            data["pages"] = self.pages
+        if self.rotate:
+            data["rotate"] = self.rotate
+        if self.title:
+            data["title"] = self.title
+        return data
+
+
+class MergePlan:
+    """页面级合并方案
+
+    JSON 格式：
+    {"items": [{"source": "a.pdf", "pages": "3-7", "rotate": 90},
+               {"source": "b.pdf"},
+               {"source": "c.pdf", "pages": "last", "title": "附件"}]}
+    同一来源可以出现多次；相对路径相对于方案文件所在目录。
+    """
+
+    def __init__(self, items):
+        self.items = list(items)
+
+    @classmethod
+    def from_files(cls, pdf_files):
+        return cls(MergePlanItem(pdf_file) for pdf_file in pdf_files)
+
+    @classmethod
+    def from_dict(cls, data, base_dir=None):
+        if not isinstance(data, dict) or not isinstance(data.get("items"), list):
+            raise ValueError("合并方案必须包含 items 列表")
+
+        items = []
+        for number, entry in enumerate(data["items"], start=1):
+            if isinstance(entry, str):
+                entry = {"source": entry}
+            if not isinstance(entry, dict) or not entry.get("source"):
+                raise ValueError(f"合并方案第{number}项缺少 source")
+            if not isinstance(entry["source"], str) or not isinstance(entry.get("pages") or "", str):
+                raise ValueError(f"合并方案第{number}项的 source 和 pages 应为字符串")
+            source = entry["source"]
+            if base_dir and not os.path.isabs(source):
+                source = os.path.join(base_dir, source)
+            items.append(MergePlanItem(source, entry.get("pages"),
+                                       int(entry.get("rotate", 0)), entry.get("title")))
+        if not items:
+            raise ValueError("合并方案为空")
+        return cls(items)
+
+    @classmethod
+    def load(cls, plan_path):
+        with open(plan_path, 'r', encoding='utf-8') as f:
+            return cls.from_dict(json.load(f), os.path.dirname(os.path.abspath(plan_path)))
+
+    def to_dict(self):
+        return {"items": [item.to_dict() for item in self.items]}
+
+    def save(self, plan_path):
+        with open(plan_path, 'w', encoding='utf-8') as f:
+            json.dump(self.to_dict(), f, ensure_ascii=False, indent=2)
+
+    @property
+    def sources(self):
+        """按首次出现顺序去重的来源文件"""
+        return list(dict.fromkeys(item.source for item in self.items))
+
+
+# ========== 元数据缓存 ==========
+
+METADATA_CACHE_VERSION = 1
+HASH_CHUNK_SIZE = 1024 * 1024
+DEFAULT_METADATA_CACHE_BYTES = 1024 * 1024 * 1024  # 单独存放的结果和修复副本的总大小上限
+METADATA_PROTECT_SECONDS = 300  # 最近用过的结果和副本可能正被作业使用，淘汰时跳过
+METADATA_BLOB_NAMES = (PAGE_TEXT_CACHE_KEY, PAGE_HASH_CACHE_KEY)  # save_blob 使用的子目录
+REPAIRED_DIR = "repaired"
+
+
+def default_cache_dir():
+    """图形界面和命令行共用的缓存目录"""
+    base = QStandardPaths.writableLocation(QStandardPaths.GenericCacheLocation) or tempfile.gettempdir()
+    return os.path.join(base, "PDFTools")
+
+
+def hash_file(path):
+    """文件内容的 SHA-256 摘要（十六进制）"""
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(HASH_CHUNK_SIZE), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+class MetadataCache:
+    """按文件内容哈希保存分析结果的JSON缓存
+
+    每个内容哈希下可保存多项结果（检查结果、修复副本等）。同时记录路径、
+    大小和修改时间到哈希的映射，未改动的文件不必重新读取计算哈希。
+    较大的结果（页面文本、页面指纹）和修复副本单独存放，总大小超过上限时
+    按最近使用时间淘汰，淘汰的结果下次重新计算。
+    """
+
+    def __init__(self, cache_dir=None, max_bytes=None):
+        self.cache_dir = cache_dir or default_cache_dir()
+        self.path = os.path.join(self.cache_dir, f"metadata_v{METADATA_CACHE_VERSION}.json")
+        self.settings_path = os.path.join(self.cache_dir, "metadata_settings.json")
+        self._lock = threading.Lock()
+        self._hashes = {}  # 绝对路径 -> [大小, 修改时间ns, 哈希]
+        self._entries = {}  # 哈希 -> {名称: 结果}
+        self._dirty = False
+        self._stored = False  # 保存过单独存放的结果或修复副本，save() 时按上限淘汰
+        self.max_bytes = max_bytes
+        if self.max_bytes is None:
+            self.max_bytes = OutputCache._load(self.settings_path).get("max_bytes", DEFAULT_METADATA_CACHE_BYTES)
+        try:
+            with open(self.path, encoding='utf-8') as f:
+                data = json.load(f)
+            self._hashes = dict(data["hashes"])
+            self._entries = dict(data["entries"])
+        except (OSError, ValueError, KeyError, TypeError):
+            pass
+
+    def file_hash(self, path):
+        path = os.path.abspath(path)
+        stat = os.stat(path)
+        with self._lock:
+            known = self._hashes.get(path)
+        if known and known[0] == stat.st_size and known[1] == stat.st_mtime_ns:
+            return known[2]
+
+        digest = hash_file(path)
+        with self._lock:
+            self._hashes[path] = [stat.st_size, stat.st_mtime_ns, digest]
+            self._dirty = True
+        return digest
+
+    def get(self, digest, name, default=None):
+        with self._lock:
+            return self._entries.get(digest, {}).get(name, default)
+
+    def put(self, digest, name, value):
+        with self._lock:
+            self._entries.setdefault(digest, {})[name] = value
+            self._dirty = True
+
+    def load_blob(self, digest, name):
+        """读取单独存放的较大结果（如页面文本），没有时返回 None"""
+        path = os.path.join(self.cache_dir, name, f"{digest}.json")
+        try:
+            with open(path, encoding='utf-8') as f:
+                value = json.load(f)
+        except (OSError, ValueError):
+            return None
+        self.touch(path)
+        return value
+
+    def save_blob(self, digest, name, value):
+        """较大的结果每个文件单独保存，不放进主缓存文件"""
+        directory = os.path.join(self.cache_dir, name)
+        temp_path = os.path.join(directory, f"{digest}.{os.getpid()}.tmp")
+        try:
+            os.makedirs(directory, exist_ok=True)
+            with open(temp_path, 'w', encoding='utf-8') as f:
+                json.dump(value, f, ensure_ascii=False)
+            os.replace(temp_path, os.path.join(directory, f"{digest}.json"))
+        except OSError:
+            pass
+        self._stored = True
+
+    def repaired_path(self, digest, filename):
+        """修复副本的位置：每个内容一个目录，副本保留原文件名（书签标题不变）"""
+        return os.path.join(self.cache_dir, REPAIRED_DIR, digest[:16], filename)
+
+    def mark_stored(self):
+        """记录新保存了修复副本等文件，save() 时一并按上限淘汰"""
+        self._stored = True
+
+    @staticmethod
+    def touch(path):
+        """修改时间即最近使用时间"""
+        try:
+            os.utime(path)
+        except OSError:
+            pass
+
+    def stored_entries(self):
+        """单独存放的结果和修复副本：[(文件或副本目录, 大小, 最近使用时间), ...]"""
+        result = []
+        for name in METADATA_BLOB_NAMES:
+            try:
+                files = list(os.scandir(os.path.join(self.cache_dir, name)))
+            except OSError:
+                continue
+            for entry in files:
+                try:
+                    if entry.name.endswith(".json"):
+                        stat = entry.stat()
+                        result.append((entry.path, stat.st_size, stat.st_mtime))
+                except OSError:
+                    continue
+        try:
+            directories = list(os.scandir(os.path.join(self.cache_dir, REPAIRED_DIR)))
+        except OSError:
+            directories = []
+        for directory in directories:
+            try:
+                stats = [entry.stat() for entry in os.scandir(directory.path)]
+            except OSError:
+                continue
+            if stats:
+                result.append((directory.path, sum(stat.st_size for stat in stats),
+                               max(stat.st_mtime for stat in stats)))
+        return result
+
+    def evict(self, max_bytes=None):
+        """单独存放的结果和修复副本总大小超过上限时删除最久未使用的，返回删除的个数
+
+        最近 METADATA_PROTECT_SECONDS 秒内用过的不删除，它们可能正被进行中的作业
+        使用；max_bytes 为 0（清空）时全部删除。
+        """
+        max_bytes = self.max_bytes if max_bytes is None else max_bytes
+        entries = sorted(self.stored_entries(), key=lambda entry: entry[2])
+        total = sum(size for _, size, _ in entries)
+        now = time.time()
+        removed = 0
+        for path, size, used in entries:
+            if total <= max_bytes:
+                break
+            if max_bytes and now - used < METADATA_PROTECT_SECONDS:
+                continue
+            if os.path.isdir(path):
+                shutil.rmtree(path, ignore_errors=True)
+            else:
+                try:
+                    os.remove(path)
+                except OSError:
+                    continue
+            total -= size
+            removed += 1
+        return removed
+
+    def clear(self):
+        """删除所有分析结果、修复副本和路径记录，返回删除的单独存放的结果和副本个数"""
+        removed = self.evict(max_bytes=0)
+        with self._lock:
+            self._hashes = {}
+            self._entries = {}
+            self._dirty = False
+        try:
+            os.remove(self.path)
+        except OSError:
+            pass
+        return removed
+
+    def set_limit(self, max_bytes):
+        """保存新的大小上限（之后的作业都使用它），并按新上限淘汰"""
+        self.max_bytes = max_bytes
+        temp_path = f"{self.settings_path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        try:
+            os.makedirs(self.cache_dir, exist_ok=True)
+            with open(temp_path, 'w', encoding='utf-8') as f:
+                json.dump({"max_bytes": max_bytes}, f)
+            os.replace(temp_path, self.settings_path)
+        except OSError:
+            pass
+        return self.evict()
+
+    def stats(self):
+        entries = self.stored_entries()
+        with self._lock:
+            documents = len(self._hashes)
+        return {"path": self.cache_dir, "documents": documents, "entries": len(entries),
+                "bytes": sum(size for _, size, _ in entries), "max_bytes": self.max_bytes}
+
+    def save(self):
+        """有改动时写回缓存文件，先写临时文件再替换；保存过较大的结果时按上限淘汰"""
+        if self._stored:
+            self._stored = False
+            self.evict()
+        with self._lock:
+            if not self._dirty:
+                return
+            data = json.dumps({"hashes": self._hashes, "entries": self._entries}, ensure_ascii=False)
+            self._dirty = False
+        temp_path = f"{self.path}.{os.getpid()}.tmp"
+        try:
+            os.makedirs(self.cache_dir, exist_ok=True)
+            with open(temp_path, 'w', encoding='utf-8') as f:
+                f.write(data)
+            os.replace(temp_path, self.path)
+        except OSError:
+            pass
+
+
+# ========== 本地暂存 ==========
+
+DEFAULT_STAGING_BYTES = 2 * 1024 * 1024 * 1024  # 本地副本总大小上限
+DEFAULT_STAGING_WORKERS = 4
+STAGING_PROTECT_SECONDS = 300  # 最近用过的副本可能正被读取，淘汰时跳过
+STAGING_INDEX_VERSION = 1
+REMOTE_FILESYSTEMS = frozenset((
+    'cifs', 'smb3', 'smbfs', 'nfs', 'nfs4', 'afs', 'ncpfs', '9p', 'davfs',
+    'fuse.sshfs', 'fuse.rclone', 'fuse.gvfsd-fuse'))
+DRIVE_REMOTE = 4  # GetDriveTypeW 的网络驱动器类型
+
+
+def _linux_mounts():
+    """读取挂载表，返回按挂载点长度降序排列的 [(挂载点, 文件系统类型), ...]"""
+    mounts = []
+    try:
+        with open('/proc/self/mounts', encoding='utf-8', errors='surrogateescape') as f:
+            for line in f:
+                fields = line.split()
+                if len(fields) >= 3:
+                    # 挂载点中的空格等字符以八进制转义
+                    mount_point = re.sub(r'\\([0-7]{3})', lambda m: chr(int(m.group(1), 8)), fields[1])
+                    mounts.append((mount_point, fields[2]))
+    except OSError:
+        pass
+    mounts.sort(key=lambda mount: len(mount[0]), reverse=True)
+    return mounts
+
+
+def is_remote_path(path):
+    """文件是否位于网络存储（SMB/NFS 等）上；无法判断时返回 False"""
+    path = os.path.realpath(path)
+    if sys.platform == 'win32':
+        if path.startswith('\\\\'):
+            return True
+        drive = os.path.splitdrive(path)[0]
+        return bool(drive) and ctypes.windll.kernel32.GetDriveTypeW(drive + '\\') == DRIVE_REMOTE
+    if sys.platform.startswith('linux'):
+        for mount_point, fs_type in _linux_mounts():
+            if path == mount_point or path.startswith(mount_point.rstrip('/') + '/'):
+                return fs_type in REMOTE_FILESYSTEMS
+    return False
+
+
+class StagingCache:
+    """网络存储上输入文件的本地副本
+
+    stage() 在后台线程池中并行把远程文件复制到本地，local_path() 返回可用的本地
+    副本，还没有副本时返回原路径。副本按 路径+大小+修改时间 标识，源文件改动后
+    旧副本不再使用；总大小超过 max_bytes 时按最近使用时间淘汰，放不下的文件
+    不复制。副本保留原文件名，书签标题和拆分输出的文件名不受影响。
+    remote_only 为假时所有文件都复制。
+    """
+
+    def __init__(self, cache_dir=None, max_bytes=DEFAULT_STAGING_BYTES,
+                 workers=DEFAULT_STAGING_WORKERS, remote_only=True):
+        self.cache_dir = os.path.join(cache_dir or default_cache_dir(), "staging")
+        self.index_path = os.path.join(self.cache_dir, f"index_v{STAGING_INDEX_VERSION}.json")
+        self.max_bytes = max_bytes
+        self.remote_only = remote_only
+        self._lock = threading.Lock()
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="pdf-staging")
+        self._pending = {}  # 键 -> 正在进行的复制
+        self._entries = {}  # 键 -> {"source", "size", "mtime_ns", "path", "used"}
+        self._dirty = False
+        try:
+            with open(self.index_path, encoding='utf-8') as f:
+                entries = json.load(f)["entries"]
+            self._entries = {key: entry for key, entry in entries.items() if os.path.isfile(entry["path"])}
+        except (OSError, ValueError, KeyError, TypeError):
+            pass
+
+    @staticmethod
+    def key(path, stat):
+        identity = f"{path}\0{stat.st_size}\0{stat.st_mtime_ns}"
+        return hashlib.sha256(identity.encode('utf-8', 'surrogateescape')).hexdigest()
+
+    @property
+    def pending_count(self):
+        with self._lock:
+            return len(self._pending)
+
+    def stage(self, paths):
+        """在后台复制需要暂存、还没有副本的文件"""
+        for path in paths:
+            path = os.path.abspath(path)
+            if self.remote_only and not is_remote_path(path):
+                continue
+            try:
+                stat = os.stat(path)
+            except OSError:
+                continue
+            if stat.st_size > self.max_bytes:
+                continue
+            key = self.key(path, stat)
+            with self._lock:
+                if key in self._entries or key in self._pending:
+                    continue
+                self._pending[key] = self._executor.submit(self._copy, path, stat, key)
+
+    def _copy(self, path, stat, key):
+        local_path = os.path.join(self.cache_dir, key[:16], os.path.basename(path))
+        temp_path = local_path + ".part"
+        try:
+            os.makedirs(os.path.dirname(local_path), exist_ok=True)
+            shutil.copyfile(path, temp_path)
+            after = os.stat(path)
+            if (after.st_size, after.st_mtime_ns) != (stat.st_size, stat.st_mtime_ns):
+                raise OSError(f"{path}: 复制期间文件被修改")
+            os.replace(temp_path, local_path)
+        except OSError:
+            try:
+                os.remove(temp_path)
+            except OSError:
+                pass
+            with self._lock:
+                del self._pending[key]
+            return None
+
+        with self._lock:
+            self._entries[key] = {"source": path, "size": stat.st_size, "mtime_ns": stat.st_mtime_ns,
+                                  "path": local_path, "used": time.time()}
+            del self._pending[key]
+            self._dirty = True
+        self.evict(key)
+        return local_path
+
+    def local_path(self, path, wait=False):
+        """文件的本地副本，没有副本或源文件已改动时返回原路径；wait 时等待进行中的复制"""
+        abspath = os.path.abspath(path)
+        try:
+            stat = os.stat(abspath)
+        except OSError:
+            return path
+        key = self.key(abspath, stat)
+        with self._lock:
+            future = self._pending.get(key)
+        if future is not None and wait:
+            try:
+                future.result()
+            except CancelledError:
+                pass  # 缓存已关闭，读取原文件
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return path
+            entry["used"] = time.time()
+            self._dirty = True
+            return entry["path"]
+
+    def local_paths(self, paths, wait=False):
+        return [self.local_path(path, wait) for path in paths]
+
+    def evict(self, new_key=None):
+        """总大小超过上限时删除最久未使用的副本
+
+        最近 STAGING_PROTECT_SECONDS 秒内用过的副本不删除；这样仍然超出上限时
+        放弃刚复制的 new_key，该文件继续从原路径读取。
+        """
+        now = time.time()
+        with self._lock:
+            total = sum(entry["size"] for entry in self._entries.values())
+            entries = sorted((item for item in self._entries.items()
+                              if now - item[1]["used"] >= STAGING_PROTECT_SECONDS),
+                             key=lambda item: item[1]["used"])
+            removed = []
+            while entries and total > self.max_bytes:
+                key, entry = entries.pop(0)
+                del self._entries[key]
+                total -= entry["size"]
+                removed.append(entry["path"])
+            if total > self.max_bytes and new_key in self._entries:
+                removed.append(self._entries.pop(new_key)["path"])
+            if removed:
+                self._dirty = True
+        for path in removed:
+            shutil.rmtree(os.path.dirname(path), ignore_errors=True)
+
+    def save(self):
+        """有改动时写回索引，先写临时文件再替换"""
+        with self._lock:
+            if not self._dirty:
+                return
+            data = json.dumps({"entries": self._entries}, ensure_ascii=False)
+            self._dirty = False
+        temp_path = f"{self.index_path}.{os.getpid()}.tmp"
+        try:
+            os.makedirs(self.cache_dir, exist_ok=True)
+            with open(temp_path, 'w', encoding='utf-8') as f:
+                f.write(data)
+            os.replace(temp_path, self.index_path)
+        except OSError:
+            pass
+
+    def close(self):
+        self._executor.shutdown(wait=True, cancel_futures=True)
+        self.save()
+
+
+# ========== 输出缓存 ==========
+
+DEFAULT_OUTPUT_CACHE_BYTES = 4 * 1024 * 1024 * 1024  # 输出缓存总大小上限
+OUTPUT_CACHE_VERSION = 1  # 输出的生成方式改变时递增，使旧结果失效
+OUTPUT_ENTRY_FILE = "entry.json"
+ENCRYPTED_CACHE_KEY = 'encrypted'
+
+
+def is_encrypted_pdf(pdf_file):
+    """文件是否加密；无法打开的文件按未加密处理"""
+    try:
+        with fitz.open(pdf_file) as doc:
+            return bool(doc.is_encrypted or doc.needs_pass)
+    except Exception:
+        return False
+
+
+def link_or_copy(source, target, link=True):
+    """把 source 放到 target：link 为真且能建硬链接时建硬链接，否则复制；先写临时名再替换"""
+    if os.path.exists(target) and os.path.samefile(source, target):
+        return
+    temp_path = f"{target}.{os.getpid()}.{threading.get_ident()}.tmp"
+    try:
+        try:
+            if not link:
+                raise OSError
+            os.link(source, temp_path)
+        except OSError:
+            # 不建硬链接、跨文件系统或不支持硬链接
+            shutil.copyfile(source, temp_path)
+        os.replace(temp_path, target)
+    except OSError:
+        try:
+            os.remove(temp_path)
+        except OSError:
+            pass
+        raise
+
+
+class OutputCache:
+    """按作业指纹保存合并、拆分的输出，输入和选项都相同的作业直接复用上次的结果
+
+    指纹由输入文件的内容哈希、合并方案或拆分规则、后端和影响输出的选项计算，
+    与文件路径和修改时间无关；内容哈希借用 MetadataCache，未改动的文件不必重新
+    读取。每个结果一个目录，保存和复用时默认复制，输出与缓存互不影响；设置
+    hardlink 后改为尽量建硬链接（省空间和时间，但就地修改一个输出会同时改动
+    缓存和其他复用了它的输出），不能建时复制。总大小超过上限时按最近使用时间淘汰。输入中有加密文件时不缓存，缓存目录中不留解密后的
+    内容。命中和未命中次数累计保存，供报告和 cache 命令显示。
+    """
+
+    def __init__(self, cache_dir=None, max_bytes=None, metadata=None, hardlink=None):
+        self.metadata = metadata or MetadataCache(cache_dir)
+        self.root = os.path.join(cache_dir or self.metadata.cache_dir, "outputs")
+        self.settings_path = os.path.join(self.root, "settings.json")
+        self.stats_path = os.path.join(self.root, "stats.json")
+        self._lock = threading.Lock()
+        settings = self._load(self.settings_path)
+        self.max_bytes = max_bytes or settings.get("max_bytes", DEFAULT_OUTPUT_CACHE_BYTES)
+        self.hardlink = bool(settings.get("hardlink", False)) if hardlink is None else hardlink
+
+    @staticmethod
+    def _load(path):
+        try:
+            with open(path, encoding='utf-8') as f:
+                data = json.load(f)
+            return data if isinstance(data, dict) else {}
+        except (OSError, ValueError):
+            return {}
+
+    def _dump(self, path, data):
+        temp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        try:
+            os.makedirs(self.root, exist_ok=True)
+            with open(temp_path, 'w', encoding='utf-8') as f:
+                json.dump(data, f, ensure_ascii=False)
+            os.replace(temp_path, path)
+        except OSError:
+            pass
+
+    def entry_dir(self, fingerprint):
+        return os.path.join(self.root, fingerprint)
+
+    def fingerprint(self, action, sources, spec):
+        """作业指纹；有输入无法读取或已加密时返回 None，该作业不缓存
+
+        spec 为可序列化为JSON的方案、规则和选项，输入文件在其中用 sources 的
+        下标表示。
+        """
+        digests = PreflightChecker(self.metadata).hashes(sources)
+        if None in digests:
+            return None
+        for source, digest in zip(sources, digests):
+            encrypted = self.metadata.get(digest, ENCRYPTED_CACHE_KEY)
+            if encrypted is None:
+                encrypted = is_encrypted_pdf(source)
+                self.metadata.put(digest, ENCRYPTED_CACHE_KEY, encrypted)
+            if encrypted:
+                self.metadata.save()
+                return None
+        self.metadata.save()
+        identity = json.dumps({"version": OUTPUT_CACHE_VERSION, "action": action,
+                               "inputs": digests, "spec": spec}, sort_keys=True, ensure_ascii=False)
+        return hashlib.sha256(identity.encode('utf-8')).hexdigest()
+
+    def lookup(self, fingerprint):
+        """命中时返回 {"files": [文件名, ...], "info": 附加信息}，否则返回 None
+
+        缓存中的文件大小或修改时间变了说明被改写过（hardlink 时与输出共用数据），丢弃该结果。
+        """
+        entry_dir = self.entry_dir(fingerprint)
+        entry = self._load(os.path.join(entry_dir, OUTPUT_ENTRY_FILE))
+        try:
+            for item in entry["files"]:
+                stat = os.stat(os.path.join(entry_dir, item["name"]))
+                if (stat.st_size, stat.st_mtime_ns) != (item["size"], item["mtime_ns"]):
+                    raise ValueError(item["name"])
+        except (OSError, ValueError, KeyError, TypeError):
+            if entry:
+                shutil.rmtree(entry_dir, ignore_errors=True)
+            return None
+        try:
+            os.utime(os.path.join(entry_dir, OUTPUT_ENTRY_FILE))  # 修改时间即最近使用时间
+        except OSError:
+            pass
+        return {"files": [item["name"] for item in entry["files"]], "info": entry.get("info")}
+
+    def restore(self, fingerprint, name, target):
+        """把缓存中的一个输出文件放到 target"""
+        link_or_copy(os.path.join(self.entry_dir(fingerprint), name), target, self.hardlink)
+
+    def store(self, fingerprint, paths, info=None):
+        """保存作业的输出文件；出错时放弃缓存，不影响作业本身"""
+        entry_dir = self.entry_dir(fingerprint)
+        if os.path.isdir(entry_dir):
+            return
+        temp_dir = f"{entry_dir}.{os.getpid()}.{threading.get_ident()}.tmp"
+        try:
+            os.makedirs(temp_dir)
+            files = []
+            for path in paths:
+                name = os.path.basename(path)
+                link_or_copy(path, os.path.join(temp_dir, name), self.hardlink)
+                stat = os.stat(os.path.join(temp_dir, name))
+                files.append({"name": name, "size": stat.st_size, "mtime_ns": stat.st_mtime_ns})
+            with open(os.path.join(temp_dir, OUTPUT_ENTRY_FILE), 'w', encoding='utf-8') as f:
+                json.dump({"files": files, "info": info}, f, ensure_ascii=False)
+            os.rename(temp_dir, entry_dir)
+        except OSError:
+            # 包括另一个进程同时保存了同一结果
+            shutil.rmtree(temp_dir, ignore_errors=True)
+            return
+        self.evict(fingerprint)
+
+    def entries(self):
+        """[(指纹, 大小, 最近使用时间), ...]"""
+        result = []
+        try:
+            names = os.listdir(self.root)
+        except OSError:
+            return result
+        for name in names:
+            entry_path = os.path.join(self.root, name, OUTPUT_ENTRY_FILE)
+            entry = self._load(entry_path)
+            try:
+                size = sum(item["size"] for item in entry["files"])
+                used = os.stat(entry_path).st_mtime
+            except (OSError, KeyError, TypeError):
+                continue
+            result.append((name, size, used))
+        return result
+
+    def evict(self, new_fingerprint=None, max_bytes=None):
+        """总大小超过上限时删除最久未使用的结果，返回删除的个数
+
+        复用出去的输出是硬链接或副本，删除缓存中的结果不影响它们。刚保存的
+        new_fingerprint 最后考虑，它本身超出上限时也不保留。
+        """
+        max_bytes = self.max_bytes if max_bytes is None else max_bytes
+        entries = sorted(self.entries(), key=lambda entry: (entry[0] == new_fingerprint, entry[2]))
+        total = sum(size for _, size, _ in entries)
+        removed = 0
+        while entries and total > max_bytes:
+            fingerprint, size, _ = entries.pop(0)
+            shutil.rmtree(self.entry_dir(fingerprint), ignore_errors=True)
+            total -= size
+            removed += 1
+        return removed
+
+    def clear(self):
+        """删除所有结果并清零命中统计"""
+        removed = self.evict(max_bytes=0)
+        self._dump(self.stats_path, {"hits": 0, "misses": 0})
+        return removed
+
+    def save_settings(self):
+        self._dump(self.settings_path, {"max_bytes": self.max_bytes, "hardlink": self.hardlink})
+
+    def set_limit(self, max_bytes):
+        """保存新的大小上限（之后的作业都使用它），并按新上限淘汰"""
+        self.max_bytes = max_bytes
+        self.save_settings()
+        return self.evict()
+
+    def set_hardlink(self, enabled):
+        """保存复用方式（之后的作业都使用它）：True 建硬链接，False 复制"""
+        self.hardlink = enabled
+        self.save_settings()
+
+    def record(self, hit):
+        """记录一次命中或未命中，返回写入作业报告的统计"""
+        with self._lock:
+            stats = self._load(self.stats_path)
+            hits = int(stats.get("hits", 0)) + bool(hit)
+            misses = int(stats.get("misses", 0)) + (not hit)
+            self._dump(self.stats_path, {"hits": hits, "misses": misses})
+        return {"result": "hit" if hit else "miss", "hits": hits, "misses": misses,
+                "hit_rate": round(hits / (hits + misses), 4)}
+
+    def stats(self):
+        entries = self.entries()
+        stats = self._load(self.stats_path)
+        hits, misses = int(stats.get("hits", 0)), int(stats.get("misses", 0))
+        return {"path": self.root, "entries": len(entries),
+                "bytes": sum(size for _, size, _ in entries), "max_bytes": self.max_bytes,
+                "hardlink": self.hardlink,
+                "hits": hits, "misses": misses,
+                "hit_rate": round(hits / (hits + misses), 4) if hits + misses else None}
+
+
+# ========== 输入检查 ==========
+
+PROBLEM_UNREADABLE = 'unreadable'
+PROBLEM_ENCRYPTED = 'encrypted'
+PROBLEM_EMPTY = 'empty'
+PROBLEM_TRUNCATED = 'truncated'
+PROBLEM_XREF = 'xref'
+PROBLEM_PYPDF2 = 'pypdf2'
+FATAL_PROBLEMS = (PROBLEM_UNREADABLE, PROBLEM_ENCRYPTED, PROBLEM_EMPTY)  # 无法修复，只能跳过
+
+PREFLIGHT_CACHE_KEY = 'preflight_v1'
+REPAIRED_CACHE_KEY = 'repaired'
+EOF_SEARCH_BYTES = 1024  # 在文件末尾多少字节内查找 %%EOF
+
+CHECK_OK = 'ok'
+CHECK_REPAIR = 'repair'
+CHECK_SKIPPED = 'skipped'
+
+
+def diagnose_pdf(pdf_file, passwords=None):
+    """检查一个文件，返回 {"pages": 页数, "problems": {问题代码: 说明}, "encrypted": 是否加密}
+
+    依次检查文件是否完整、能否打开、能否用 passwords 解密、有无页面、交叉
+    引用表是否损坏（MuPDF 打开时做过修复），以及 PyPDF2 能否解析。试出的
+    密码放在结果的 "password" 中，调用方写入缓存前应取出。
+
+    结果按内容缓存，只记录由文件内容决定的问题：内存不足等与环境有关的错误
+    直接抛出，作为失败的任务结果返回，不会写入缓存。
+    """
+    provider = PasswordProvider.from_snapshot(passwords)
+    problems = {}
+    pages = 0
+    encrypted = False
+
+    with open(pdf_file, 'rb') as f:
+        f.seek(0, os.SEEK_END)
+        f.seek(max(0, f.tell() - EOF_SEARCH_BYTES))
+        if b'%%EOF' not in f.read():
+            problems[PROBLEM_TRUNCATED] = "文件末尾缺少%%EOF，可能不完整"
+
+    try:
+        doc = fitz.open(pdf_file)
+    except fitz.FileDataError as e:
+        # 结果按内容缓存，说明中不带路径
+        detail = " ".join(str(e).replace(f"filename={pdf_file!r}", "").replace(repr(pdf_file), "").split())
+        detail = detail.strip(" .:")
+        problems[PROBLEM_UNREADABLE] = f"无法作为PDF打开: {detail}"
+        return {"pages": pages, "problems": problems, "encrypted": encrypted}
+
+    with doc:
+        encrypted = bool(doc.is_encrypted or doc.needs_pass)
+        if not provider.unlock_document(doc, pdf_file):
+            problems[PROBLEM_ENCRYPTED] = "已加密，密码未知"
+        elif doc.page_count == 0:
+            problems[PROBLEM_EMPTY] = "没有页面"
+        else:
+            pages = doc.page_count
+            if doc.is_repaired:
+                problems[PROBLEM_XREF] = "交叉引用表损坏"
+
+    if pages:
+        try:
+            with open(pdf_file, 'rb') as f:
+                len(open_pdf_reader(f, pdf_file, provider).pages)
+        except MemoryError:
+            raise
+        except Exception as e:
+            problems[PROBLEM_PYPDF2] = f"PyPDF2无法解析: {e}"
+
+    return {"pages": pages, "problems": problems, "encrypted": encrypted,
+            "password": provider.password_for(pdf_file) if encrypted else None}
+
+
+def repair_pdf(pdf_file, repaired_path, passwords=None):
+    """用MuPDF重写文件，重建交叉引用表；加密文件保持原有加密"""
+    os.makedirs(os.path.dirname(repaired_path), exist_ok=True)
+    with open_pdf_document(pdf_file, PasswordProvider.from_snapshot(passwords)) as doc:
+        doc.save(repaired_path, garbage=3, deflate=True, encryption=fitz.PDF_ENCRYPT_KEEP)
+    return repaired_path
+
+
+def preflight_verdict(diagnosis, backend):
+    """按合并后端判断检查结果，返回 (CHECK_*, 说明)"""
+    problems = diagnosis["problems"]
+    for code in FATAL_PROBLEMS:
+        if code in problems:
+            return CHECK_SKIPPED, problems[code]
+
+    relevant = [PROBLEM_TRUNCATED, PROBLEM_XREF]
+    if backend == BACKEND_PYPDF2:
+        relevant.append(PROBLEM_PYPDF2)
+    reasons = [problems[code] for code in relevant if code in problems]
+    if reasons:
+        return CHECK_REPAIR, "；".join(reasons)
+    return CHECK_OK, None
+
+
+class PreflightChecker:
+    """并行检查和修复输入文件，结果按内容哈希缓存
+
+    哈希在线程池中计算；缓存未命中的文件在进程池（隔离模式下为受监督的
+    子进程池）中检查，加密文件的候选密码也在那里并行尝试。修复后的副本
+    保存在缓存目录，同一内容只修复一次。
+    """
+
+    def __init__(self, cache=None, pool=None, max_workers=None, passwords=None):
+        self.cache = cache or MetadataCache()
+        self.pool = pool
+        self.max_workers = max_workers
+        self.passwords = passwords or PasswordProvider()
+
+    def hashes(self, paths):
+        """每个文件的内容哈希，无法读取的文件为 None"""
+        def safe_hash(path):
+            try:
+                return self.cache.file_hash(path)
+            except OSError:
+                return None
+
+        if not paths:
+            return []
+        with ThreadPoolExecutor(max_workers=min(8, len(paths))) as executor:
+            return list(executor.map(safe_hash, paths))
+
+    def check(self, paths, on_result=None):
+        """检查所有文件，返回诊断结果列表；on_result(索引, 诊断) 在每个文件有结果时调用"""
+        digests = self.hashes(paths)
+        diagnoses = [None] * len(paths)
+
+        def finish(index, diagnosis):
+            diagnoses[index] = diagnosis
+            if on_result is not None:
+                on_result(index, diagnosis)
+
+        misses = []
+        for index, digest in enumerate(digests):
+            cached = self.cache.get(digest, PREFLIGHT_CACHE_KEY) if digest else None
+            if digest is None:
+                finish(index, {"pages": 0, "problems": {PROBLEM_UNREADABLE: "无法读取文件"}})
+            elif cached is not None and not (cached.get("encrypted") and
+                                             self.passwords.password_for(paths[index]) is None):
+                finish(index, cached)
+            else:
+                # 加密文件的结果取决于本次会话的密码，钥匙串中没有它时重新检查
+                misses.append(index)
+
+        def on_task(task_index, result):
+            index = misses[task_index]
+            if result.ok:
+                diagnosis = result.value
+                password = diagnosis.pop("password", None)
+                if password is not None:
+                    self.passwords.remember(paths[index], password)
+                self.cache.put(digests[index], PREFLIGHT_CACHE_KEY, diagnosis)
+                finish(index, diagnosis)
+            else:
+                # 崩溃和超时可能是偶发的，不写入缓存
+                finish(index, {"pages": 0, "problems": {PROBLEM_UNREADABLE: result.error}})
+
+        run_task_batch('diagnose', [(paths[index], self.passwords.snapshot([paths[index]])) for index in misses],
+                       self.pool, on_task, self.max_workers)
+        self.cache.save()
+        return diagnoses
+
+    def repair(self, paths):
+        """修复文件，返回 [(修复副本路径或None, 错误信息或None), ...]"""
+        digests = self.hashes(paths)
+        results = [(None, "无法读取文件")] * len(paths)
+        tasks = []
+        for index, (path, digest) in enumerate(zip(paths, digests)):
+            if digest is None:
+                continue
+            repaired_path = self.cache.get(digest, REPAIRED_CACHE_KEY)
+            if repaired_path and os.path.exists(repaired_path):
+                self.cache.touch(repaired_path)
+                results[index] = (repaired_path, None)
+            else:
+                tasks.append((index, self.cache.repaired_path(digest, os.path.basename(path))))
+
+        def on_task(task_index, result):
+            index, repaired_path = tasks[task_index]
+            if result.ok:
+                self.cache.put(digests[index], REPAIRED_CACHE_KEY, repaired_path)
+                self.cache.mark_stored()
+                results[index] = (repaired_path, None)
+            else:
+                results[index] = (None, result.error)
+
+        run_task_batch('repair', [(paths[index], repaired_path, self.passwords.snapshot([paths[index]]))
+                                  for index, repaired_path in tasks],
+                       self.pool, on_task, self.max_workers)
+        self.cache.save()
+
+        # 修复副本保持原有加密，使用原文件的密码
+        for path, (repaired_path, _) in zip(paths, results):
+            if repaired_path is not None:
+                self.passwords.share(path, repaired_path)
+        return results
+
+
+class MergeReport:
+    """合并结果报告：已合并、已修复和被跳过的文件及原因"""
+
+    def __init__(self, output_path=None):
+        self.output_path = output_path
+        self.total_pages = 0
+        self.merged = []  # 按合并顺序的原始路径
+        self.repaired = []  # [(路径, 原因)]
+        self.skipped = []  # [(路径, 原因)]
+        self.warnings = []  # [(路径, 说明)]，文件已合并
+        self.blank_pages = []  # [(路径, [页码])]，去掉的空白页，页码从1开始
+        self.duplicate_pages = []  # [(路径, 页码, 所重复的页面路径, 页码)]，页码从1开始
+        self.duplicates_removed = False  # 重复页是否已从输出中去掉
+        self.images = None  # 压缩图像时为 {"images": 替换的图像数, "saved_bytes": 减小的字节数}
+        self.cache = None  # 使用输出缓存时为本次是否命中及累计命中率
+
+    def add_merged(self, path):
+        if path not in self.merged:
+            self.merged.append(path)
+
+    @property
+    def has_problems(self):
+        return bool(self.skipped or self.repaired or self.warnings)
+
+    def summary_lines(self):
+        lines = [f"跳过 {os.path.basename(path)}: {reason}" for path, reason in self.skipped]
+        lines += [f"修复 {os.path.basename(path)}: {reason}" for path, reason in self.repaired]
+        lines += [f"注意 {os.path.basename(path)}: {reason}" for path, reason in self.warnings]
+        lines += [f"去掉空白页 {os.path.basename(path)}: 第 {format_page_numbers(pages)} 页"
+                  for path, pages in self.blank_pages]
+        duplicates = {}
+        for path, page, _, _ in self.duplicate_pages:
+            duplicates.setdefault(path, []).append(page)
+        action = "去掉重复页" if self.duplicates_removed else "重复页"
+        lines += [f"{action} {os.path.basename(path)}: 第 {format_page_numbers(pages)} 页"
+                  for path, pages in duplicates.items()]
+        if self.images and self.images["images"]:
+            lines.append(f"压缩图像 {self.images['images']} 个，减小 "
+                         f"{self.images['saved_bytes'] / (1024 * 1024):.1f} MB")
+        return lines
+
+    def to_dict(self):
+        def entries(pairs):
+            return [{"path": path, "reason": reason} for path, reason in pairs]
+
+        return {
+            "output": self.output_path,
+            "total_pages": self.total_pages,
+            "merged": list(self.merged),
+            "repaired": entries(self.repaired),
+            "skipped": entries(self.skipped),
+            "warnings": entries(self.warnings),
+            "blank_pages": [{"path": path, "pages": pages} for path, pages in self.blank_pages],
+            "duplicate_pages": [{"path": path, "page": page, "same_as": {"path": same_path, "page": same_page}}
+                                for path, page, same_path, same_page in self.duplicate_pages],
+            "duplicates_removed": self.duplicates_removed,
+            "images": self.images,
+            "cache": self.cache,
+        }
+
+    def save(self, path):
+        with open(path, 'w', encoding='utf-8') as f:
+            json.dump(self.to_dict(), f, ensure_ascii=False, indent=2)
+
+
+# ========== 进程隔离 ==========
+
+ISOLATED_TASK_TIMEOUT = 120  # 每个文件的默认超时（秒）
+ISOLATED_MEMORY_LIMIT_MB = 2048  # 每个工作进程的地址空间上限，仅POSIX系统生效
+
+IsolatedResult = namedtuple('IsolatedResult', 'ok value error')
+
+
+def can_use_process_pool():
+    """隔离模式的子进程是守护进程，不能再创建子进程，其中的批量分析改在本进程中执行"""
+    return not multiprocessing.current_process().daemon
+
+
+def print_progress(value, message):
+    print(f"[{value:3d}%] {message}", file=sys.stderr)
+
+
+def run_worker(worker, completed_signal, failed_signal, progress=print_progress):
+    """在当前线程同步执行后台线程对象的 run()，返回 {'completed': 参数} 或 {'error': 信息}"""
+    result = {}
+    if progress is not None:
+        worker.progress_updated.connect(progress)
+    getattr(worker, completed_signal).connect(lambda *args: result.update(completed=args))
+    getattr(worker, failed_signal).connect(lambda error: result.update(error=error))
+    worker.run()
+    return result
+
+
+def render_page_ppm(doc, page_num, zoom):
+    """渲染一页为PPM字节，同时返回总页数"""
+    pix = doc[page_num].get_pixmap(matrix=fitz.Matrix(zoom, zoom))
+    return pix.tobytes("ppm"), doc.page_count
+
+
+def _task_page_count(pdf_file, passwords=None):
+    with open_pdf_document(pdf_file, PasswordProvider.from_snapshot(passwords)) as doc:
+        return doc.page_count
+
+
+def _task_render_page(pdf_file, page_num, zoom, passwords=None):
+    with open_pdf_document(pdf_file, PasswordProvider.from_snapshot(passwords)) as doc:
+        return render_page_ppm(doc, page_num, zoom)
+
+
+def _task_merge(plan_data, output_path, backend, add_file_outline, keep_source_outline, passwords=None,
+                append=False, linearize=False, stamp=None):
+    worker = PDFMergerThread(None, output_path, backend, add_file_outline, keep_source_outline,
+                             plan=MergePlan.from_dict(plan_data),
+                             passwords=PasswordProvider.from_snapshot(passwords), append=append,
+                             linearize=linearize, stamper=PageStamper.from_dict(stamp))
+    result = run_worker(worker, 'merge_completed', 'merge_failed', progress=None)
+    if 'error' in result:
+        raise RuntimeError(result['error'])
+    return result['completed'][1]
+
+
+def _task_split(pdf_file, output_folder, split_mode, split_value, backend, max_inflight_bytes,
+                passwords=None, archive=None, linearize=False, stamp=None, remove_blank=None, images=None):
+    """返回 (输出文件列表, 去掉的空白页, 图像压缩统计)"""
+    worker = PDFSplitterThread(pdf_file, output_folder, split_mode, split_value,
+                               backend, max_inflight_bytes=max_inflight_bytes,
+                               passwords=PasswordProvider.from_snapshot(passwords), archive=archive,
+                               linearize=linearize, stamper=PageStamper.from_dict(stamp),
+                               remove_blank=BlankPageFilter.from_dict(remove_blank),
+                               image_optimizer=ImageOptimizer.from_dict(images))
+    result = run_worker(worker, 'split_completed', 'split_failed', progress=None)
+    if 'error' in result:
+        raise RuntimeError(result['error'])
+    return result['completed'][0], worker.blank_pages, worker.image_stats
+
+
+ISOLATED_TASKS = {
+    'page_count': _task_page_count,
+    'diagnose': diagnose_pdf,
+    'repair': repair_pdf,
+    'render': _task_render_page,
+    'merge': _task_merge,
+    'split': _task_split,
+    'blank_pages': _detect_blank_pages_worker,
+    'page_fingerprints': _page_fingerprint_worker,
+    'plan_images': _plan_images_worker,
+    'optimize_images': _optimize_images_worker,
+    'replace_images': _replace_images_worker,
+}
+
+
+def run_task_batch(task_name, args_list, pool=None, on_result=None, max_workers=None):
+    """并行执行一批同名任务，按输入顺序返回 IsolatedResult 列表
+
+    给出 IsolatedTaskPool 时在受监督的子进程中执行，本进程是守护进程时在本进程中执行，
+    否则使用普通进程池；各种方式下单个任务的异常都作为错误结果返回，不影响其余任务。
+    """
+    if pool is not None:
+        return pool.run_batch([(task_name, args) for args in args_list], on_result)
+
+    results = [None] * len(args_list)
+    if not args_list:
+        return results
+    if not can_use_process_pool():
+        for index, args in enumerate(args_list):
+            try:
+                results[index] = IsolatedResult(True, ISOLATED_TASKS[task_name](*args), None)
+            except Exception as e:
+                results[index] = IsolatedResult(False, None, f"{type(e).__name__}: {e}")
+            if on_result is not None:
+                on_result(index, results[index])
+        return results
+    max_workers = max_workers or max(1, min(len(args_list), os.cpu_count() or 1))
+    with ProcessPoolExecutor(max_workers=max_workers) as executor:
+        futures = {executor.submit(ISOLATED_TASKS[task_name], *args): index
+                   for index, args in enumerate(args_list)}
+        for future in as_completed(futures):
+            index = futures[future]
+            try:
+                results[index] = IsolatedResult(True, future.result(), None)
+            except Exception as e:
+                results[index] = IsolatedResult(False, None, f"{type(e).__name__}: {e}")
+            if on_result is not None:
+                on_result(index, results[index])
+    return results
+
+
+def run_analysis_tasks(task_name, args_list, pool=None, max_workers=None):
+    """执行一批页面分析任务，按输入顺序返回 IsolatedResult 列表
+
+    给出 IsolatedTaskPool 时在受监督的子进程中执行，MuPDF 崩溃或超时只让出错的那一批
+    失败；否则只有一批或本进程是守护进程时在本进程中执行，其余在进程池中并行，出错时
+    直接抛出异常。
+    """
+    if pool is not None:
+        return pool.run_batch([(task_name, args) for args in args_list])
+    function = ISOLATED_TASKS[task_name]
+    if len(args_list) <= 1 or not can_use_process_pool():
+        values = [function(*args) for args in args_list]
+    else:
+        with ProcessPoolExecutor(max_workers=max_workers) as executor:
+            values = list(executor.map(function, *zip(*args_list)))
+    return [IsolatedResult(True, value, None) for value in values]
+
+
+def report_task_error(pdf_file, error, on_error=None):
+    """分析任务失败时交给 on_error(文件, 错误信息)，没有 on_error 时抛出异常"""
+    if on_error is None:
+        raise RuntimeError(f"{os.path.basename(pdf_file)}: {error}")
+    on_error(pdf_file, error)
+
+
+def _isolated_worker_main(conn, memory_limit_bytes):
+    """工作进程主循环：逐个执行任务，异常作为结果返回"""
+    if memory_limit_bytes:
+        try:
+            import resource
+            resource.setrlimit(resource.RLIMIT_AS, (memory_limit_bytes, memory_limit_bytes))
+        except (ImportError, ValueError, OSError):
+            pass
+
+    while True:
+        try:
+            message = conn.recv()
+        except EOFError:
+            break
+        if message is None:
+            break
+
+        task_name, args = message
+        try:
+            conn.send((True, ISOLATED_TASKS[task_name](*args)))
+        except MemoryError:
+            conn.send((False, "内存超出限制"))
+        except Exception as e:
+            conn.send((False, f"{type(e).__name__}: {e}"))
+
+
+class _IsolatedWorker:
+    """一个受监督的工作进程"""
+
+    def __init__(self, context, memory_limit_bytes):
+        self.conn, child_conn = context.Pipe()
+        self.process = context.Process(target=_isolated_worker_main,
+                                       args=(child_conn, memory_limit_bytes), daemon=True)
+        self.process.start()
+        child_conn.close()
+        self.index = None
+        self.deadline = None
+
+    def kill(self):
+        self.process.kill()
+        self.process.join(5)
+        self.conn.close()
+
+    def stop(self):
+        try:
+            self.conn.send(None)
+        except OSError:
+            pass
+        self.process.join(5)
+        if self.process.is_alive():
+            self.process.kill()
+        self.conn.close()
+
+
+class IsolatedTaskPool:
+    """受监督的子进程池
+
+    合并、拆分、页数统计和渲染在独立进程中执行。PyPDF2 深度递归、MuPDF
+    段错误或内存失控只会结束对应的工作进程，任务以错误结果返回，池会用新
+    进程替换它并继续处理后续任务。工作进程使用 spawn 启动，不继承GUI状态。
+    """
+
+    def __init__(self, max_workers=None, timeout=ISOLATED_TASK_TIMEOUT,
+                 memory_limit_mb=ISOLATED_MEMORY_LIMIT_MB):
+        self.max_workers = max_workers or max(1, min(4, os.cpu_count() or 1))
+        self.timeout = timeout
+        self.memory_limit_bytes = memory_limit_mb * 1024 * 1024 if memory_limit_mb else None
+        self._context = multiprocessing.get_context("spawn")
+        self._idle = []
+
+    def run(self, task_name, *args, timeout=None):
+        """执行单个任务，返回 IsolatedResult"""
+        return self.run_batch([(task_name, args)], timeout=timeout)[0]
+
+    def run_batch(self, tasks, on_result=None, timeout=None):
+        """并行执行 [(任务名, 参数元组), ...]，按输入顺序返回 IsolatedResult 列表
+
+        on_result(索引, 结果) 在每个任务结束时调用；单个任务失败不影响其余任务。
+        """
+        timeout = timeout or self.timeout
+        results = [None] * len(tasks)
+        pending = deque(enumerate(tasks))
+        busy = []
+
+        def finish(worker, result):
+            results[worker.index] = result
+            if on_result is not None:
+                on_result(worker.index, result)
+
+        while pending or busy:
+            while pending and len(busy) < self.max_workers:
+                worker = self._idle.pop() if self._idle else \
+                    _IsolatedWorker(self._context, self.memory_limit_bytes)
+                worker.index, task = pending.popleft()
+                worker.deadline = time.monotonic() + timeout
+                worker.conn.send(task)
+                busy.append(worker)
+
+            wait_time = max(0.0, min(worker.deadline for worker in busy) - time.monotonic())
+            multiprocessing.connection.wait(
+                [worker.conn for worker in busy] + [worker.process.sentinel for worker in busy],
+                timeout=wait_time)
+
+            for worker in list(busy):
+                if worker.conn.poll():
+                    try:
+                        ok, value = worker.conn.recv()
+                    except (EOFError, OSError):
+                        pass
+                    else:
+                        busy.remove(worker)
+                        self._idle.append(worker)
+                        finish(worker, IsolatedResult(ok, value if ok else None, None if ok else value))
+                        continue
+
+                if not worker.process.is_alive() or worker.conn.closed:
+                    busy.remove(worker)
+                    worker.process.join(5)
+                    worker.conn.close()
+                    finish(worker, IsolatedResult(False, None,
+                                                  f"工作进程崩溃（退出码 {worker.process.exitcode}）"))
+                elif time.monotonic() >= worker.deadline:
+                    busy.remove(worker)
+                    worker.kill()
+                    finish(worker, IsolatedResult(False, None, f"处理超时（{timeout}秒）"))
+
+        return results
+
+    def close(self):
+        for worker in self._idle:
+            worker.stop()
+        self._idle.clear()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+        return False
+
+
+class PDFMergerThread(QThread):
+    """用于合并PDF的后台线程"""
+    progress_updated = pyqtSignal(int, str)
+    merge_completed = pyqtSignal(str, int)
+    merge_failed = pyqtSignal(str)
+    file_failed = pyqtSignal(str, str)  # 文件路径, 错误信息（合并继续）
+
+    def __init__(self, pdf_files, output_path, backend=BACKEND_PYPDF2,
+                 add_file_outline=False, keep_source_outline=True, plan=None,
+                 isolated=False, task_timeout=ISOLATED_TASK_TIMEOUT,
+                 memory_limit_mb=ISOLATED_MEMORY_LIMIT_MB, tolerant=False, repair=True, cache=None,
+                 passwords=None, read_ahead=DEFAULT_READ_AHEAD, read_ahead_bytes=DEFAULT_READ_AHEAD_BYTES,
+                 staging=None, output_cache=None, append=False, linearize=False, stamper=None,
+                 remove_blank=None, deduplicate=None, image_optimizer=None):
+        super().__init__()
+        self.pdf_files = pdf_files
+        self.output_path = output_path
+        self.backend = backend
+        self.add_file_outline = add_file_outline  # 每个方案项一个顶层书签
+        self.keep_source_outline = keep_source_outline  # 保留源文件书签（有文件书签时嵌套其下）
+        self.plan = plan or MergePlan.from_files(pdf_files)  # 页面级合并方案
+        self.isolated = isolated  # 在受监督的子进程中执行
+        self.task_timeout = task_timeout
+        self.memory_limit_mb = memory_limit_mb
+        self.tolerant = tolerant  # 跳过无法读取的文件，继续合并其余文件
+        self.repair = repair  # 容错模式下先尝试修复损坏的文件
+        self.cache = cache  # 检查结果缓存，None 时使用默认缓存目录
+        self.passwords = passwords or PasswordProvider()  # 加密文件的密码
+        self.read_ahead = read_ahead  # 预读的输入文件数，0 表示不预读
+        self.read_ahead_bytes = read_ahead_bytes  # 预读窗口的字节上限
+        self.staging = staging  # 网络存储上的来源先复制到本地再合并
+        self.output_cache = output_cache  # 相同的作业复用上次的输出
+        self.append = append  # 追加到已有的输出文件末尾（增量更新），输出不存在时正常合并
+        self.linearize = linearize  # 写出线性化（快速网页浏览）的输出
+        self.stamper = stamper  # PageStamper：给输出的各页加水印和 Bates 编号
+        self.remove_blank = remove_blank  # BlankPageFilter：合并前去掉所选页面中的空白页
+        self.deduplicate = deduplicate  # DuplicatePageFinder：检测（并去掉）近似重复页
+        self.image_optimizer = image_optimizer  # ImageOptimizer：合并前缩小、重新压缩来源中的高分辨率图像
+        self.original_sources = {}  # 修复后的副本、本地暂存副本 -> 原始路径
+        self.page_counts = {}  # 检查时得到的各来源页数
+        self.report = MergeReport(output_path)
+
+    def run(self):
+        self.report = MergeReport(self.output_path)
+        try:
+            with ExitStack() as stack:
+                append = self.append and os.path.exists(self.output_path)
+                if append:
+                    self.check_append_target()
+                if self.linearize:
+                    if append:
+                        # 线性化要重排整个文件，与增量更新相互抵触
+                        raise ValueError("追加（增量更新）与线性化输出不能同时使用")
+                    require_linearize_backend()
+                if self.staging is not None:
+                    self.plan = self.stage_sources()
+                # 追加的结果还取决于已有文件，不使用输出缓存
+                fingerprint = None if append else self.job_fingerprint()
+                if fingerprint is not None and self.reuse_output(fingerprint):
+                    self.merge_completed.emit(self.output_path, self.report.total_pages)
+                    return
+                if append:
+                    unshare_file(self.output_path)
+                else:
+                    break_hardlink(self.output_path)
+                plan = self.plan
+                pool = None
+                if self.isolated:
+                    pool = stack.enter_context(IsolatedTaskPool(
+                        timeout=self.task_timeout, memory_limit_mb=self.memory_limit_mb))
+                if self.tolerant or self.isolated:
+                    plan = self.prevalidate(pool)
+                elif self.passwords.has_candidates:
+                    self.unlock_sources()
+                if self.remove_blank is not None:
+                    plan = self.remove_blank_pages(plan, pool)
+                if self.deduplicate is not None:
+                    plan = self.find_duplicate_pages(plan, pool)
+                if self.image_optimizer is not None:
+                    plan = self.optimize_images(plan, stack, pool)
+
+                if self.isolated:
+                    total_pages = self.merge_isolated(pool, plan, append)
+                elif append:
+                    total_pages = self.merge_append(plan)
+                elif self.backend == BACKEND_RAW:
+                    total_pages = self.merge_raw(plan)
+                else:
+                    total_pages = self.merge_pypdf2(plan)
+
+            self.report.total_pages = total_pages
+            if self.linearize and not self.isolated:
+                self.progress_updated.emit(100, "正在线性化输出...")
+                linearize_in_place(self.output_path)
+            if fingerprint is not None and not self.report.skipped:
+                # 跳过可能是偶发的超时或崩溃，这样的结果不缓存
+                self.output_cache.store(fingerprint, [self.output_path], {
+                    "total_pages": total_pages,
+                    "repaired": self.report_entries(self.report.repaired),
+                    "warnings": self.report_entries(self.report.warnings),
+                    "blank_pages": self.report_entries(self.report.blank_pages),
+                    "duplicate_pages": self.duplicate_entries(),
+                    "images": self.report.images})
+            self.merge_completed.emit(self.output_path, total_pages)
+
+        except Exception as e:
+            self.merge_failed.emit(str(e))
+
+    def original(self, pdf_file):
+        """报告中使用的原始路径"""
+        return self.original_sources.get(pdf_file, pdf_file)
+
+    def check_append_target(self):
+        """追加的来源不能是输出文件本身"""
+        for source in self.plan.sources:
+            if os.path.exists(source) and os.path.samefile(source, self.output_path):
+                raise ValueError(f"{os.path.basename(source)} 就是要追加到的输出文件")
+
+    def job_fingerprint(self):
+        """输出缓存的作业指纹；不使用输出缓存或作业不宜缓存时为 None"""
+        if self.output_cache is None:
+            return None
+        self.progress_updated.emit(0, "正在计算作业指纹...")
+        sources = self.plan.sources
+        index = {source: i for i, source in enumerate(sources)}
+        return self.output_cache.fingerprint('merge', sources, {
+            "items": [[index[item.source], item.pages, item.rotate, item.label] for item in self.plan.items],
+            "backend": self.backend, "file_outline": self.add_file_outline,
+            "source_outline": self.keep_source_outline, "tolerant": self.tolerant, "repair": self.repair,
+            "linearize": self.linearize, "stamp": self.stamper and self.stamper.to_dict(),
+            "remove_blank": self.remove_blank and self.remove_blank.to_dict(),
+            "duplicates": self.deduplicate and self.deduplicate.to_dict(),
+            "images": self.image_optimizer and self.image_optimizer.to_dict()})
+
+    def report_entries(self, pairs):
+        """报告条目中的路径换成来源下标，缓存的结果可用于路径不同、内容相同的作业"""
+        index = {self.original(source): i for i, source in enumerate(self.plan.sources)}
+        return [[index[path], reason] for path, reason in pairs if path in index]
+
+    def duplicate_entries(self):
+        """重复页报告条目，路径同样换成来源下标"""
+        index = {self.original(source): i for i, source in enumerate(self.plan.sources)}
+        return [[index[path], page, index[same_path], same_page]
+                for path, page, same_path, same_page in self.report.duplicate_pages]
+
+    def reuse_output(self, fingerprint):
+        """输出缓存命中时放置上次的输出并还原报告，返回是否命中"""
+        entry = self.output_cache.lookup(fingerprint)
+        if entry is not None:
+            try:
+                self.output_cache.restore(fingerprint, entry["files"][0], self.output_path)
+            except OSError:
+                entry = None
+        self.report.cache = self.output_cache.record(entry is not None)
+        if entry is None:
+            return False
+
+        sources = [self.original(source) for source in self.plan.sources]
+        info = entry["info"]
+        self.report.total_pages = info["total_pages"]
+        self.report.repaired = [(sources[i], reason) for i, reason in info["repaired"]]
+        self.report.warnings = [(sources[i], reason) for i, reason in info["warnings"]]
+        self.report.blank_pages = [(sources[i], pages) for i, pages in info.get("blank_pages", [])]
+        self.report.duplicate_pages = [(sources[i], page, sources[j], same_page)
+                                       for i, page, j, same_page in info.get("duplicate_pages", [])]
+        self.report.duplicates_removed = bool(self.deduplicate and self.deduplicate.remove)
+        self.report.images = info.get("images")
+        for source in sources:
+            self.report.add_merged(source)
+        self.progress_updated.emit(100, "已复用相同作业的输出")
+        return True
+
+    def stage_sources(self):
+        """等待来源的本地暂存副本，返回改用副本的合并方案"""
+        sources = self.plan.sources
+        self.progress_updated.emit(0, f"正在把 {len(sources)} 个文件复制到本地...")
+        self.staging.stage(sources)
+        local_paths = dict(zip(sources, self.staging.local_paths(sources, wait=True)))
+        for source, local_path in local_paths.items():
+            if local_path != source:
+                self.original_sources[local_path] = self.original(source)
+                self.passwords.share(source, local_path)
+        return MergePlan(MergePlanItem(local_paths[item.source], item.pages, item.rotate, item.title)
+                         for item in self.plan.items)
+
+    def skip_file(self, pdf_file, reason):
+        pdf_file = self.original(pdf_file)
+        if (pdf_file, reason) in self.report.skipped:
+            return
+        self.report.skipped.append((pdf_file, reason))
+        self.file_failed.emit(pdf_file, reason)
+
+    def unlock_sources(self):
+        """并行检查来源，预先试出加密文件的密码，合并时每个文件只需解密一次"""
+        sources = self.plan.sources
+        self.progress_updated.emit(0, f"正在检查 {len(sources)} 个文件的加密...")
+        PreflightChecker(self.cache, passwords=self.passwords).check(sources)
+
+    def prevalidate(self, pool):
+        """并行检查所有来源，返回去掉不可用文件、换上修复副本后的合并方案"""
+        sources = self.plan.sources
+        checker = PreflightChecker(self.cache, pool, passwords=self.passwords)
+        checked = []
+
+        def on_checked(index, diagnosis):
+            checked.append(index)
+            self.progress_updated.emit(int(len(checked) / len(sources) * 30),
+                                       f"正在检查: {os.path.basename(sources[index])}")
+
+        to_repair = []
+        for source, diagnosis in zip(sources, checker.check(sources, on_checked)):
+            verdict, reason = preflight_verdict(diagnosis, self.backend)
+            self.page_counts[source] = diagnosis["pages"]
+            if verdict == CHECK_SKIPPED:
+                self.skip_file(source, reason)
+            elif verdict == CHECK_REPAIR:
+                if self.tolerant and self.repair:
+                    to_repair.append((source, reason))
+                elif self.backend == BACKEND_RAW:
+                    # 原始流后端直接使用 MuPDF 在内存中修复的结果
+                    self.report.warnings.append((self.original(source), reason))
+                else:
+                    self.skip_file(source, reason)
+
+        replacements = {}
+        if to_repair:
+            self.progress_updated.emit(30, f"正在修复 {len(to_repair)} 个文件...")
+            repaired = checker.repair([source for source, _ in to_repair])
+            for (source, reason), (repaired_path, error) in zip(to_repair, repaired):
+                if repaired_path is None:
+                    self.skip_file(source, f"{reason}，修复失败: {error}")
+                else:
+                    self.report.repaired.append((self.original(source), reason))
+                    replacements[source] = repaired_path
+                    self.original_sources[repaired_path] = self.original(source)
+                    self.page_counts[repaired_path] = self.page_counts[source]
+
+        skipped = {path for path, _ in self.report.skipped}
+        plan = MergePlan(MergePlanItem(replacements.get(item.source, item.source),
+                                       item.pages, item.rotate, item.title)
+                         for item in self.plan.items if self.original(item.source) not in skipped)
+        if not plan.items:
+            raise ValueError("没有可合并的文件")
+        return plan
+
+    def selected_pages(self, plan, pool=None):
+        """方案各项所选的页面（PageSet）
+
+        页数优先取自检查结果（隔离模式总会先检查），其余来源在本进程中打开统计，
+        给出 pool 时在子进程中统计。
+        """
+        missing = [source for source in plan.sources if not self.page_counts.get(source)]
+        if pool is not None:
+            results = pool.run_batch([('page_count', (source, self.passwords.snapshot([source])))
+                                      for source in missing])
+            for source, result in zip(missing, results):
+                if not result.ok:
+                    raise RuntimeError(f"{os.path.basename(self.original(source))}: {result.error}")
+                self.page_counts[source] = result.value
+        else:
+            for source in missing:
+                doc = open_pdf_document(source, self.passwords)
+                try:
+                    self.page_counts[source] = doc.page_count
+                finally:
+                    doc.close()
+        return [item.page_set(self.page_counts[item.source]) for item in plan.items]
+
+    def analysis_failed(self, stage):
+        """隔离模式下分析任务出错时的回调：文件照常合并，错误记入报告"""
+        return lambda source, error: self.report.warnings.append((self.original(source), f"{stage}失败: {error}"))
+
+    def remove_blank_pages(self, plan, pool=None):
+        """检测方案所选页面中的空白页，返回去掉空白页后的合并方案，去掉的页记入报告"""
+        self.progress_updated.emit(30, "正在检测空白页...")
+        item_pages = self.selected_pages(plan, pool)
+        selected = {}
+        for item, pages in zip(plan.items, item_pages):
+            selected.setdefault(item.source, set()).update(pages)
+        blank_pages = self.remove_blank.detect(selected, self.passwords.snapshot(plan.sources),
+                                               pool=pool, on_error=self.analysis_failed("检测空白页"))
+
+        items = []
+        for item, pages in zip(plan.items, item_pages):
+            blank = PageSet.from_pages(blank_pages[item.source])
+            removed = [page_num + 1 for page_num in pages if page_num in blank]
+            if not removed:
+                items.append(item)
+                continue
+            self.report.blank_pages.append((self.original(item.source), removed))
+            kept = pages - blank
+            if kept:
+                items.append(MergePlanItem(item.source, format_page_spec(kept), item.rotate, item.title))
+        if not items:
+            raise ValueError("去掉空白页后没有可合并的页面")
+        return MergePlan(items)
+
+    def find_duplicate_pages(self, plan, pool=None):
+        """在方案所选的页面中查找近似重复页并记入报告；去掉重复页时返回去掉后的合并方案"""
+        self.progress_updated.emit(30, "正在检测重复页...")
+        item_pages = self.selected_pages(plan, pool)
+        pages = [(item.source, page_num) for item, selected in zip(plan.items, item_pages) for page_num in selected]
+        cache = self.cache or MetadataCache()
+        duplicates = self.deduplicate.find(pages, cache, self.passwords.snapshot(plan.sources),
+                                           pool=pool, on_error=self.analysis_failed("检测重复页"))
+        cache.save()
+
+        self.report.duplicates_removed = self.deduplicate.remove
+        for position, original in sorted(duplicates.items()):
+            (source, page_num), (same_source, same_page) = pages[position], pages[original]
+            self.report.duplicate_pages.append(
+                (self.original(source), page_num + 1, self.original(same_source), same_page + 1))
+        if not self.deduplicate.remove or not duplicates:
+            return plan
+
+        # 每一页最早的一次出现总会保留，去掉重复页后不会为空
+        items = []
+        position = 0
+        for item, selected in zip(plan.items, item_pages):
+            kept = [page_num for offset, page_num in enumerate(selected) if position + offset not in duplicates]
+            position += len(selected)
+            if len(kept) == len(selected):
+                items.append(item)
+            elif kept:
+                items.append(MergePlanItem(item.source, format_page_spec(kept), item.rotate, item.title))
+        return MergePlan(items)
+
+    def optimize_images(self, plan, stack, pool=None):
+        """把来源换成压缩了图像的副本，返回改用副本的合并方案；副本在合并结束后删除"""
+        self.progress_updated.emit(30, "正在压缩图像...")
+        sources = plan.sources
+        output_dir = stack.enter_context(tempfile.TemporaryDirectory(prefix="pdftools_images_"))
+        optimized, self.report.images = self.image_optimizer.optimize(
+            sources, output_dir, self.passwords, pool=pool, on_error=self.analysis_failed("压缩图像"))
+        for source, optimized_path in zip(sources, optimized):
+            if optimized_path != source:
+                self.original_sources[optimized_path] = self.original(source)
+        optimized = dict(zip(sources, optimized))
+        return MergePlan(MergePlanItem(optimized[item.source], item.pages, item.rotate, item.title)
+                         for item in plan.items)
+
+    def merge_isolated(self, pool, plan, append=False):
+        """在子进程中合并已通过检查的文件"""
+        self.progress_updated.emit(30, "正在合并...")
+        result = pool.run('merge', plan.to_dict(), self.output_path, self.backend,
+                          self.add_file_outline, self.keep_source_outline,
+                          self.passwords.snapshot(plan.sources + [self.output_path]), append,
+                          self.linearize, self.stamper and self.stamper.to_dict(), timeout=self.task_timeout * len(plan.items))
+        if not result.ok:
+            raise RuntimeError(result.error)
+        for source in plan.sources:
+            self.report.add_merged(self.original(source))
+        return result.value
+
+    def merge_pypdf2(self, plan):
+        pdf_writer = PyPDF2.PdfWriter()
+        items = plan.items
+        last_use = {item.source: i for i, item in enumerate(items)}
+
+        def parse(source, data):
+            # 在读取线程中解析和解密；append 会把对象复制进输出，用完即可释放
+            if data is None:
+                return None
+            return open_pdf_reader(io.BytesIO(data), source, self.passwords)
+
+        with ExitStack() as stack:
+            # 每个来源只打开、解析一次；后续来源由读取线程预读并解析
+            loader = stack.enter_context(ReadAheadLoader(plan.sources, parse, self.read_ahead,
+                                                         self.read_ahead_bytes))
+            readers = {}
+            for i, item in enumerate(items):
+                try:
+                    pdf_reader = readers.get(item.source)
+                    if pdf_reader is None:
+                        pdf_reader = loader.get(item.source)
+                        if pdf_reader is None:
+                            # 没有预读的大文件直接从磁盘读取
+                            f = stack.enter_context(open(item.source, 'rb'))
+                            pdf_reader = open_pdf_reader(f, item.source, self.passwords)
+                        readers[item.source] = pdf_reader
+
+                    pages = list(item.page_set(len(pdf_reader.pages)))
+                    first_new_page = len(pdf_writer.pages)
+                    # append 时即把源书签挂到文件书签之下，书签树随合并一次建成
+                    pdf_writer.append(pdf_reader, pages=pages,
+                                      outline_item=item.label if self.add_file_outline else None,
+                                      import_outline=self.keep_source_outline)
+                    if item.rotate:
+                        for page_num in range(first_new_page, len(pdf_writer.pages)):
+                            pdf_writer.pages[page_num].rotate(item.rotate)
+                except Exception as e:
+                    if not self.tolerant:
+                        raise
+                    self.skip_file(item.source, f"合并失败: {e}")
+                else:
+                    self.report.add_merged(self.original(item.source))
+                if last_use[item.source] == i:
+                    readers.pop(item.source, None)
+                    loader.release(item.source)
+
+                self.report_file_progress(i, len(items), item.source)
+
+            if not self.report.merged:
+                raise ValueError("没有可合并的文件")
+            with open(self.output_path, 'wb') as output_file:
+                pdf_writer.write(output_file)
+
+        if self.stamper:
+            # PyPDF2 的输出写出后由 MuPDF 盖章，以增量更新追加到文件末尾
+            self.progress_updated.emit(100, "正在盖章...")
+            self.stamper.stamp_file(self.output_path)
+        return len(pdf_writer.pages)
+
+    def merge_raw(self, plan):
+        output_doc = fitz.open()
+        toc = []
+        try:
+            self.copy_pages_raw(output_doc, plan, toc)
+            self.stamp_pages(output_doc)
+            if toc:
+                output_doc.set_toc(toc)
+            RawPageCopier.save(output_doc, self.output_path)
+            return output_doc.page_count
+        finally:
+            output_doc.close()
+
+    def merge_append(self, plan):
+        """把方案中的页面追加到已有的输出文件末尾，以增量更新保存
+
+        新页面的对象和一个新的交叉引用段写在文件末尾，原有内容不重写，耗时只与
+        新增的页面有关。PyPDF2 不支持增量更新，追加总是使用 MuPDF 原始流复制。
+        已有文件不能增量保存（例如交叉引用表损坏、打开时做过修复）时完整重写，
+        并在报告中注明。
+        """
+        output_doc = open_pdf_document(self.output_path, self.passwords)
+        try:
+            toc = output_doc.get_toc(simple=False)
+            existing_entries = len(toc)
+            existing_pages = output_doc.page_count
+            self.copy_pages_raw(output_doc, plan, toc)
+            # 编号接着已有的页面继续
+            self.stamp_pages(output_doc, existing_pages)
+            if len(toc) > existing_entries:
+                output_doc.set_toc(toc)
+
+            total_pages = output_doc.page_count
+            if output_doc.can_save_incrementally():
+                output_doc.saveIncr()
+                return total_pages
+
+            self.report.warnings.append((self.output_path, "已有文件不能增量保存，已完整重写"))
+            temp_path = f"{self.output_path}.{os.getpid()}.tmp"
+            try:
+                output_doc.save(temp_path, garbage=0, deflate=False, expand=0,
+                                encryption=fitz.PDF_ENCRYPT_KEEP)
+            except BaseException:
+                if os.path.exists(temp_path):
+                    os.remove(temp_path)
+                raise
+        finally:
+            output_doc.close()
+        os.replace(temp_path, self.output_path)
+        return total_pages
+
+    def copy_pages_raw(self, output_doc, plan, toc):
+        """用原始流直通复制把方案中的页面依次加到 output_doc 末尾，书签追加到 toc"""
+        items = plan.items
+        last_use = {item.source: i for i, item in enumerate(items)}
+
+        # 每个来源只打开一次，最后一次使用后立即关闭；读取线程预读后续来源的内容，
+        # MuPDF 不支持多线程，解析仍在本线程进行
+        copiers = {}
+        loader = ReadAheadLoader(plan.sources, depth=self.read_ahead, max_bytes=self.read_ahead_bytes)
+        try:
+            for i, item in enumerate(items):
+                is_last_use = last_use[item.source] == i
+                try:
+                    copier = copiers.get(item.source)
+                    if copier is None:
+                        copier = copiers[item.source] = RawPageCopier(
+                            open_pdf_document(item.source, self.passwords, loader.get(item.source)))
+
+                    pages = item.page_set(copier.page_count)
+                    page_offset = output_doc.page_count
+                    copier.copy_pages(output_doc, pages, rotate=item.rotate, final=is_last_use)
+                    self.extend_toc(toc, copier.source, item, pages, page_offset)
+                except Exception as e:
+                    if not self.tolerant:
+                        raise
+                    self.skip_file(item.source, f"合并失败: {e}")
+                else:
+                    self.report.add_merged(self.original(item.source))
+                if is_last_use:
+                    if item.source in copiers:
+                        copiers.pop(item.source).close()
+                    loader.release(item.source)
+
+                self.report_file_progress(i, len(items), item.source)
+        finally:
+            loader.close()
+            for copier in copiers.values():
+                copier.close()
+
+        if not self.report.merged:
+            raise ValueError("没有可合并的文件")
+
+    def stamp_pages(self, output_doc, first_page=0):
+        if self.stamper:
+            self.progress_updated.emit(100, "正在盖章...")
+            self.stamper.stamp(output_doc, first_page)
+
+    def extend_toc(self, toc, source_doc, item, pages, page_offset):
+        """把一个方案项的书签追加到目录列表
+
+        源书签按页面在输出中的位置重新定位，不在所选页面内的书签被丢弃，
+        层级随之收紧以保持目录结构合法。
+        """
+        level_offset = 0
+        if self.add_file_outline:
+            toc.append([1, item.label, page_offset + 1])
+            level_offset = 1
+
+        if not self.keep_source_outline:
+            return
+
+        positions = {}
+        for position, page_num in enumerate(pages):
+            positions.setdefault(page_num, page_offset + position + 1)
+        if not positions:
+            return
+
+        for level, title, page in source_doc.get_toc(simple=True):
+            # 没有目标页的书签指向该项的第一页
+            target = positions.get(page - 1) if page >= 1 else page_offset + 1
+            if target is None:
+                continue
+            previous_level = toc[-1][0] if toc else 0
+            toc.append([min(level + level_offset, previous_level + 1), title, target])
+
+    def report_file_progress(self, index, total_files, pdf_file):
+        progress = int((index + 1) / total_files * 100)
+        file_name = os.path.basename(pdf_file)
+        self.progress_updated.emit(progress, f"正在处理: {file_name}")
+
+
+class PDFSplitterThread(QThread):
+    """用于拆分PDF的后台线程"""
+    progress_updated = pyqtSignal(int, str)
+    split_completed = pyqtSignal(list)
+    split_failed = pyqtSignal(str)
+
+    def __init__(self, pdf_file, output_folder, split_mode, split_value,
+                 backend=BACKEND_PYPDF2, max_inflight_bytes=DEFAULT_INFLIGHT_BYTES,
+                 writer_threads=DEFAULT_WRITER_THREADS, isolated=False,
+                 task_timeout=ISOLATED_TASK_TIMEOUT, memory_limit_mb=ISOLATED_MEMORY_LIMIT_MB,
+                 passwords=None, archive=None, cache=None, staging=None, output_cache=None,
+                 linearize=False, stamper=None, remove_blank=None, image_optimizer=None):
+        super().__init__()
+        self.pdf_file = pdf_file
+        self.output_folder = output_folder
+        # 'page': 每几页; 'range': PageSet 列表; 'outline': 书签层级;
+        # 'blank': BlankPageFilter; 'size': 每部分最大字节数;
+        # 'text': (正则表达式, 是否用匹配内容命名)
+        self.split_mode = split_mode
+        self.split_value = split_value
+        self.backend = backend
+        self.max_inflight_bytes = max_inflight_bytes  # 尚未落盘的字节上限
+        self.writer_threads = writer_threads
+        self.isolated = isolated  # 在受监督的子进程中执行
+        self.task_timeout = task_timeout
+        self.memory_limit_mb = memory_limit_mb
+        self.passwords = passwords or PasswordProvider()  # 加密文件的密码
+        self.archive = archive  # None 表示各部分单独成文件；'zip'/'tar' 表示写入同一个归档
+        self.archive_members = []  # 写入归档的各部分文件名
+        self.cache = cache  # 页面文本缓存，None 时使用默认缓存目录
+        self.staging = staging  # 网络存储上的输入先复制到本地再拆分
+        self.output_cache = output_cache  # 相同的作业复用上次的输出
+        self.linearize = linearize  # 各部分写成线性化（快速网页浏览）的PDF
+        self.stamper = stamper  # PageStamper：各部分加水印和 Bates 编号，编号沿用原文件中的页码
+        self.remove_blank = remove_blank  # BlankPageFilter：从各部分中去掉空白页
+        self.blank_pages = []  # 去掉的空白页，页码从1开始
+        self.image_optimizer = image_optimizer  # ImageOptimizer：拆分前缩小、重新压缩高分辨率图像
+        self.image_stats = None  # 压缩图像时为替换的图像数和减小的字节数
+        self.fingerprint = None
+        self.cache_stats = None  # 使用输出缓存时为本次是否命中及累计命中率
+
+    def run(self):
+        try:
+            if self.staging is not None:
+                self.stage_input()
+            self.fingerprint = self.job_fingerprint()
+            if self.fingerprint is not None and self.reuse_output():
+                return
+            if self.isolated:
+                self.run_isolated()
+                return
+
+            # 各部分在写入线程中线性化，与序列化下一部分并行
+            transform = None
+            if self.linearize:
+                require_linearize_backend()
+                transform = linearize_bytes
+            with ExitStack() as stack:
+                if self.image_optimizer is not None:
+                    self.optimize_images(stack)
+                if self.backend == BACKEND_RAW:
+                    source = RawPageCopier(self.pdf_file, self.passwords)
+                    stack.callback(source.close)
+                    total_pages = source.page_count
+                else:
+                    f = stack.enter_context(open(self.pdf_file, 'rb'))
+                    source = open_pdf_reader(f, self.pdf_file, self.passwords)
+                    total_pages = len(source.pages)
+
+                parts = self.plan_parts(source, total_pages)
+                blank = self.detect_blank_pages(parts, total_pages)
+
+                # 序列化在本线程进行，写盘交给写入池，二者重叠
+                if self.archive:
+                    writer = stack.enter_context(
+                        ArchivePartWriter(self.archive_path(), self.archive, self.max_inflight_bytes, transform))
+                else:
+                    writer = stack.enter_context(
+                        PipelinedFileWriter(self.writer_threads, self.max_inflight_bytes, transform))
+                output_files = []
 
-warnings.filterwarnings("ignore", category=DeprecationWarning)
+                for i, (pages, label) in enumerate(parts):
+                    if not isinstance(pages, PageSet):
+                        pages = PageSet.from_pages(pages)
+                    pages = pages.clip(total_pages)
+                    if blank is not None:
+                        self.blank_pages += [page_num + 1 for page_num in pages if page_num in blank]
+                        pages = pages - blank
+
+                    if pages:
+                        output_path = self.part_path(i, label)
+                        if self.archive:
+                            output_path = os.path.basename(output_path)
+                        writer.submit(output_path, self.serialize_part(source, pages))
+                        output_files.append(output_path)
 
+                    progress = int((i + 1) / len(parts) * 100)
+                    self.progress_updated.emit(progress, f"正在拆分: 第{i + 1}/{len(parts)}部分")
 
-class PDFMergerThread(QThread):
-    """用于合并PDF的后台线程"""
-    progress_updated = pyqtSignal(int, str)
-    merge_completed = pyqtSignal(str, int)
-    merge_failed = pyqtSignal(str)
+            if self.archive:
+                self.archive_members = output_files
+                output_files = [self.archive_path()]
+            self.complete(output_files)
 
-    def __init__(self, pdf_files, output_path):
+        except Exception as e:
+            self.split_failed.emit(str(e))
+
+    def stage_input(self):
+        """改用输入文件的本地暂存副本，副本保留原文件名，输出文件名不变"""
+        self.progress_updated.emit(0, "正在把文件复制到本地...")
+        self.staging.stage([self.pdf_file])
+        local_path = self.staging.local_path(self.pdf_file, wait=True)
+        self.passwords.share(self.pdf_file, local_path)
+        self.pdf_file = local_path
+
+    def run_isolated(self):
+        """在受监督的子进程中拆分，子进程崩溃或超时作为拆分失败报告"""
+        self.progress_updated.emit(0, "正在拆分（隔离进程）...")
+        with IsolatedTaskPool(max_workers=1, timeout=self.task_timeout,
+                              memory_limit_mb=self.memory_limit_mb) as pool:
+            result = pool.run('split', self.pdf_file, self.output_folder, self.split_mode,
+                              self.split_value, self.backend, self.max_inflight_bytes,
+                              self.passwords.snapshot([self.pdf_file]), self.archive, self.linearize,
+                              self.stamper and self.stamper.to_dict(),
+                              self.remove_blank and self.remove_blank.to_dict(),
+                              self.image_optimizer and self.image_optimizer.to_dict())
+        if result.ok:
+            output_files, self.blank_pages, self.image_stats = result.value
+            if self.archive:
+                self.archive_members = list_archive_members(output_files[0])
+            self.progress_updated.emit(100, "拆分完成")
+            self.complete(output_files)
+        else:
+            self.split_failed.emit(result.error)
+
+    def job_fingerprint(self):
+        """输出缓存的作业指纹；不使用输出缓存或作业不宜缓存时为 None"""
+        if self.output_cache is None:
+            return None
+        self.progress_updated.emit(0, "正在计算作业指纹...")
+        split_value = self.split_value
+        if self.split_mode == 'range':
+            split_value = [format_page_spec(value) if isinstance(value, PageSet) else value
+                           for value in split_value]
+        elif self.split_mode == 'blank':
+            split_value = split_value.to_dict()
+        # 输出文件名取自输入文件名，一并计入
+        return self.output_cache.fingerprint('split', [self.pdf_file], {
+            "name": os.path.splitext(os.path.basename(self.pdf_file))[0],
+            "mode": self.split_mode, "value": split_value,
+            "backend": self.backend, "archive": self.archive, "linearize": self.linearize,
+            "stamp": self.stamper and self.stamper.to_dict(),
+            "remove_blank": self.remove_blank and self.remove_blank.to_dict(),
+            "images": self.image_optimizer and self.image_optimizer.to_dict()})
+
+    def reuse_output(self):
+        """输出缓存命中时把上次的各部分放到输出文件夹，返回是否命中"""
+        entry = self.output_cache.lookup(self.fingerprint)
+        output_files = []
+        if entry is not None:
+            try:
+                for name in entry["files"]:
+                    output_path = os.path.join(self.output_folder, name)
+                    self.output_cache.restore(self.fingerprint, name, output_path)
+                    output_files.append(output_path)
+            except OSError:
+                entry = None
+        self.cache_stats = self.output_cache.record(entry is not None)
+        if entry is None:
+            return False
+
+        if self.archive:
+            self.archive_members = list_archive_members(output_files[0])
+        self.blank_pages = (entry["info"] or {}).get("blank_pages", [])
+        self.image_stats = (entry["info"] or {}).get("images")
+        self.progress_updated.emit(100, "已复用相同作业的输出")
+        self.split_completed.emit(output_files)
+        return True
+
+    def complete(self, output_files):
+        if self.fingerprint is not None:
+            self.output_cache.store(self.fingerprint, output_files,
+                                    {"blank_pages": self.blank_pages, "images": self.image_stats})
+        self.split_completed.emit(output_files)
+
+    def optimize_images(self, stack):
+        """改用压缩了图像的副本拆分；副本保留原文件名，输出文件名不变，拆分结束后删除"""
+        self.progress_updated.emit(0, "正在压缩图像...")
+        output_dir = stack.enter_context(tempfile.TemporaryDirectory(prefix="pdftools_images_"))
+        optimized, self.image_stats = self.image_optimizer.optimize([self.pdf_file], output_dir, self.passwords)
+        self.pdf_file = optimized[0]
+
+    def detect_blank_pages(self, parts, total_pages):
+        """去掉空白页时检测各部分用到的页面，返回空白页的 PageSet；不去掉空白页时为 None"""
+        if self.remove_blank is None:
+            return None
+        self.progress_updated.emit(0, "正在检测空白页...")
+        selected = set()
+        for pages, _ in parts:
+            selected.update(page_num for page_num in pages if 0 <= page_num < total_pages)
+        blank_pages = self.remove_blank.detect({self.pdf_file: selected}, self.passwords.snapshot([self.pdf_file]))
+        return PageSet.from_pages(blank_pages[self.pdf_file])
+
+    def plan_parts(self, source, total_pages):
+        """按拆分模式生成各部分 [(页码集合, 文件名标签或None), ...]"""
+        if self.split_mode == 'page':
+            # 按每几页拆分
+            pages_per_file = self.split_value
+            return [(PageSet([range(start, min(start + pages_per_file, total_pages))]), None)
+                    for start in range(0, total_pages, pages_per_file)]
+
+        if self.split_mode == 'range':
+            # 按页数范围拆分；字符串形式的范围表达式按本文件的总页数解析
+            return [(parse_page_spec(page_range, total_pages, line) if isinstance(page_range, str) else page_range,
+                     None)
+                    for line, page_range in enumerate(self.split_value, start=1)]
+
+        if self.split_mode == 'blank':
+            # 按空白分隔页拆分，分隔页本身不输出
+            self.progress_updated.emit(0, "正在检测空白页...")
+            blank_pages = self.split_value.detect({self.pdf_file: range(total_pages)},
+                                                  self.passwords.snapshot([self.pdf_file]))[self.pdf_file]
+            separators = blank_pages + [total_pages]
+            parts = []
+            start = 0
+            for separator in separators:
+                if separator > start:
+                    parts.append((PageSet([range(start, separator)]), None))
+                start = separator + 1
+            return parts
+
+        if self.split_mode == 'text':
+            # 在页面文本匹配正则表达式处拆分，第一处匹配之前的页面单独成为第一部分
+            pattern, name_from_match = self.split_value
+            self.progress_updated.emit(0, "正在提取页面文本...")
+            cache = self.cache or MetadataCache()
+            texts = extract_page_texts(self.pdf_file, total_pages, cache,
+                                       passwords=self.passwords.snapshot([self.pdf_file]))
+            cache.save()
+            boundaries = text_boundaries(texts, pattern, name_from_match)
+            if not boundaries:
+                raise ValueError("没有页面的文本匹配拆分规则")
+            return parts_from_boundaries(boundaries, total_pages)
+
+        with ExitStack() as stack:
+            if self.backend == BACKEND_RAW:
+                doc = source.source
+            else:
+                doc = stack.enter_context(open_pdf_document(self.pdf_file, self.passwords))
+
+            if self.split_mode == 'outline':
+                # 按书签拆分，书签前的页面单独成为第一部分
+                boundaries = outline_boundaries(doc, self.split_value)
+                if not boundaries:
+                    raise ValueError(f"文件中没有第{self.split_value}级及以上的书签")
+                return parts_from_boundaries(boundaries, total_pages)
+
+            if self.split_mode == 'size':
+                # 按文件大小拆分
+                self.progress_updated.emit(0, "正在估算页面大小...")
+                return [(PageSet([pages]), None)
+                        for pages in plan_size_bounded_parts(doc, self.split_value)]
+
+        raise ValueError(f"未知的拆分模式: {self.split_mode}")
+
+    def archive_path(self):
+        """归档模式下的输出文件"""
+        stem = os.path.splitext(os.path.basename(self.pdf_file))[0]
+        return os.path.join(self.output_folder, f"{stem}_parts.{self.archive}")
+
+    def part_path(self, index, label=None):
+        """第index部分的输出路径，label 非空时附加到文件名"""
+        output_filename = f"{os.path.splitext(os.path.basename(self.pdf_file))[0]}_part{index + 1:03d}"
+        if label and sanitize_filename(label):
+            output_filename += f"_{sanitize_filename(label)}"
+        return os.path.join(self.output_folder, output_filename + ".pdf")
+
+    def serialize_part(self, source, pages):
+        """将指定页序列化为一个新PDF文件的字节内容"""
+        if self.backend == BACKEND_RAW:
+            part_doc = fitz.open()
+            try:
+                source.copy_pages(part_doc, pages)
+                if self.stamper:
+                    self.stamper.stamp(part_doc, numbers=pages)
+                return RawPageCopier.to_bytes(part_doc)
+            finally:
+                part_doc.close()
+
+        pdf_writer = PyPDF2.PdfWriter()
+        for page_num in pages:
+            pdf_writer.add_page(source.pages[page_num])
+
+        buffer = io.BytesIO()
+        pdf_writer.write(buffer)
+        if self.stamper:
+            # 盖章由 MuPDF 完成，在本线程进行
+            return self.stamper.stamp_bytes(buffer.getvalue(), pages)
+        return buffer.getvalue()
+
+
+class PreflightThread(QThread):
+    """在后台并行检查文件列表，可选修复损坏的文件"""
+    file_checked = pyqtSignal(str, object)  # 文件路径, 诊断结果
+    file_repaired = pyqtSignal(str, str)  # 原文件路径, 修复副本路径
+    preflight_completed = pyqtSignal()
+    preflight_failed = pyqtSignal(str)
+
+    def __init__(self, pdf_files, cache, backend=BACKEND_RAW, repair=False, isolated=False, passwords=None,
+                 staging=None):
         super().__init__()
-        self.pdf_files = pdf_files
-        self.output_path = output_path
+        self.pdf_files = list(pdf_files)
+        self.cache = cache
+        self.passwords = passwords or PasswordProvider()
+        self.backend = backend
+        self.repair = repair
+        self.isolated = isolated
+        self.staging = staging  # 有本地暂存副本时检查副本
 
     def run(self):
         try:
-            pdf_merger = PyPDF2.PdfMerger()
-            total_files = len(self.pdf_files)
+            with ExitStack() as stack:
+                pool = stack.enter_context(IsolatedTaskPool()) if self.isolated else None
+                checker = PreflightChecker(self.cache, pool, passwords=self.passwords)
+                paths = self.pdf_files
+                if self.staging is not None:
+                    paths = self.staging.local_paths(self.pdf_files, wait=True)
+                    for pdf_file, path in zip(self.pdf_files, paths):
+                        self.passwords.share(pdf_file, path)
+                diagnoses = checker.check(
+                    paths, lambda index, diagnosis: self.file_checked.emit(self.pdf_files[index], diagnosis))
+
+                if self.repair:
+                    to_repair = [(pdf_file, path) for pdf_file, path, diagnosis in zip(self.pdf_files, paths, diagnoses)
+                                 if preflight_verdict(diagnosis, self.backend)[0] == CHECK_REPAIR]
+                    repaired = checker.repair([path for _, path in to_repair])
+                    for (pdf_file, _), (repaired_path, _) in zip(to_repair, repaired):
+                        if repaired_path is not None:
+                            self.file_repaired.emit(pdf_file, repaired_path)
+
+            self.preflight_completed.emit()
 
-            for i, pdf_file in enumerate(self.pdf_files):
-                pdf_merger.append(pdf_file)
-                progress = int((i + 1) / total_files * 100)
-                file_name = os.path.basename(pdf_file)
-                self.progress_updated.emit(progress, f"正在处理: {file_name}")
+        except Exception as e:
+            self.preflight_failed.emit(str(e))
 
-            with open(self.output_path, 'wb') as output_file:
-                pdf_merger.write(output_file)
 
-            pdf_merger.close()
+# ========== 页面网格 ==========
 
-            # 获取合并后的页数
-            total_pages = 0
-            with open(self.output_path, 'rb') as f:
-                pdf_reader = PyPDF2.PdfReader(f)
-                total_pages = len(pdf_reader.pages)
+THUMBNAIL_WIDTH = 120
+THUMBNAIL_HEIGHT = 160
+THUMBNAIL_DRAFT_HEIGHT = 40  # 先渲染的低分辨率草图高度（像素）
+THUMBNAIL_CACHE_SIZE = 512  # 缓存的缩略图数量上限
+THUMBNAIL_QUALITY_DRAFT = 0
+THUMBNAIL_QUALITY_FINAL = 1
 
-            self.merge_completed.emit(self.output_path, total_pages)
+_thumbnail_documents = OrderedDict()  # 渲染子进程内打开的文档
 
-        except Exception as e:
-            self.merge_failed.emit(str(e))
 
+def _render_thumbnail_worker(pdf_file, page_num, target_height, passwords=None):
+    """在渲染子进程中把一页渲染为RGB字节，返回 (宽, 高, 行字节数, 像素)
 
-class PDFSplitterThread(QThread):
-    """用于拆分PDF的后台线程"""
-    progress_updated = pyqtSignal(int, str)
-    split_completed = pyqtSignal(list)
-    split_failed = pyqtSignal(str)
+    已打开（已解密）的文档留在子进程中，同一文件的后续页面不再重复解密。
+    """
+    doc = _thumbnail_documents.get(pdf_file)
+    if doc is None:
+        doc = open_pdf_document(pdf_file, PasswordProvider.from_snapshot(passwords))
+        _thumbnail_documents[pdf_file] = doc
+        while len(_thumbnail_documents) > 4:
+            _thumbnail_documents.popitem(last=False)[1].close()
+    else:
+        _thumbnail_documents.move_to_end(pdf_file)
 
-    def __init__(self, pdf_file, output_folder, split_mode, split_value):
-        super().__init__()
+    page = doc[page_num]
+    zoom = target_height / max(page.rect.height, 1)
+    pix = page.get_pixmap(matrix=fitz.Matrix(zoom, zoom), colorspace=fitz.csRGB, alpha=False)
+    return pix.width, pix.height, pix.stride, pix.samples
+
+
+class ThumbnailRenderer(QObject):
+    """后台缩略图渲染池
+
+    MuPDF 不支持多线程并发渲染，因此使用进程池；每个子进程缓存已打开的文档。
+    滚动时取消尚未开始的任务，只有当前可见的页面会被重新请求。
+    """
+    thumbnail_ready = pyqtSignal(int, int, int, QImage)  # generation, page, quality, image
+    _result_ready = pyqtSignal(int, int, int, object)
+
+    def __init__(self, max_workers=None, parent=None):
+        super().__init__(parent)
+        self.max_workers = max_workers or max(1, min(4, (os.cpu_count() or 2) - 1))
+        self._executor = None
+        self._pending = {}
+        self.pdf_file = None
+        self.passwords = None
+        self.generation = 0
+        self._result_ready.connect(self._on_result)
+
+    def set_document(self, pdf_file, passwords=None):
+        self.cancel_pending()
         self.pdf_file = pdf_file
-        self.output_folder = output_folder
-        self.split_mode = split_mode  # 'page' 或 'range'
-        self.split_value = split_value  # 每几页或页数范围列表
+        self.passwords = passwords  # PasswordProvider.snapshot() 的结果
+        self.generation += 1
 
-    def run(self):
+    def request(self, page_num, quality):
+        key = (page_num, quality)
+        if self.pdf_file is None or key in self._pending:
+            return
+        if self._executor is None:
+            self._executor = ProcessPoolExecutor(max_workers=self.max_workers)
+
+        target_height = THUMBNAIL_DRAFT_HEIGHT if quality == THUMBNAIL_QUALITY_DRAFT else THUMBNAIL_HEIGHT
+        args = (self.pdf_file, page_num, target_height, self.passwords)
         try:
-            with open(self.pdf_file, 'rb') as f:
-                pdf_reader = PyPDF2.PdfReader(f)
-                total_pages = len(pdf_reader.pages)
-                output_files = []
+            future = self._executor.submit(_render_thumbnail_worker, *args)
+        except BrokenProcessPool:
+            # 渲染进程被异常页面弄崩溃时，换一个新的进程池
+            self._executor = ProcessPoolExecutor(max_workers=self.max_workers)
+            future = self._executor.submit(_render_thumbnail_worker, *args)
+        self._pending[key] = future
+        generation = self.generation
+        future.add_done_callback(
+            lambda f: self._result_ready.emit(generation, page_num, quality, f))
+
+    def cancel_pending(self):
+        """取消尚未开始的渲染任务"""
+        for future in self._pending.values():
+            future.cancel()
+        self._pending.clear()
+
+    def _on_result(self, generation, page_num, quality, future):
+        if generation != self.generation:
+            return
+        if self._pending.get((page_num, quality)) is future:
+            del self._pending[(page_num, quality)]
+        if future.cancelled() or future.exception() is not None:
+            return
 
-                if self.split_mode == 'page':
-                    # 按每几页拆分
-                    pages_per_file = self.split_value
-                    num_files = (total_pages + pages_per_file - 1) // pages_per_file
+        width, height, stride, samples = future.result()
+        image = QImage(samples, width, height, stride, QImage.Format_RGB888).copy()
+        self.thumbnail_ready.emit(generation, page_num, quality, image)
 
-                    for i in range(num_files):
-                        start_page = i * pages_per_file
-                        end_page = min((i + 1) * pages_per_file, total_pages)
+    def shutdown(self):
+        self.cancel_pending()
+        if self._executor is not None:
+            self._executor.shutdown(wait=False)
+            self._executor = None
 
-                        pdf_writer = PyPDF2.PdfWriter()
-                        for page_num in range(start_page, end_page):
-                            pdf_writer.add_page(pdf_reader.pages[page_num])
 
-                        output_filename = f"{os.path.splitext(os.path.basename(self.pdf_file))[0]}_part{i + 1:03d}.pdf"
-                        output_path = os.path.join(self.output_folder, output_filename)
+class PageThumbnailModel(QAbstractListModel):
+    """页面缩略图模型
 
-                        with open(output_path, 'wb') as output_file:
-                            pdf_writer.write(output_file)
+    只有视图实际绘制的行才会调用 data()，因此只渲染可见页面；先返回低分辨率
+    草图，草图就绪后再请求清晰版本。缩略图按LRU保留 cache_size 张。
+    """
 
-                        output_files.append(output_path)
+    def __init__(self, renderer, cache_size=THUMBNAIL_CACHE_SIZE, parent=None):
+        super().__init__(parent)
+        self.renderer = renderer
+        self.cache_size = cache_size
+        self.page_count = 0
+        self._cache = OrderedDict()  # page -> (quality, QPixmap)
+        self._placeholder = QPixmap(THUMBNAIL_WIDTH, THUMBNAIL_HEIGHT)
+        self._placeholder.fill(QColor(240, 240, 240))
+        renderer.thumbnail_ready.connect(self._on_thumbnail_ready)
+
+    def set_document(self, pdf_file, page_count, passwords=None):
+        self.beginResetModel()
+        self.renderer.set_document(pdf_file, passwords)
+        self.page_count = page_count
+        self._cache.clear()
+        self.endResetModel()
+
+    def rowCount(self, parent=QModelIndex()):
+        return 0 if parent.isValid() else self.page_count
+
+    def data(self, index, role=Qt.DisplayRole):
+        if not index.isValid():
+            return None
+        page_num = index.row()
+
+        if role == Qt.DisplayRole:
+            return str(page_num + 1)
+
+        if role == Qt.DecorationRole:
+            cached = self._cache.get(page_num)
+            if cached is None:
+                self.renderer.request(page_num, THUMBNAIL_QUALITY_DRAFT)
+                return self._placeholder
+            quality, pixmap = cached
+            self._cache.move_to_end(page_num)
+            if quality == THUMBNAIL_QUALITY_DRAFT:
+                self.renderer.request(page_num, THUMBNAIL_QUALITY_FINAL)
+            return pixmap
+
+        if role == Qt.SizeHintRole:
+            return QSize(THUMBNAIL_WIDTH + 16, THUMBNAIL_HEIGHT + 28)
+
+        return None
+
+    def _on_thumbnail_ready(self, generation, page_num, quality, image):
+        cached = self._cache.get(page_num)
+        if cached is not None and cached[0] > quality:
+            return
+
+        pixmap = QPixmap.fromImage(image).scaled(
+            THUMBNAIL_WIDTH, THUMBNAIL_HEIGHT, Qt.KeepAspectRatio,
+            Qt.SmoothTransformation if quality == THUMBNAIL_QUALITY_FINAL else Qt.FastTransformation)
+        self._cache[page_num] = (quality, pixmap)
+        self._cache.move_to_end(page_num)
+        while len(self._cache) > self.cache_size:
+            self._cache.popitem(last=False)
 
-                        progress = int((i + 1) / num_files * 100)
-                        self.progress_updated.emit(progress, f"正在拆分: 第{i + 1}/{num_files}部分")
+        index = self.index(page_num)
+        self.dataChanged.emit(index, index, [Qt.DecorationRole])
 
-                elif self.split_mode == 'range':
-                    # 按页数范围拆分
-                    for i, page_range in enumerate(self.split_value):
-                        pdf_writer = PyPDF2.PdfWriter()
 
-                        for page_num in page_range:
-                            if 0 <= page_num < total_pages:
-                                pdf_writer.add_page(pdf_reader.pages[page_num])
+class PageGridView(QListView):
+    """虚拟化的页面网格，点击/Shift点击选择页面并生成范围表达式"""
+    page_spec_changed = pyqtSignal(str)
 
-                        if len(pdf_writer.pages) > 0:
-                            output_filename = f"{os.path.splitext(os.path.basename(self.pdf_file))[0]}_part{i + 1:03d}.pdf"
-                            output_path = os.path.join(self.output_folder, output_filename)
+    def __init__(self, parent=None):
+        super().__init__(parent)
+        self.renderer = ThumbnailRenderer(parent=self)
+        self.thumbnail_model = PageThumbnailModel(self.renderer, parent=self)
+        self.setModel(self.thumbnail_model)
 
-                            with open(output_path, 'wb') as output_file:
-                                pdf_writer.write(output_file)
+        self.setViewMode(QListView.IconMode)
+        self.setUniformItemSizes(True)
+        self.setLayoutMode(QListView.Batched)
+        self.setBatchSize(200)
+        self.setResizeMode(QListView.Adjust)
+        self.setMovement(QListView.Static)
+        self.setWrapping(True)
+        self.setSpacing(6)
+        self.setIconSize(QSize(THUMBNAIL_WIDTH, THUMBNAIL_HEIGHT))
+        self.setGridSize(QSize(THUMBNAIL_WIDTH + 16, THUMBNAIL_HEIGHT + 28))
+        self.setSelectionMode(QAbstractItemView.ExtendedSelection)
+        self.setVerticalScrollMode(QAbstractItemView.ScrollPerPixel)
 
-                            output_files.append(output_path)
+        self.selectionModel().selectionChanged.connect(self._on_selection_changed)
+        # 滚动时丢弃已移出视野的排队任务，可见页会在重绘时重新请求
+        self.verticalScrollBar().valueChanged.connect(self.renderer.cancel_pending)
 
-                        progress = int((i + 1) / len(self.split_value) * 100)
-                        self.progress_updated.emit(progress, f"正在拆分: 第{i + 1}/{len(self.split_value)}个范围")
+    def set_document(self, pdf_file, page_count, passwords=None):
+        self.thumbnail_model.set_document(pdf_file, page_count, passwords)
 
-                self.split_completed.emit(output_files)
+    def selected_pages(self):
+        return sorted(index.row() for index in self.selectionModel().selectedIndexes())
 
-        except Exception as e:
-            self.split_failed.emit(str(e))
+    def selected_page_spec(self):
+        return format_page_spec(self.selected_pages())
+
+    def _on_selection_changed(self, selected, deselected):
+        self.page_spec_changed.emit(self.selected_page_spec())
+
+    def shutdown(self):
+        self.renderer.shutdown()
 
 
 class ModernPDFListWidget(QListWidget):
@@ -161,19 +4453,272 @@ class ModernPDFListWidget(QListWidget):
             super().dropEvent(event)
 
 
+class StampOptionsWidget(QGroupBox):
+    """水印和 Bates 编号选项，设置保存在以 key_prefix 开头的键下"""
+
+    POSITION_LABELS = {
+        'bottom-right': "右下角", 'bottom-center': "底部居中", 'bottom-left': "左下角",
+        'top-right': "右上角", 'top-center': "顶部居中", 'top-left': "左上角",
+    }
+
+    def __init__(self, settings, key_prefix, parent=None):
+        super().__init__("水印与编号", parent)
+        self.settings = settings
+        self.key_prefix = key_prefix
+        layout = QGridLayout(self)
+
+        self.watermark_check = QCheckBox("水印")
+        self.watermark_check.setChecked(self.setting("watermark", False, bool))
+        self.watermark_edit = QLineEdit(self.setting("watermark_text", "机密"))
+        self.watermark_edit.setToolTip("在每页中央叠加半透明的斜向文字；水印只生成一次，各页共用")
+        layout.addWidget(self.watermark_check, 0, 0)
+        layout.addWidget(self.watermark_edit, 0, 1, 1, 5)
+
+        self.bates_check = QCheckBox("Bates 编号")
+        self.bates_check.setChecked(self.setting("bates", False, bool))
+        self.bates_prefix_edit = QLineEdit(self.setting("bates_prefix", ""))
+        self.bates_prefix_edit.setPlaceholderText("前缀（ASCII）")
+        self.bates_start_spin = QSpinBox()
+        self.bates_start_spin.setRange(0, 999999999)
+        self.bates_start_spin.setValue(self.setting("bates_start", 1, int))
+        self.bates_digits_spin = QSpinBox()
+        self.bates_digits_spin.setRange(1, 12)
+        self.bates_digits_spin.setValue(self.setting("bates_digits", DEFAULT_BATES_DIGITS, int))
+        layout.addWidget(self.bates_check, 1, 0)
+        layout.addWidget(self.bates_prefix_edit, 1, 1)
+        layout.addWidget(QLabel("起始"), 1, 2)
+        layout.addWidget(self.bates_start_spin, 1, 3)
+        layout.addWidget(QLabel("位数"), 1, 4)
+        layout.addWidget(self.bates_digits_spin, 1, 5)
+
+        self.position_combo = QComboBox()
+        for position in STAMP_POSITIONS:
+            self.position_combo.addItem(self.POSITION_LABELS[position], position)
+        self.position_combo.setCurrentIndex(
+            max(0, self.position_combo.findData(self.setting("position", DEFAULT_STAMP_POSITION))))
+        layout.addWidget(QLabel("编号位置"), 2, 0)
+        layout.addWidget(self.position_combo, 2, 1, 1, 5)
+
+        self.watermark_check.toggled.connect(self.watermark_edit.setEnabled)
+        self.watermark_edit.setEnabled(self.watermark_check.isChecked())
+        for widget in (self.bates_prefix_edit, self.bates_start_spin, self.bates_digits_spin, self.position_combo):
+            self.bates_check.toggled.connect(widget.setEnabled)
+            widget.setEnabled(self.bates_check.isChecked())
+
+    def setting(self, name, default, value_type=str):
+        return self.settings.value(f"{self.key_prefix}_{name}", default, type=value_type)
+
+    def save_settings(self):
+        values = {
+            "watermark": self.watermark_check.isChecked(), "watermark_text": self.watermark_edit.text(),
+            "bates": self.bates_check.isChecked(), "bates_prefix": self.bates_prefix_edit.text(),
+            "bates_start": self.bates_start_spin.value(), "bates_digits": self.bates_digits_spin.value(),
+            "position": self.position_combo.currentData(),
+        }
+        for name, value in values.items():
+            self.settings.setValue(f"{self.key_prefix}_{name}", value)
+
+    def stamper(self):
+        """按当前选项生成 PageStamper，都未勾选时返回 None；选项不合法时抛出 ValueError"""
+        watermark = self.watermark_edit.text().strip() if self.watermark_check.isChecked() else None
+        if self.watermark_check.isChecked() and not watermark:
+            raise ValueError("请输入水印文字")
+        bates_prefix = self.bates_prefix_edit.text() if self.bates_check.isChecked() else None
+        if watermark is None and bates_prefix is None:
+            return None
+        return PageStamper(watermark, bates_prefix, self.bates_start_spin.value(),
+                           self.bates_digits_spin.value(), self.position_combo.currentData())
+
+
+class BlankFilterOptions(QWidget):
+    """去掉空白页的开关和判定阈值，设置保存在以 key_prefix 开头的键下"""
+
+    def __init__(self, settings, key_prefix, text, parent=None):
+        super().__init__(parent)
+        self.settings = settings
+        self.key_prefix = key_prefix
+        layout = QHBoxLayout(self)
+        layout.setContentsMargins(0, 0, 0, 0)
+
+        self.check = QCheckBox(text)
+        self.check.setChecked(settings.value(f"{key_prefix}_enabled", False, type=bool))
+        self.ink_spin = self.create_ink_spin(
+            settings.value(f"{key_prefix}_ink_percent", DEFAULT_BLANK_INK_RATIO * 100, type=float))
+        self.std_spin = self.create_std_spin(
+            settings.value(f"{key_prefix}_max_std", DEFAULT_BLANK_MAX_STD, type=float))
+        layout.addWidget(self.check)
+        layout.addWidget(QLabel("墨迹低于"))
+        layout.addWidget(self.ink_spin)
+        layout.addWidget(QLabel("标准差不超过"))
+        layout.addWidget(self.std_spin)
+        layout.addStretch()
+
+        for widget in (self.ink_spin, self.std_spin):
+            self.check.toggled.connect(widget.setEnabled)
+            widget.setEnabled(self.check.isChecked())
+
+    @staticmethod
+    def create_ink_spin(value=DEFAULT_BLANK_INK_RATIO * 100):
+        spin = QDoubleSpinBox()
+        spin.setRange(0.0, 10.0)
+        spin.setDecimals(2)
+        spin.setSingleStep(0.05)
+        spin.setValue(value)
+        spin.setSuffix(" %")
+        spin.setToolTip("比纸张底色明显更暗的像素占比低于此值的页面视为空白")
+        return spin
+
+    @staticmethod
+    def create_std_spin(value=DEFAULT_BLANK_MAX_STD):
+        spin = QDoubleSpinBox()
+        spin.setRange(0.0, 100.0)
+        spin.setDecimals(1)
+        spin.setValue(value)
+        spin.setToolTip("页面灰度的标准差高于此值时说明有浅色文字或图案，不视为空白；"
+                        "调大可容忍更多扫描噪点和透印（需要安装 numpy）")
+        return spin
+
+    def blank_filter(self):
+        """勾选时返回 BlankPageFilter，否则返回 None"""
+        if not self.check.isChecked():
+            return None
+        return BlankPageFilter(self.ink_spin.value() / 100, self.std_spin.value())
+
+    def save_settings(self):
+        self.settings.setValue(f"{self.key_prefix}_enabled", self.check.isChecked())
+        self.settings.setValue(f"{self.key_prefix}_ink_percent", self.ink_spin.value())
+        self.settings.setValue(f"{self.key_prefix}_max_std", self.std_spin.value())
+
+
+class DuplicatePageOptions(QWidget):
+    """检测近似重复页的开关、汉明距离上限和是否去掉，设置保存在以 key_prefix 开头的键下"""
+
+    def __init__(self, settings, key_prefix, parent=None):
+        super().__init__(parent)
+        self.settings = settings
+        self.key_prefix = key_prefix
+        layout = QHBoxLayout(self)
+        layout.setContentsMargins(0, 0, 0, 0)
+
+        self.check = QCheckBox("检测重复页")
+        self.distance_spin = QSpinBox()
+        self.distance_spin.setRange(0, 128)
+        self.distance_spin.setValue(settings.value(f"{key_prefix}_distance", DEFAULT_DUPLICATE_DISTANCE, type=int))
+        self.distance_spin.setToolTip("两页感知哈希（256位）不同的位数不超过此值时视为重复；"
+                                      "0 只找完全相同的页面，调大可容忍更多扫描差异")
+        self.remove_check = QCheckBox("去掉重复页")
+        self.remove_check.setChecked(settings.value(f"{key_prefix}_remove", False, type=bool))
+        self.remove_check.setToolTip("只保留最早的一页；不勾选时只在合并结果中列出重复页")
+        layout.addWidget(self.check)
+        layout.addWidget(QLabel("距离不超过"))
+        layout.addWidget(self.distance_spin)
+        layout.addWidget(self.remove_check)
+        layout.addStretch()
+
+        if importlib.util.find_spec("numpy") is not None:
+            self.check.setToolTip("合并前比较所选页面的低分辨率渲染，找出重新扫描或重复转发的页面，"
+                                  "结果列在合并结果中")
+            self.check.setChecked(settings.value(f"{key_prefix}_enabled", False, type=bool))
+        else:
+            self.check.setToolTip("需要安装 numpy（pip install numpy）")
+            self.check.setEnabled(False)
+        for widget in (self.distance_spin, self.remove_check):
+            self.check.toggled.connect(widget.setEnabled)
+            widget.setEnabled(self.check.isChecked())
+
+    def finder(self):
+        """勾选时返回 DuplicatePageFinder，否则返回 None"""
+        if not self.check.isChecked():
+            return None
+        return DuplicatePageFinder(self.distance_spin.value(), self.remove_check.isChecked())
+
+    def save_settings(self):
+        self.settings.setValue(f"{self.key_prefix}_enabled", self.check.isChecked())
+        self.settings.setValue(f"{self.key_prefix}_distance", self.distance_spin.value())
+        self.settings.setValue(f"{self.key_prefix}_remove", self.remove_check.isChecked())
+
+
+class ImageOptionsWidget(QWidget):
+    """压缩图像的开关、目标分辨率、格式和 JPEG 质量，设置保存在以 key_prefix 开头的键下"""
+
+    def __init__(self, settings, key_prefix, parent=None):
+        super().__init__(parent)
+        self.settings = settings
+        self.key_prefix = key_prefix
+        layout = QHBoxLayout(self)
+        layout.setContentsMargins(0, 0, 0, 0)
+
+        self.check = QCheckBox("压缩图像")
+        self.check.setToolTip("把有效分辨率高于目标的扫描图像缩小并重新压缩，相同的图像只处理一次")
+        self.check.setChecked(settings.value(f"{key_prefix}_enabled", False, type=bool))
+        self.dpi_spin = QSpinBox()
+        self.dpi_spin.setRange(36, 1200)
+        self.dpi_spin.setSuffix(" DPI")
+        self.dpi_spin.setValue(settings.value(f"{key_prefix}_dpi", DEFAULT_IMAGE_DPI, type=int))
+        self.dpi_spin.setToolTip("有效分辨率高于此值 1.5 倍的图像缩小到此分辨率")
+        self.format_combo = QComboBox()
+        for label, image_format in (("自动", 'auto'), ("JPEG", 'jpeg'), ("无损", 'flate')):
+            self.format_combo.addItem(label, image_format)
+        self.format_combo.setToolTip("自动：原来是 JPEG 的仍用 JPEG，其余用无损的 Flate 压缩")
+        index = self.format_combo.findData(settings.value(f"{key_prefix}_format", 'auto'))
+        self.format_combo.setCurrentIndex(max(index, 0))
+        self.quality_spin = QSpinBox()
+        self.quality_spin.setRange(1, 100)
+        self.quality_spin.setValue(settings.value(f"{key_prefix}_quality", DEFAULT_IMAGE_QUALITY, type=int))
+        self.quality_spin.setToolTip("JPEG 质量")
+        layout.addWidget(self.check)
+        layout.addWidget(self.dpi_spin)
+        layout.addWidget(self.format_combo)
+        layout.addWidget(QLabel("质量"))
+        layout.addWidget(self.quality_spin)
+        layout.addStretch()
+
+        for widget in (self.dpi_spin, self.format_combo, self.quality_spin):
+            self.check.toggled.connect(widget.setEnabled)
+            widget.setEnabled(self.check.isChecked())
+
+    def optimizer(self):
+        """勾选时返回 ImageOptimizer，否则返回 None"""
+        if not self.check.isChecked():
+            return None
+        return ImageOptimizer(self.dpi_spin.value(), self.format_combo.currentData(), self.quality_spin.value())
+
+    def save_settings(self):
+        self.settings.setValue(f"{self.key_prefix}_enabled", self.check.isChecked())
+        self.settings.setValue(f"{self.key_prefix}_dpi", self.dpi_spin.value())
+        self.settings.setValue(f"{self.key_prefix}_format", self.format_combo.currentData())
+        self.settings.setValue(f"{self.key_prefix}_quality", self.quality_spin.value())
+
+
+OPEN_DOCUMENT_CACHE_SIZE = 8  # 界面线程保持打开的文档数量
+
+
 class PDFToolsApp(QMainWindow):
     def __init__(self):
         super().__init__()
         self.pdf_files = []
+        self.merge_page_options = {}  # 文件路径 -> (页面范围表达式或None, 旋转角度)
+        self._isolated_pool = None
+        self.metadata_cache = MetadataCache()
+        self.password_provider = PasswordProvider()
+        self.open_documents = OrderedDict()  # (路径, 修改时间) -> 已解密的文档
+        self.preflight_results = {}  # 文件路径 -> 诊断结果
+        self.preflight_thread = None
+        self.repaired_count = 0
         self.current_tab = "merge"  # "merge" 或 "split"
         self.settings = QSettings("PDFTools", "PDFMerger")
+        self.staging = self.create_staging() if self.settings.value("staging_enabled", False, type=bool) else None
+        self.output_cache = OutputCache(metadata=self.metadata_cache) \
+            if self.settings.value("output_cache_enabled", False, type=bool) else None
+        self.linearize_available = linearize_backend() is not None
 
         # 拆分功能相关的变量
         self.split_file_path = None
         self.output_folder_path = None
 
-        self.initUI()
+        # 先设置样式表再创建控件，避免所有控件被重新polish一遍
         self.apply_stylesheet()
+        self.initUI()
 
     def initUI(self):
         """初始化用户界面"""
@@ -200,8 +4745,11 @@ class PDFToolsApp(QMainWindow):
         self.merge_tab = self.create_merge_tab()
         self.tab_widget.addTab(self.merge_tab, "PDF合并")
 
-        # 拆分标签页
-        self.split_tab = self.create_split_tab()
+        # 拆分标签页：先放占位控件，首次切换到该页时再构建
+        self.split_tab = QWidget()
+        split_tab_layout = QVBoxLayout(self.split_tab)
+        split_tab_layout.setContentsMargins(0, 0, 0, 0)
+        self.split_tab_built = False
         self.tab_widget.addTab(self.split_tab, "PDF拆分")
 
         main_layout.addWidget(self.tab_widget, 1)
@@ -215,6 +4763,33 @@ class PDFToolsApp(QMainWindow):
         # 创建状态栏
         self.statusBar().showMessage("就绪")
 
+        # 进程隔离：异常PDF只会结束子进程，不影响程序本身
+        self.isolation_check = QCheckBox("隔离进程处理")
+        self.isolation_check.setToolTip("在独立子进程中合并、拆分、统计页数和渲染预览，"
+                                        "异常PDF导致的崩溃或超时只影响对应文件")
+        self.isolation_check.setChecked(self.settings.value("isolated_workers", False, type=bool))
+        self.statusBar().addPermanentWidget(self.isolation_check)
+
+        # 网络存储上的文件先在后台复制到本地，之后的读取都使用本地副本
+        self.staging_check = QCheckBox("本地缓存网络文件")
+        self.staging_check.setToolTip("把SMB/NFS等网络存储上的输入文件在后台复制到本地缓存，"
+                                      "统计页数、预览、检查和合并拆分都读取本地副本")
+        self.staging_check.setChecked(self.staging is not None)
+        self.statusBar().addPermanentWidget(self.staging_check)
+
+        # 输入内容和选项都相同的合并、拆分直接复用上次的输出
+        self.output_cache_check = QCheckBox("复用相同作业的输出")
+        self.output_cache_check.setToolTip("按输入文件内容、页面方案和选项识别重复的作业，"
+                                           "直接使用缓存中上次的结果，不重新合并或拆分")
+        self.output_cache_check.setChecked(self.output_cache is not None)
+        self.statusBar().addPermanentWidget(self.output_cache_check)
+
+        # 加密文件密码（只保存在内存中）
+        self.password_button = QPushButton("🔑 密码")
+        self.password_button.setFlat(True)
+        self.password_button.setToolTip("输入加密PDF的候选密码，本次运行中用于所有文件")
+        self.statusBar().addPermanentWidget(self.password_button)
+
         # 连接信号
         self.connect_signals()
 
@@ -226,57 +4801,7 @@ class PDFToolsApp(QMainWindow):
 
     def create_icon(self):
         """创建简单的红色PDF文档图标"""
-        icon = QIcon()
-
-        sizes = [16, 24, 32, 48, 64, 128, 256]
-
-        for size in sizes:
-            pixmap = QPixmap(size, size)
-            pixmap.fill(Qt.transparent)
-
-            painter = QPainter(pixmap)
-            painter.setRenderHint(QPainter.Antialiasing)
-
-            # 红色PDF图标
-            red_color = QColor(220, 50, 50)
-
-            # 绘制文档形状
-            margin = size * 0.15
-            doc_width = size - 2 * margin
-            doc_height = doc_width * 1.2  # 略高的矩形
-
-            # 文档主体
-            painter.setBrush(QBrush(red_color))
-            painter.setPen(QPen(red_color.darker(130), max(1, size * 0.02)))
-            painter.drawRoundedRect(int(margin), int(margin),
-                                    int(doc_width), int(doc_height),
-                                    int(size * 0.1), int(size * 0.1))
-
-            # 文档折角
-            fold_size = min(doc_width * 0.3, doc_height * 0.3)
-            painter.setBrush(QBrush(red_color.darker(120)))
-            fold_points = [
-                QPoint(int(margin + doc_width - fold_size), int(margin)),
-                QPoint(int(margin + doc_width), int(margin)),
-                QPoint(int(margin + doc_width), int(margin + fold_size))
-            ]
-            painter.drawPolygon(fold_points)
-
-            # 在中心绘制白色"P"
-            painter.setPen(QPen(Qt.white, max(1, size * 0.02)))
-            font_size = int(size * 0.3)
-            font = QFont("Arial", font_size, QFont.Bold)
-            painter.setFont(font)
-            text = "P"
-            text_rect = painter.fontMetrics().boundingRect(text)
-            text_x = int((size - text_rect.width()) / 2)
-            text_y = int((size + text_rect.height()) / 2)
-            painter.drawText(text_x, text_y, text)
-
-            painter.end()
-            icon.addPixmap(pixmap)
-
-        return icon
+        return app_icon()
 
     def create_merge_tab(self):
         """创建合并标签页"""
@@ -363,6 +4888,71 @@ class PDFToolsApp(QMainWindow):
 
         left_layout.addLayout(order_layout)
 
+        # 页面级合并方案
+        plan_layout = QHBoxLayout()
+        self.page_options_button = self.create_styled_button("页面/旋转", "#16a085", "📑")
+        self.save_plan_button = self.create_styled_button("保存方案", "#16a085", "💾")
+        self.load_plan_button = self.create_styled_button("载入方案", "#16a085", "📂")
+        self.repair_button = self.create_styled_button("修复文件", "#16a085", "🔧")
+        self.repair_button.setToolTip("用MuPDF重建交叉引用表，列表中的文件替换为修复后的副本")
+        plan_layout.addWidget(self.page_options_button)
+        plan_layout.addWidget(self.save_plan_button)
+        plan_layout.addWidget(self.load_plan_button)
+        plan_layout.addWidget(self.repair_button)
+        left_layout.addLayout(plan_layout)
+
+        # 原始流直通复制
+        self.merge_raw_copy_check = QCheckBox("原始流直通复制（更快，不解压/重新压缩图像和内容流）")
+        self.merge_raw_copy_check.setChecked(True)
+        left_layout.addWidget(self.merge_raw_copy_check)
+
+        # 书签选项
+        self.merge_file_outline_check = QCheckBox("为每个文件生成书签（以文件名命名）")
+        self.merge_file_outline_check.setChecked(self.settings.value("merge_file_outline", False, type=bool))
+        left_layout.addWidget(self.merge_file_outline_check)
+
+        self.merge_keep_outline_check = QCheckBox("保留原文件书签")
+        self.merge_keep_outline_check.setChecked(self.settings.value("merge_keep_outline", True, type=bool))
+        left_layout.addWidget(self.merge_keep_outline_check)
+
+        # 容错合并
+        self.merge_tolerant_check = QCheckBox("容错合并（修复或跳过损坏的文件，生成报告）")
+        self.merge_tolerant_check.setChecked(self.settings.value("merge_tolerant", False, type=bool))
+        left_layout.addWidget(self.merge_tolerant_check)
+
+        # 追加到已有文件
+        self.merge_append_check = QCheckBox("追加到已有的PDF末尾（增量更新，只写入新页面）")
+        self.merge_append_check.setToolTip("不重写已有文件，新页面和书签以增量更新方式写在文件末尾，"
+                                           "大文件也能很快完成；总是使用原始流直通复制")
+        self.merge_append_check.setChecked(self.settings.value("merge_append", False, type=bool))
+        left_layout.addWidget(self.merge_append_check)
+
+        # 线性化输出（与追加互斥）
+        self.merge_linearize_check = self.create_linearize_check("线性化输出（快速网页浏览）", "merge_linearize")
+        left_layout.addWidget(self.merge_linearize_check)
+        self.merge_append_check.toggled.connect(
+            lambda checked: checked and self.merge_linearize_check.setChecked(False))
+        self.merge_linearize_check.toggled.connect(
+            lambda checked: checked and self.merge_append_check.setChecked(False))
+
+        # 去掉空白页
+        self.merge_blank_options = BlankFilterOptions(self.settings, "merge_remove_blank", "去掉空白页")
+        self.merge_blank_options.check.setToolTip("合并前检测所选页面，去掉空白页（如双面扫描的空白背面），"
+                                                  "去掉的页面列在合并结果中")
+        left_layout.addWidget(self.merge_blank_options)
+
+        # 近似重复页
+        self.merge_duplicate_options = DuplicatePageOptions(self.settings, "merge_duplicates")
+        left_layout.addWidget(self.merge_duplicate_options)
+
+        # 压缩扫描图像
+        self.merge_image_options = ImageOptionsWidget(self.settings, "merge_images")
+        left_layout.addWidget(self.merge_image_options)
+
+        # 水印与 Bates 编号
+        self.merge_stamp_options = StampOptionsWidget(self.settings, "merge_stamp")
+        left_layout.addWidget(self.merge_stamp_options)
+
         # 合并按钮
         self.merge_button = self.create_styled_button("开始合并", "#2c3e50", "🔗")
         self.merge_button.setStyleSheet("""
@@ -493,6 +5083,22 @@ class PDFToolsApp(QMainWindow):
         self.split_mode_group.addButton(self.mode_page_ranges)
         mode_layout.addWidget(self.mode_page_ranges)
 
+        self.mode_outline = QRadioButton("按书签拆分")
+        self.split_mode_group.addButton(self.mode_outline)
+        mode_layout.addWidget(self.mode_outline)
+
+        self.mode_blank = QRadioButton("按空白分隔页拆分")
+        self.split_mode_group.addButton(self.mode_blank)
+        mode_layout.addWidget(self.mode_blank)
+
+        self.mode_size = QRadioButton("按文件大小拆分")
+        self.split_mode_group.addButton(self.mode_size)
+        mode_layout.addWidget(self.mode_size)
+
+        self.mode_text = QRadioButton("按页面文本拆分")
+        self.split_mode_group.addButton(self.mode_text)
+        mode_layout.addWidget(self.mode_text)
+
         mode_group.setLayout(mode_layout)
         left_layout.addWidget(mode_group)
 
@@ -523,7 +5129,7 @@ class PDFToolsApp(QMainWindow):
         page_ranges_layout = QVBoxLayout(self.page_ranges_widget)
         page_ranges_layout.setContentsMargins(0, 0, 0, 0)
 
-        self.page_ranges_label = QLabel("输入页数范围，每行一个范围，如：\n1-5\n6-10\n或单个页码：\n15")
+        self.page_ranges_label = QLabel(PAGE_RANGES_HELP)
         self.page_ranges_label.setStyleSheet("color: #6c757d; font-size: 12px;")
         page_ranges_layout.addWidget(self.page_ranges_label)
 
@@ -535,6 +5141,66 @@ class PDFToolsApp(QMainWindow):
         settings_layout.addWidget(self.page_ranges_widget)
         self.page_ranges_widget.setVisible(False)
 
+        # 书签层级设置
+        self.outline_widget = QWidget()
+        outline_layout = QHBoxLayout(self.outline_widget)
+        outline_layout.setContentsMargins(0, 0, 0, 0)
+        outline_layout.addWidget(QLabel("在第"))
+        self.outline_level_spin = QSpinBox()
+        self.outline_level_spin.setRange(1, 9)
+        self.outline_level_spin.setValue(1)
+        outline_layout.addWidget(self.outline_level_spin)
+        outline_layout.addWidget(QLabel("级及以上书签处拆分"))
+        outline_layout.addStretch()
+        settings_layout.addWidget(self.outline_widget)
+        self.outline_widget.setVisible(False)
+
+        # 空白页阈值设置
+        self.blank_widget = QWidget()
+        blank_layout = QHBoxLayout(self.blank_widget)
+        blank_layout.setContentsMargins(0, 0, 0, 0)
+        blank_layout.addWidget(QLabel("墨迹占比低于"))
+        self.blank_ratio_spin = BlankFilterOptions.create_ink_spin()
+        blank_layout.addWidget(self.blank_ratio_spin)
+        blank_layout.addWidget(QLabel("且标准差不超过"))
+        self.blank_std_spin = BlankFilterOptions.create_std_spin()
+        blank_layout.addWidget(self.blank_std_spin)
+        blank_layout.addWidget(QLabel("的页面作为分隔页"))
+        blank_layout.addStretch()
+        settings_layout.addWidget(self.blank_widget)
+        self.blank_widget.setVisible(False)
+
+        # 文件大小设置
+        self.size_widget = QWidget()
+        size_layout = QHBoxLayout(self.size_widget)
+        size_layout.setContentsMargins(0, 0, 0, 0)
+        size_layout.addWidget(QLabel("每个文件不超过"))
+        self.max_part_size_spin = QDoubleSpinBox()
+        self.max_part_size_spin.setRange(0.1, 100000.0)
+        self.max_part_size_spin.setDecimals(1)
+        self.max_part_size_spin.setValue(10.0)
+        self.max_part_size_spin.setSuffix(" MB")
+        size_layout.addWidget(self.max_part_size_spin)
+        size_layout.addStretch()
+        settings_layout.addWidget(self.size_widget)
+        self.size_widget.setVisible(False)
+
+        # 文本规则设置
+        self.text_widget = QWidget()
+        text_layout = QVBoxLayout(self.text_widget)
+        text_layout.setContentsMargins(0, 0, 0, 0)
+        text_hint = QLabel("页面文本匹配以下正则表达式时开始新的文件")
+        text_hint.setStyleSheet("color: #6c757d; font-size: 12px;")
+        text_layout.addWidget(text_hint)
+        self.text_pattern_edit = QLineEdit(self.settings.value("split_text_pattern", ""))
+        self.text_pattern_edit.setPlaceholderText(r"例如：Invoice No\.\s*(\d+)")
+        text_layout.addWidget(self.text_pattern_edit)
+        self.text_name_check = QCheckBox("用捕获组（或整个匹配）命名各文件")
+        self.text_name_check.setChecked(self.settings.value("split_text_name", False, type=bool))
+        text_layout.addWidget(self.text_name_check)
+        settings_layout.addWidget(self.text_widget)
+        self.text_widget.setVisible(False)
+
         settings_group.setLayout(settings_layout)
         left_layout.addWidget(settings_group)
 
@@ -559,9 +5225,51 @@ class PDFToolsApp(QMainWindow):
         """)
         output_layout.addWidget(self.output_folder_label)
 
+        self.split_raw_copy_check = QCheckBox("原始流直通复制（更快，不解压/重新压缩图像和内容流）")
+        self.split_raw_copy_check.setChecked(True)
+        output_layout.addWidget(self.split_raw_copy_check)
+
+        # 写入缓冲：尚未落盘的数据上限，慢速网络存储可调大
+        inflight_layout = QHBoxLayout()
+        inflight_layout.addWidget(QLabel("写入缓冲上限"))
+        self.inflight_spin = QSpinBox()
+        self.inflight_spin.setRange(1, 4096)
+        self.inflight_spin.setValue(int(self.settings.value("split_inflight_mb", DEFAULT_INFLIGHT_BYTES // (1024 * 1024))))
+        self.inflight_spin.setSuffix(" MB")
+        inflight_layout.addWidget(self.inflight_spin)
+        inflight_layout.addStretch()
+        output_layout.addLayout(inflight_layout)
+
+        # 输出方式：部分很多时写入一个归档，避免网络存储上逐个文件的开销
+        archive_layout = QHBoxLayout()
+        archive_layout.addWidget(QLabel("输出方式"))
+        self.split_archive_combo = QComboBox()
+        self.split_archive_combo.addItem("单独的PDF文件", "")
+        self.split_archive_combo.addItem("ZIP 压缩包", "zip")
+        self.split_archive_combo.addItem("TAR 归档", "tar")
+        self.split_archive_combo.setCurrentIndex(
+            max(0, self.split_archive_combo.findData(self.settings.value("split_archive", ""))))
+        archive_layout.addWidget(self.split_archive_combo)
+        archive_layout.addStretch()
+        output_layout.addLayout(archive_layout)
+
+        self.split_linearize_check = self.create_linearize_check("各部分线性化（快速网页浏览）", "split_linearize")
+        output_layout.addWidget(self.split_linearize_check)
+
+        self.split_blank_options = BlankFilterOptions(self.settings, "split_remove_blank", "去掉空白页")
+        self.split_blank_options.check.setToolTip("各部分中不输出空白页（如双面扫描的空白背面）")
+        output_layout.addWidget(self.split_blank_options)
+
+        self.split_image_options = ImageOptionsWidget(self.settings, "split_images")
+        output_layout.addWidget(self.split_image_options)
+
         output_group.setLayout(output_layout)
         left_layout.addWidget(output_group)
 
+        # 水印与 Bates 编号，编号沿用原文件中的页码
+        self.split_stamp_options = StampOptionsWidget(self.settings, "split_stamp")
+        left_layout.addWidget(self.split_stamp_options)
+
         # 拆分按钮
         self.split_button = self.create_styled_button("开始拆分", "#e74c3c", "✂️")
         self.split_button.setStyleSheet("""
@@ -618,7 +5326,26 @@ class PDFToolsApp(QMainWindow):
         split_preview_layout.addWidget(self.split_preview_info)
 
         split_preview_group.setLayout(split_preview_layout)
-        right_layout.addWidget(split_preview_group, 1)
+
+        # 页面网格：显示全部页面，选择页面生成范围
+        page_grid_group = QWidget()
+        page_grid_layout = QVBoxLayout(page_grid_group)
+
+        self.page_grid = PageGridView()
+        page_grid_layout.addWidget(self.page_grid, 1)
+
+        self.page_grid_spec_label = QLabel("点击或Shift/Ctrl点击选择页面")
+        self.page_grid_spec_label.setWordWrap(True)
+        page_grid_layout.addWidget(self.page_grid_spec_label)
+
+        self.add_grid_range_button = self.create_styled_button("将所选页添加为一个范围", "#2ecc71", "➕")
+        self.add_grid_range_button.setEnabled(False)
+        page_grid_layout.addWidget(self.add_grid_range_button)
+
+        preview_tabs = QTabWidget()
+        preview_tabs.addTab(split_preview_group, "首页预览")
+        preview_tabs.addTab(page_grid_group, "页面网格")
+        right_layout.addWidget(preview_tabs, 1)
 
         # 添加面板到分割器
         splitter.addWidget(left_panel)
@@ -761,17 +5488,40 @@ class PDFToolsApp(QMainWindow):
         self.move_top_button.clicked.connect(self.move_item_top)
         self.move_bottom_button.clicked.connect(self.move_item_bottom)
 
+        self.page_options_button.clicked.connect(self.edit_page_options)
+        self.save_plan_button.clicked.connect(self.save_merge_plan)
+        self.load_plan_button.clicked.connect(self.load_merge_plan)
+        self.repair_button.clicked.connect(self.repair_pdf_files)
+        self.merge_raw_copy_check.toggled.connect(lambda: self.update_file_list())
+
         self.file_list.itemSelectionChanged.connect(self.on_selection_changed)
         self.file_list.itemDoubleClicked.connect(self.on_item_double_clicked)
 
-        # 拆分标签页信号
+        # 标签页切换信号
+        self.tab_widget.currentChanged.connect(self.on_tab_changed)
+        self.isolation_check.toggled.connect(self.on_isolation_toggled)
+        self.staging_check.toggled.connect(self.on_staging_toggled)
+        self.output_cache_check.toggled.connect(self.on_output_cache_toggled)
+        self.password_button.clicked.connect(self.enter_password)
+
+    def connect_split_signals(self):
+        """连接拆分标签页的信号和槽"""
         self.split_file_button.clicked.connect(self.select_split_file)
-        self.mode_every_page.toggled.connect(self.on_split_mode_changed)
+        for mode_button in self.split_mode_group.buttons():
+            mode_button.toggled.connect(self.on_split_mode_changed)
         self.output_folder_button.clicked.connect(self.select_output_folder)
         self.split_button.clicked.connect(self.split_pdf)
+        self.page_grid.page_spec_changed.connect(self.on_page_grid_selection_changed)
+        self.add_grid_range_button.clicked.connect(self.add_page_grid_range)
 
-        # 标签页切换信号
-        self.tab_widget.currentChanged.connect(self.on_tab_changed)
+    def ensure_split_tab(self):
+        """首次使用时构建拆分标签页"""
+        if self.split_tab_built:
+            return
+        self.split_tab_built = True
+        self.split_tab.layout().addWidget(self.create_split_tab())
+        self.connect_split_signals()
+        self.update_split_button_state()
 
     def on_tab_changed(self, index):
         """标签页切换时更新当前标签"""
@@ -779,6 +5529,7 @@ class PDFToolsApp(QMainWindow):
             self.current_tab = "merge"
         else:
             self.current_tab = "split"
+            self.ensure_split_tab()
 
     # ========== 合并功能相关方法 ==========
 
@@ -928,36 +5679,204 @@ class PDFToolsApp(QMainWindow):
             self.file_list.setCurrentRow(len(self.pdf_files) - 1)
 
     def update_file_list(self):
-        """更新文件列表显示"""
+        """更新文件列表显示，尚未检查的文件在后台检查"""
         self.file_list.clear()
+        for i, file_path in enumerate(self.pdf_files):
+            item = QListWidgetItem(self.file_item_text(i, file_path))
+            item.setData(Qt.UserRole, file_path)
+            self.file_list.addItem(item)
+
+        self.update_file_count_label()
+        self.start_preflight()
+
+    def file_item_text(self, index, file_path):
+        """文件列表中一项的显示文本：大小、页数、检查结果和页面设置"""
+        file_name = os.path.basename(file_path)
+        try:
+            size_str = self.format_file_size(os.path.getsize(file_path))
+        except OSError:
+            return f"{index + 1}. {file_name} (文件不存在)"
+
+        diagnosis = self.preflight_results.get(file_path)
+        if diagnosis is None:
+            item_text = f"{index + 1}. {file_name} ({size_str}, 检查中…)"
+        elif diagnosis["pages"]:
+            item_text = f"{index + 1}. {file_name} ({size_str}, {diagnosis['pages']}页)"
+        else:
+            item_text = f"{index + 1}. {file_name} ({size_str})"
+        if diagnosis is not None:
+            problems = dict(diagnosis["problems"])
+            if self.merge_raw_copy_check.isChecked():
+                problems.pop(PROBLEM_PYPDF2, None)  # 原始流后端不使用PyPDF2
+            if problems:
+                item_text += f" ⚠ {'；'.join(problems.values())}"
+
+        page_spec, rotate = self.merge_page_options.get(file_path, (None, 0))
+        if page_spec or rotate:
+            item_text += f" [页: {page_spec or '全部'}{f', 旋转{rotate}°' if rotate else ''}]"
+        return item_text
+
+    def update_file_count_label(self):
         total_size = 0
-        total_pages = 0
+        for file_path in self.pdf_files:
+            try:
+                total_size += os.path.getsize(file_path)
+            except OSError:
+                pass
+        total_pages = sum(self.preflight_results[file_path]["pages"]
+                          for file_path in self.pdf_files if file_path in self.preflight_results)
+        total_size_str = self.format_file_size(total_size)
+        self.file_count_label.setText(f"{len(self.pdf_files)} 个文件 | 总大小: {total_size_str} | 总页数: {total_pages}页")
 
-        for i, file_path in enumerate(self.pdf_files):
-            file_name = os.path.basename(file_path)
+    def start_preflight(self, repair=False):
+        """在后台检查尚无结果的文件；repair 时检查全部文件并修复损坏的文件"""
+        if self.preflight_thread is not None and self.preflight_thread.isRunning():
+            return
+        pdf_files = self.pdf_files if repair else \
+            [file_path for file_path in self.pdf_files if file_path not in self.preflight_results]
+        if not pdf_files:
+            return
+
+        if self.staging is not None:
+            self.staging.stage(pdf_files)
+        self.preflight_thread = PreflightThread(
+            pdf_files, self.metadata_cache,
+            BACKEND_RAW if self.merge_raw_copy_check.isChecked() else BACKEND_PYPDF2,
+            repair=repair, isolated=self.isolation_check.isChecked(), passwords=self.password_provider,
+            staging=self.staging)
+        self.preflight_thread.file_checked.connect(self.on_file_checked)
+        self.preflight_thread.file_repaired.connect(self.on_file_repaired)
+        self.preflight_thread.preflight_completed.connect(self.on_preflight_completed)
+        self.preflight_thread.preflight_failed.connect(self.on_preflight_failed)
+        self.preflight_thread.finished.connect(self.start_preflight)  # 检查期间新加入的文件
+        self.preflight_thread.start()
+        self.statusBar().showMessage(f'正在{"修复" if repair else "检查"} {len(pdf_files)} 个文件...')
+
+    def on_file_checked(self, file_path, diagnosis):
+        """一个文件检查完成，更新对应的列表项"""
+        self.preflight_results[file_path] = diagnosis
+        if file_path in self.pdf_files:
+            index = self.pdf_files.index(file_path)
+            self.file_list.item(index).setText(self.file_item_text(index, file_path))
+            self.update_file_count_label()
+
+    def on_file_repaired(self, file_path, repaired_path):
+        """列表中的文件替换为修复后的副本，保留页面设置"""
+        if file_path not in self.pdf_files:
+            return
+        self.pdf_files[self.pdf_files.index(file_path)] = repaired_path
+        if file_path in self.merge_page_options:
+            self.merge_page_options[repaired_path] = self.merge_page_options.pop(file_path)
+        self.repaired_count += 1
+
+    def on_preflight_completed(self):
+        if self.preflight_thread.repair:
+            self.update_file_list()
+            self.statusBar().showMessage(f'已修复 {self.repaired_count} 个文件', 5000)
+            return
+        problem_count = sum(bool(self.preflight_results[file_path]["problems"])
+                            for file_path in self.pdf_files if file_path in self.preflight_results)
+        self.statusBar().showMessage(
+            f'检查完成，{problem_count} 个文件有问题' if problem_count else '检查完成，所有文件正常', 5000)
+
+    def on_preflight_failed(self, error_message):
+        """检查过程出错时，把未得到结果的文件记为无法读取，避免反复重试"""
+        for file_path in self.preflight_thread.pdf_files:
+            if file_path not in self.preflight_results:
+                self.on_file_checked(file_path, {"pages": 0, "problems": {PROBLEM_UNREADABLE: error_message}})
+        self.statusBar().showMessage(f'文件检查失败: {error_message}', 5000)
+
+    def repair_pdf_files(self):
+        """重新检查列表中的文件，修复损坏的文件"""
+        if self.preflight_thread is not None and self.preflight_thread.isRunning():
+            QMessageBox.information(self, '提示', '正在检查文件，请稍后再试')
+            return
+        self.repaired_count = 0
+        self.start_preflight(repair=True)
+
+    def edit_page_options(self):
+        """设置选中文件参与合并的页面范围和旋转角度"""
+        selected_items = self.file_list.selectedItems()
+        if len(selected_items) != 1:
+            QMessageBox.information(self, '提示', '请选择一个文件')
+            return
+
+        file_path = selected_items[0].data(Qt.UserRole)
+        page_spec, rotate = self.merge_page_options.get(file_path, (None, 0))
+        total_pages = self.get_pdf_page_count(file_path)
+
+        page_spec, ok = QInputDialog.getText(
+            self, '页面范围',
+            f'{os.path.basename(file_path)}（共{total_pages}页）\n'
+            f'要合并的页面，留空表示全部，如：3-7, last',
+            text=page_spec or "")
+        if not ok:
+            return
+        page_spec = page_spec.strip() or None
+        if page_spec:
             try:
-                file_size = os.path.getsize(file_path)
-                total_size += file_size
-                size_str = self.format_file_size(file_size)
+                parse_page_spec(page_spec, total_pages)
+            except PageRangeError as e:
+                QMessageBox.warning(self, '页数范围错误', str(e))
+                return
+
+        rotations = ["0", "90", "180", "270"]
+        rotation, ok = QInputDialog.getItem(
+            self, '旋转', '顺时针旋转角度', rotations, rotations.index(str(rotate)), False)
+        if not ok:
+            return
 
-                # 获取PDF页数
-                pages = self.get_pdf_page_count(file_path)
-                total_pages += pages
-                pages_str = f"{pages}页" if pages > 0 else ""
+        if page_spec or int(rotation):
+            self.merge_page_options[file_path] = (page_spec, int(rotation))
+        else:
+            self.merge_page_options.pop(file_path, None)
 
-                item_text = f"{i + 1}. {file_name} ({size_str}, {pages_str})"
-                item = QListWidgetItem(item_text)
-                item.setData(Qt.UserRole, file_path)
-                self.file_list.addItem(item)
+        current_row = self.file_list.currentRow()
+        self.update_file_list()
+        self.file_list.setCurrentRow(current_row)
+
+    def build_merge_plan(self):
+        """按当前文件顺序和各文件的页面设置生成合并方案"""
+        items = []
+        for file_path in self.pdf_files:
+            page_spec, rotate = self.merge_page_options.get(file_path, (None, 0))
+            items.append(MergePlanItem(file_path, page_spec, rotate))
+        return MergePlan(items)
+
+    def save_merge_plan(self):
+        """把合并方案保存为JSON，可用于命令行 merge --plan"""
+        if not self.pdf_files:
+            return
+        plan_path, _ = QFileDialog.getSaveFileName(
+            self, '保存合并方案',
+            os.path.join(self.settings.value("last_dir", ""), "合并方案.json"),
+            'JSON文件 (*.json)')
+        if plan_path:
+            try:
+                self.build_merge_plan().save(plan_path)
+                self.statusBar().showMessage(f'合并方案已保存: {plan_path}', 3000)
+            except Exception as e:
+                QMessageBox.warning(self, '警告', f'无法保存合并方案: {str(e)}')
 
-            except:
-                item = QListWidgetItem(f"{i + 1}. {file_name} (无法读取)")
-                item.setData(Qt.UserRole, file_path)
-                self.file_list.addItem(item)
+    def load_merge_plan(self):
+        """载入JSON合并方案，替换当前文件列表"""
+        plan_path, _ = QFileDialog.getOpenFileName(
+            self, '载入合并方案', self.settings.value("last_dir", ""), 'JSON文件 (*.json)')
+        if not plan_path:
+            return
+        try:
+            plan = MergePlan.load(plan_path)
+        except Exception as e:
+            QMessageBox.warning(self, '警告', f'无法载入合并方案: {str(e)}')
+            return
 
-        # 更新计数标签
-        total_size_str = self.format_file_size(total_size)
-        self.file_count_label.setText(f"{len(self.pdf_files)} 个文件 | 总大小: {total_size_str} | 总页数: {total_pages}页")
+        # 列表中每个文件只出现一次，重复引用同一文件的方案项以最后一项的设置为准
+        self.pdf_files = plan.sources
+        self.merge_page_options = {item.source: (item.pages, item.rotate)
+                                   for item in plan.items if item.pages or item.rotate}
+        self.update_file_list()
+        self.update_button_state()
+        self.statusBar().showMessage(f'已载入合并方案: {len(plan.items)} 项', 3000)
 
     def merge_pdfs(self):
         """合并PDF文件"""
@@ -965,15 +5884,30 @@ class PDFToolsApp(QMainWindow):
             QMessageBox.warning(self, '警告', '请先添加PDF文件')
             return
 
-        # 生成默认文件名
-        default_name = f"合并_{datetime.now().strftime('%Y%m%d_%H%M%S')}.pdf"
+        try:
+            stamper = self.merge_stamp_options.stamper()
+        except ValueError as e:
+            QMessageBox.warning(self, '警告', str(e))
+            return
 
-        output_path, _ = QFileDialog.getSaveFileName(
-            self,
-            '保存合并后的PDF',
-            os.path.join(self.settings.value("last_dir", ""), default_name),
-            'PDF文件 (*.pdf)'
-        )
+        append = self.merge_append_check.isChecked()
+        if append:
+            output_path, _ = QFileDialog.getOpenFileName(
+                self,
+                '选择要追加到的PDF',
+                self.settings.value("last_dir", ""),
+                'PDF文件 (*.pdf)'
+            )
+        else:
+            # 生成默认文件名
+            default_name = f"合并_{datetime.now().strftime('%Y%m%d_%H%M%S')}.pdf"
+
+            output_path, _ = QFileDialog.getSaveFileName(
+                self,
+                '保存合并后的PDF',
+                os.path.join(self.settings.value("last_dir", ""), default_name),
+                'PDF文件 (*.pdf)'
+            )
 
         if not output_path:
             return
@@ -991,7 +5925,34 @@ class PDFToolsApp(QMainWindow):
         self.statusBar().showMessage('正在合并PDF...')
 
         # 创建并启动合并线程
-        self.merger_thread = PDFMergerThread(self.pdf_files, output_path)
+        backend = BACKEND_RAW if self.merge_raw_copy_check.isChecked() else BACKEND_PYPDF2
+        self.settings.setValue("merge_file_outline", self.merge_file_outline_check.isChecked())
+        self.settings.setValue("merge_keep_outline", self.merge_keep_outline_check.isChecked())
+        self.settings.setValue("merge_tolerant", self.merge_tolerant_check.isChecked())
+        self.settings.setValue("merge_append", append)
+        self.settings.setValue("merge_linearize", self.merge_linearize_check.isChecked())
+        self.merge_stamp_options.save_settings()
+        self.merge_blank_options.save_settings()
+        self.merge_duplicate_options.save_settings()
+        self.merge_image_options.save_settings()
+        self.merger_thread = PDFMergerThread(
+            self.pdf_files, output_path, backend,
+            add_file_outline=self.merge_file_outline_check.isChecked(),
+            keep_source_outline=self.merge_keep_outline_check.isChecked(),
+            plan=self.build_merge_plan(),
+            isolated=self.isolation_check.isChecked(),
+            tolerant=self.merge_tolerant_check.isChecked(),
+            cache=self.metadata_cache,
+            passwords=self.password_provider,
+            staging=self.staging,
+            output_cache=self.output_cache,
+            append=append,
+            linearize=self.merge_linearize_check.isChecked(),
+            stamper=stamper,
+            remove_blank=self.merge_blank_options.blank_filter(),
+            deduplicate=self.merge_duplicate_options.finder(),
+            image_optimizer=self.merge_image_options.optimizer()
+        )
         self.merger_thread.progress_updated.connect(self.update_progress)
         self.merger_thread.merge_completed.connect(self.merge_success)
         self.merger_thread.merge_failed.connect(self.merge_failed)
@@ -1014,8 +5975,25 @@ class PDFToolsApp(QMainWindow):
         msg_box.setInformativeText(
             f'文件名: {file_name}\n'
             f'文件大小: {file_size_str}\n'
-            f'总页数: {total_pages}页'
+            f'总页数: {total_pages}页' + self.image_note(self.merger_thread.report.images) +
+            self.cache_note(self.merger_thread.report.cache)
         )
+        report = self.merger_thread.report
+        report_btn = None
+        if report.blank_pages:
+            removed = sum(len(pages) for _, pages in report.blank_pages)
+            msg_box.setText(f'PDF文件已成功合并，去掉了 {removed} 个空白页')
+        if report.duplicate_pages:
+            action = '去掉了' if report.duplicates_removed else '发现'
+            msg_box.setText(msg_box.text().rstrip('！') +
+                            f'，{action} {len(report.duplicate_pages)} 个重复页')
+        if report.has_problems:
+            msg_box.setIcon(QMessageBox.Warning)
+            msg_box.setText(f'PDF文件已合并：跳过 {len(report.skipped)} 个文件，'
+                            f'修复 {len(report.repaired)} 个文件')
+        if report.has_problems or report.blank_pages or report.duplicate_pages:
+            msg_box.setDetailedText('\n'.join(report.summary_lines()))
+            report_btn = msg_box.addButton('保存报告', QMessageBox.ActionRole)
 
         # 添加自定义按钮
         open_btn = msg_box.addButton('打开文件', QMessageBox.ActionRole)
@@ -1030,9 +6008,22 @@ class PDFToolsApp(QMainWindow):
             self.open_file(output_path)
         elif clicked_button == open_folder_btn:
             self.open_folder(output_path)
+        elif report_btn is not None and clicked_button == report_btn:
+            self.save_merge_report(report)
 
         self.statusBar().showMessage('PDF合并完成！', 5000)
 
+    def save_merge_report(self, report):
+        """把合并报告保存为JSON"""
+        default_path = os.path.splitext(report.output_path)[0] + '_报告.json'
+        report_path, _ = QFileDialog.getSaveFileName(self, '保存合并报告', default_path, 'JSON文件 (*.json)')
+        if not report_path:
+            return
+        try:
+            report.save(report_path)
+        except OSError as e:
+            QMessageBox.critical(self, '错误', f'保存报告失败:\n{e}')
+
     def merge_failed(self, error_message):
         """合并失败处理"""
         self.progress_bar.setVisible(False)
@@ -1061,15 +6052,20 @@ class PDFToolsApp(QMainWindow):
             self.settings.setValue("last_dir", os.path.dirname(file))
             self.split_file_path = file
             self.split_file_label.setText(os.path.basename(file))
+            if self.staging is not None:
+                self.staging.stage([file])
 
             # 获取文件信息
             try:
                 file_size = os.path.getsize(file)
                 size_str = self.format_file_size(file_size)
 
-                with open(file, 'rb') as f:
-                    pdf_reader = PyPDF2.PdfReader(f)
-                    total_pages = len(pdf_reader.pages)
+                try:
+                    total_pages = self.count_pages(file)
+                except EncryptedPDFError:
+                    if not self.ask_password(file):
+                        raise
+                    total_pages = self.count_pages(file)
 
                 modified = datetime.fromtimestamp(os.path.getmtime(file)).strftime('%Y-%m-%d %H:%M')
 
@@ -1081,11 +6077,13 @@ class PDFToolsApp(QMainWindow):
                 self.split_info_label.setText(info_text)
 
                 # 更新页数范围输入框的提示
-                self.page_ranges_label.setText(f"总页数: {total_pages}页\n输入页数范围，每行一个范围，如：\n1-5\n6-10\n或单个页码：\n15")
+                self.page_ranges_label.setText(f"总页数: {total_pages}页\n{PAGE_RANGES_HELP}")
                 self.pages_per_file_spin.setMaximum(total_pages)
 
                 # 更新预览
                 self.update_split_preview(file)
+                local_file = self.local_path(file)
+                self.page_grid.set_document(local_file, total_pages, self.password_provider.snapshot([local_file]))
 
                 # 更新按钮状态
                 self.update_split_button_state()
@@ -1095,12 +6093,41 @@ class PDFToolsApp(QMainWindow):
 
     def on_split_mode_changed(self):
         """拆分模式切换"""
+        self.every_page_widget.setVisible(self.mode_every_page.isChecked())
+        self.page_ranges_widget.setVisible(self.mode_page_ranges.isChecked())
+        self.outline_widget.setVisible(self.mode_outline.isChecked())
+        self.blank_widget.setVisible(self.mode_blank.isChecked())
+        self.size_widget.setVisible(self.mode_size.isChecked())
+        self.text_widget.setVisible(self.mode_text.isChecked())
+
+    def on_page_grid_selection_changed(self, page_spec):
+        """页面网格选择变化时显示对应的范围表达式"""
+        self.page_grid_spec_label.setText(f"已选: {page_spec}" if page_spec else "点击或Shift/Ctrl点击选择页面")
+        self.add_grid_range_button.setEnabled(bool(page_spec))
+
+    def add_page_grid_range(self):
+        """把网格中选中的页面作为新的一行范围加入"""
+        page_spec = self.page_grid.selected_page_spec()
+        if not page_spec:
+            return
+        text = self.page_ranges_text.toPlainText().rstrip()
+        self.page_ranges_text.setPlainText(f"{text}\n{page_spec}" if text else page_spec)
+        self.mode_page_ranges.setChecked(True)
+        self.page_grid.clearSelection()
+
+    def current_split_mode(self):
+        """当前选中的拆分模式"""
         if self.mode_every_page.isChecked():
-            self.every_page_widget.setVisible(True)
-            self.page_ranges_widget.setVisible(False)
-        else:
-            self.every_page_widget.setVisible(False)
-            self.page_ranges_widget.setVisible(True)
+            return 'page'
+        if self.mode_outline.isChecked():
+            return 'outline'
+        if self.mode_blank.isChecked():
+            return 'blank'
+        if self.mode_size.isChecked():
+            return 'size'
+        if self.mode_text.isChecked():
+            return 'text'
+        return 'range'
 
     def select_output_folder(self):
         """选择输出文件夹"""
@@ -1116,40 +6143,8 @@ class PDFToolsApp(QMainWindow):
             self.update_split_button_state()
 
     def parse_page_ranges(self, text, total_pages):
-        """解析页数范围文本"""
-        ranges = []
-        lines = text.strip().split('\n')
-
-        for line in lines:
-            line = line.strip()
-            if not line:
-                continue
-
-            if '-' in line:
-                # 范围格式: 1-10
-                try:
-                    start, end = line.split('-')
-                    start = int(start.strip()) - 1  # 转换为0-based索引
-                    end = int(end.strip()) - 1  # 转换为0-based索引
-
-                    if start < 0:
-                        start = 0
-                    if end >= total_pages:
-                        end = total_pages - 1
-                    if start <= end:
-                        ranges.append(list(range(start, end + 1)))
-                except:
-                    pass
-            else:
-                # 单个页码
-                try:
-                    page = int(line.strip()) - 1  # 转换为0-based索引
-                    if 0 <= page < total_pages:
-                        ranges.append([page])
-                except:
-                    pass
-
-        return ranges
+        """解析页数范围文本，格式错误时抛出 PageRangeError"""
+        return parse_page_ranges(text, total_pages)
 
     def split_pdf(self):
         """拆分PDF文件"""
@@ -1161,13 +6156,17 @@ class PDFToolsApp(QMainWindow):
             QMessageBox.warning(self, '警告', '请先选择输出文件夹')
             return
 
+        try:
+            stamper = self.split_stamp_options.stamper()
+        except ValueError as e:
+            QMessageBox.warning(self, '警告', str(e))
+            return
+
         try:
             # 获取总页数
-            with open(self.split_file_path, 'rb') as f:
-                pdf_reader = PyPDF2.PdfReader(f)
-                total_pages = len(pdf_reader.pages)
+            total_pages = self.count_pages(self.split_file_path)
 
-            split_mode = 'page' if self.mode_every_page.isChecked() else 'range'
+            split_mode = self.current_split_mode()
             split_value = None
 
             if split_mode == 'page':
@@ -1177,13 +6176,40 @@ class PDFToolsApp(QMainWindow):
                     return
                 split_value = pages_per_file
 
+            elif split_mode == 'outline':
+                split_value = self.outline_level_spin.value()
+
+            elif split_mode == 'blank':
+                split_value = BlankPageFilter(self.blank_ratio_spin.value() / 100, self.blank_std_spin.value())
+
+            elif split_mode == 'size':
+                split_value = int(self.max_part_size_spin.value() * 1024 * 1024)
+
+            elif split_mode == 'text':
+                pattern = self.text_pattern_edit.text()
+                if not pattern.strip():
+                    QMessageBox.warning(self, '警告', '请输入拆分规则')
+                    return
+                try:
+                    compile_split_pattern(pattern)
+                except ValueError as e:
+                    QMessageBox.warning(self, '拆分规则错误', str(e))
+                    return
+                split_value = (pattern, self.text_name_check.isChecked())
+                self.settings.setValue("split_text_pattern", pattern)
+                self.settings.setValue("split_text_name", self.text_name_check.isChecked())
+
             else:  # range模式
                 page_ranges_text = self.page_ranges_text.toPlainText()
                 if not page_ranges_text.strip():
                     QMessageBox.warning(self, '警告', '请输入页数范围')
                     return
 
-                split_value = self.parse_page_ranges(page_ranges_text, total_pages)
+                try:
+                    split_value = self.parse_page_ranges(page_ranges_text, total_pages)
+                except PageRangeError as e:
+                    QMessageBox.warning(self, '页数范围错误', str(e))
+                    return
                 if not split_value:
                     QMessageBox.warning(self, '警告', '没有有效的页数范围')
                     return
@@ -1192,8 +6218,16 @@ class PDFToolsApp(QMainWindow):
             if split_mode == 'page':
                 num_parts = (total_pages + pages_per_file - 1) // pages_per_file
                 confirm_text = f"将拆分为 {num_parts} 个文件，每个文件 {pages_per_file} 页"
-            else:
+            elif split_mode == 'range':
                 confirm_text = f"将拆分为 {len(split_value)} 个文件，按指定的页数范围拆分"
+            elif split_mode == 'outline':
+                confirm_text = f"将在第{split_value}级及以上书签处拆分"
+            elif split_mode == 'blank':
+                confirm_text = "将在空白分隔页处拆分，分隔页不会输出"
+            elif split_mode == 'text':
+                confirm_text = "将在页面文本匹配拆分规则处拆分"
+            else:
+                confirm_text = f"将拆分为每个不超过 {self.max_part_size_spin.value():.1f} MB 的文件"
 
             reply = QMessageBox.question(
                 self,
@@ -1206,6 +6240,13 @@ class PDFToolsApp(QMainWindow):
             if reply != QMessageBox.Yes:
                 return
 
+            self.settings.setValue("split_inflight_mb", self.inflight_spin.value())
+            self.settings.setValue("split_archive", self.split_archive_combo.currentData())
+            self.settings.setValue("split_linearize", self.split_linearize_check.isChecked())
+            self.split_stamp_options.save_settings()
+            self.split_blank_options.save_settings()
+            self.split_image_options.save_settings()
+
             # 禁用按钮并显示进度条
             self.set_ui_enabled(False)
             self.progress_bar.setVisible(True)
@@ -1217,7 +6258,19 @@ class PDFToolsApp(QMainWindow):
                 self.split_file_path,
                 self.output_folder_path,
                 split_mode,
-                split_value
+                split_value,
+                BACKEND_RAW if self.split_raw_copy_check.isChecked() else BACKEND_PYPDF2,
+                max_inflight_bytes=self.inflight_spin.value() * 1024 * 1024,
+                isolated=self.isolation_check.isChecked(),
+                passwords=self.password_provider,
+                archive=self.split_archive_combo.currentData() or None,
+                cache=self.metadata_cache,
+                staging=self.staging,
+                output_cache=self.output_cache,
+                linearize=self.split_linearize_check.isChecked(),
+                stamper=stamper,
+                remove_blank=self.split_blank_options.blank_filter(),
+                image_optimizer=self.split_image_options.optimizer()
             )
             self.splitter_thread.progress_updated.connect(self.update_progress)
             self.splitter_thread.split_completed.connect(self.split_success)
@@ -1237,10 +6290,21 @@ class PDFToolsApp(QMainWindow):
         msg_box.setWindowTitle('拆分成功')
         msg_box.setIcon(QMessageBox.Information)
         msg_box.setText(f'PDF文件已成功拆分！')
-        msg_box.setInformativeText(
-            f'共生成 {len(output_files)} 个文件\n'
-            f'保存位置: {self.output_folder_path}'
-        )
+        if self.splitter_thread.blank_pages:
+            msg_box.setText(f'PDF文件已成功拆分，去掉了 {len(self.splitter_thread.blank_pages)} 个空白页')
+            msg_box.setDetailedText(f'去掉的空白页: 第 {format_page_numbers(self.splitter_thread.blank_pages)} 页')
+        if self.splitter_thread.archive:
+            msg_box.setInformativeText(
+                f'共 {len(self.splitter_thread.archive_members)} 个部分，已写入归档\n'
+                f'{output_files[0]}' + self.image_note(self.splitter_thread.image_stats) +
+                self.cache_note(self.splitter_thread.cache_stats)
+            )
+        else:
+            msg_box.setInformativeText(
+                f'共生成 {len(output_files)} 个文件\n'
+                f'保存位置: {self.output_folder_path}' + self.image_note(self.splitter_thread.image_stats) +
+                self.cache_note(self.splitter_thread.cache_stats)
+            )
 
         # 添加自定义按钮
         open_folder_btn = msg_box.addButton('打开文件夹', QMessageBox.ActionRole)
@@ -1278,15 +6342,153 @@ class PDFToolsApp(QMainWindow):
             size_bytes /= 1024.0
         return f"{size_bytes:.1f} TB"
 
+    def count_pages(self, file_path):
+        """获取PDF页数，无法读取时抛出异常"""
+        if self.isolation_check.isChecked():
+            local_path = self.local_path(file_path)
+            result = self.isolated_pool().run('page_count', local_path,
+                                              self.password_provider.snapshot([local_path]))
+            if not result.ok:
+                self.raise_task_error(file_path, result.error)
+            return result.value
+        return self.open_document(file_path).page_count
+
+    def create_linearize_check(self, text, setting_key):
+        """线性化输出选项；没有安装 pikepdf 或 qpdf 时禁用"""
+        check = QCheckBox(text)
+        if self.linearize_available:
+            check.setToolTip("重排文件，使第一页用到的内容位于文件开头，"
+                             "浏览器等远程查看器不必下载整个文件就能显示第一页")
+            check.setChecked(self.settings.value(setting_key, False, type=bool))
+        else:
+            check.setToolTip("需要安装 pikepdf（pip install pikepdf）或 qpdf 命令行工具")
+            check.setEnabled(False)
+        return check
+
+    def cache_note(self, stats):
+        """成功提示中附加的输出缓存说明"""
+        if stats is None or stats["result"] != "hit":
+            return ""
+        return f'\n（输入和选项与之前的作业相同，已复用上次的输出，累计命中率 {stats["hit_rate"]:.0%}）'
+
+    def image_note(self, stats):
+        """成功提示中附加的图像压缩说明"""
+        if not stats or not stats["images"]:
+            return ""
+        return f'\n压缩图像 {stats["images"]} 个，减小 {self.format_file_size(stats["saved_bytes"])}'
+
+    def raise_task_error(self, file_path, error_message):
+        """把子进程任务的错误信息还原为异常"""
+        if error_message.startswith(EncryptedPDFError.__name__):
+            raise EncryptedPDFError(file_path)
+        raise RuntimeError(error_message)
+
+    def local_path(self, file_path):
+        """界面中读取文件时优先使用本地暂存副本，副本沿用原文件已知的密码"""
+        if self.staging is None:
+            return file_path
+        local_path = self.staging.local_path(file_path)
+        if local_path != file_path:
+            self.password_provider.share(file_path, local_path)
+        return local_path
+
+    def open_document(self, file_path):
+        """界面线程使用的已打开文档
+
+        解密后的文档按LRU保留，统计页数和预览同一文件时不再重复打开、解密。
+        """
+        key = (file_path, os.path.getmtime(file_path))
+        doc = self.open_documents.get(key)
+        if doc is not None:
+            self.open_documents.move_to_end(key)
+            return doc
+
+        doc = open_pdf_document(self.local_path(file_path), self.password_provider)
+        self.open_documents[key] = doc
+        while len(self.open_documents) > OPEN_DOCUMENT_CACHE_SIZE:
+            self.open_documents.popitem(last=False)[1].close()
+        return doc
+
+    def ask_password(self, file_path):
+        """为加密文件输入密码，解密成功返回 True，取消返回 False"""
+        while True:
+            password, ok = QInputDialog.getText(
+                self, '需要密码', f'{os.path.basename(file_path)} 已加密，请输入密码:', QLineEdit.Password)
+            if not ok:
+                return False
+            self.password_provider.add_candidates([password])
+            try:
+                self.count_pages(file_path)
+                return True
+            except EncryptedPDFError:
+                continue
+
+    def enter_password(self):
+        """添加一个候选密码，重新检查列表中尚未解密的文件"""
+        password, ok = QInputDialog.getText(
+            self, '密码', '加密PDF的候选密码（只在本次运行中保存在内存里）:', QLineEdit.Password)
+        if not ok or not password:
+            return
+        self.password_provider.add_candidates([password])
+        for file_path, diagnosis in list(self.preflight_results.items()):
+            if PROBLEM_ENCRYPTED in diagnosis["problems"]:
+                del self.preflight_results[file_path]
+        self.update_file_list()
+
     def get_pdf_page_count(self, file_path):
-        """获取PDF页数"""
+        """获取PDF页数，已检查过的文件直接使用检查结果"""
+        diagnosis = self.preflight_results.get(file_path)
+        if diagnosis is not None:
+            return diagnosis["pages"]
         try:
-            with open(file_path, 'rb') as f:
-                pdf_reader = PyPDF2.PdfReader(f)
-                return len(pdf_reader.pages)
+            return self.count_pages(file_path)
         except:
             return 0
 
+    def render_first_page(self, file_path, zoom=1.5):
+        """渲染首页，返回 (PPM字节, 总页数)"""
+        if self.isolation_check.isChecked():
+            local_path = self.local_path(file_path)
+            result = self.isolated_pool().run('render', local_path, 0, zoom,
+                                              self.password_provider.snapshot([local_path]))
+            if not result.ok:
+                self.raise_task_error(file_path, result.error)
+            return result.value
+        return render_page_ppm(self.open_document(file_path), 0, zoom)
+
+    def isolated_pool(self):
+        """界面使用的受监督子进程池，首次使用时创建"""
+        if self._isolated_pool is None:
+            self._isolated_pool = IsolatedTaskPool()
+        return self._isolated_pool
+
+    def on_isolation_toggled(self, checked):
+        """切换进程隔离模式"""
+        self.settings.setValue("isolated_workers", checked)
+        if not checked and self._isolated_pool is not None:
+            self._isolated_pool.close()
+            self._isolated_pool = None
+
+    def create_staging(self):
+        max_mb = int(self.settings.value("staging_max_mb", DEFAULT_STAGING_BYTES // (1024 * 1024)))
+        return StagingCache(max_bytes=max_mb * 1024 * 1024)
+
+    def on_staging_toggled(self, checked):
+        """开启或关闭网络文件的本地缓存"""
+        self.settings.setValue("staging_enabled", checked)
+        if checked and self.staging is None:
+            self.staging = self.create_staging()
+            self.staging.stage(self.pdf_files)
+        elif not checked and self.staging is not None:
+            # 等待进行中的复制和写回索引放到后台，不阻塞界面
+            threading.Thread(target=self.staging.close).start()
+            self.staging = None
+
+    def on_output_cache_toggled(self, checked):
+        """开启或关闭输出缓存"""
+        self.settings.setValue("output_cache_enabled", checked)
+        self.output_cache = OutputCache(metadata=self.metadata_cache) if checked else None
+
     def update_split_button_state(self):
         """更新拆分按钮状态"""
         has_file = bool(self.split_file_path)
@@ -1313,14 +6515,9 @@ class PDFToolsApp(QMainWindow):
         """更新PDF预览"""
         try:
             # 使用PyMuPDF获取PDF预览
-            doc = fitz.open(file_path)
-            page = doc[0]
-            zoom = 1.5
-            mat = fitz.Matrix(zoom, zoom)
-            pix = page.get_pixmap(matrix=mat)
+            img_data, pages = self.render_first_page(file_path)
 
             # 转换为QPixmap
-            img_data = pix.tobytes("ppm")
             pixmap = QPixmap()
             pixmap.loadFromData(img_data)
 
@@ -1331,14 +6528,11 @@ class PDFToolsApp(QMainWindow):
             # 显示文件信息
             file_size = os.path.getsize(file_path)
             size_str = self.format_file_size(file_size)
-            pages = len(doc)
             modified = datetime.fromtimestamp(os.path.getmtime(file_path)).strftime('%Y-%m-%d %H:%M')
 
             info_text = f"{os.path.basename(file_path)}\n大小: {size_str} | 页数: {pages}页\n修改时间: {modified}"
             self.preview_info.setText(info_text)
 
-            doc.close()
-
         except Exception as e:
             self.preview_label.setText(f"无法预览PDF文件\n错误: {str(e)}")
             self.preview_info.setText("")
@@ -1347,14 +6541,9 @@ class PDFToolsApp(QMainWindow):
         """更新拆分标签页的预览"""
         try:
             # 使用PyMuPDF获取PDF预览
-            doc = fitz.open(file_path)
-            page = doc[0]
-            zoom = 1.5
-            mat = fitz.Matrix(zoom, zoom)
-            pix = page.get_pixmap(matrix=mat)
+            img_data, pages = self.render_first_page(file_path)
 
             # 转换为QPixmap
-            img_data = pix.tobytes("ppm")
             pixmap = QPixmap()
             pixmap.loadFromData(img_data)
 
@@ -1365,14 +6554,11 @@ class PDFToolsApp(QMainWindow):
             # 显示文件信息
             file_size = os.path.getsize(file_path)
             size_str = self.format_file_size(file_size)
-            pages = len(doc)
             modified = datetime.fromtimestamp(os.path.getmtime(file_path)).strftime('%Y-%m-%d %H:%M')
 
             info_text = f"{os.path.basename(file_path)}\n大小: {size_str} | 页数: {pages}页\n修改时间: {modified}"
             self.split_preview_info.setText(info_text)
 
-            doc.close()
-
         except Exception as e:
             self.split_preview_label.setText(f"无法预览PDF文件\n错误: {str(e)}")
             self.split_preview_info.setText("")
@@ -1413,6 +6599,9 @@ class PDFToolsApp(QMainWindow):
         self.move_top_button.setEnabled(has_files)
         self.move_bottom_button.setEnabled(has_files)
         self.apply_sort_button.setEnabled(has_files)
+        self.page_options_button.setEnabled(has_files)
+        self.save_plan_button.setEnabled(has_files)
+        self.repair_button.setEnabled(has_files)
 
     def set_ui_enabled(self, enabled):
         """启用或禁用UI控件"""
@@ -1428,15 +6617,53 @@ class PDFToolsApp(QMainWindow):
             self.move_top_button.setEnabled(enabled and len(self.pdf_files) > 0)
             self.move_bottom_button.setEnabled(enabled and len(self.pdf_files) > 0)
             self.apply_sort_button.setEnabled(enabled and len(self.pdf_files) > 0)
+            self.page_options_button.setEnabled(enabled and len(self.pdf_files) > 0)
+            self.save_plan_button.setEnabled(enabled and len(self.pdf_files) > 0)
+            self.load_plan_button.setEnabled(enabled)
+            self.repair_button.setEnabled(enabled and len(self.pdf_files) > 0)
             self.file_list.setEnabled(enabled)
             self.sort_combo.setEnabled(enabled)
+            self.merge_raw_copy_check.setEnabled(enabled)
+            self.merge_file_outline_check.setEnabled(enabled)
+            self.merge_keep_outline_check.setEnabled(enabled)
+            self.merge_tolerant_check.setEnabled(enabled)
+            self.merge_append_check.setEnabled(enabled)
+            self.merge_linearize_check.setEnabled(enabled and self.linearize_available)
+            self.merge_stamp_options.setEnabled(enabled)
+            self.merge_blank_options.setEnabled(enabled)
+            self.merge_duplicate_options.setEnabled(enabled)
+            self.merge_image_options.setEnabled(enabled)
+            self.isolation_check.setEnabled(enabled)
+            self.staging_check.setEnabled(enabled)
+            self.output_cache_check.setEnabled(enabled)
         else:  # split tab
             self.split_file_button.setEnabled(enabled)
             self.mode_every_page.setEnabled(enabled)
             self.mode_page_ranges.setEnabled(enabled)
+            self.mode_outline.setEnabled(enabled)
+            self.mode_blank.setEnabled(enabled)
+            self.mode_size.setEnabled(enabled)
+            self.mode_text.setEnabled(enabled)
+            self.outline_level_spin.setEnabled(enabled)
+            self.blank_ratio_spin.setEnabled(enabled)
+            self.blank_std_spin.setEnabled(enabled)
+            self.max_part_size_spin.setEnabled(enabled)
+            self.text_pattern_edit.setEnabled(enabled)
+            self.text_name_check.setEnabled(enabled)
             self.pages_per_file_spin.setEnabled(enabled)
             self.page_ranges_text.setEnabled(enabled)
             self.output_folder_button.setEnabled(enabled)
+            self.split_raw_copy_check.setEnabled(enabled)
+            self.page_grid.setEnabled(enabled)
+            self.isolation_check.setEnabled(enabled)
+            self.staging_check.setEnabled(enabled)
+            self.output_cache_check.setEnabled(enabled)
+            self.inflight_spin.setEnabled(enabled)
+            self.split_archive_combo.setEnabled(enabled)
+            self.split_linearize_check.setEnabled(enabled and self.linearize_available)
+            self.split_stamp_options.setEnabled(enabled)
+            self.split_blank_options.setEnabled(enabled)
+            self.split_image_options.setEnabled(enabled)
             self.split_button.setEnabled(enabled and bool(self.split_file_path) and
                                          bool(self.output_folder_path))
 
@@ -1450,67 +6677,1497 @@ class PDFToolsApp(QMainWindow):
         """关闭事件处理"""
         # 保存窗口状态
         self.settings.setValue("window_geometry", self.saveGeometry())
+        if self.split_tab_built:
+            self.page_grid.shutdown()
+        if self._isolated_pool is not None:
+            self._isolated_pool.close()
+        for doc in self.open_documents.values():
+            doc.close()
+        if self.staging is not None:
+            self.staging.close()
         event.accept()
 
 
+# ========== 后台作业 ==========
+
+def _ignore_interrupt():
+    """工作进程忽略 Ctrl+C，由主进程等待当前任务完成后再退出"""
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+
+
+def job_caches(options, cache_dir=None):
+    """作业的 (分析缓存, 输出缓存)
+
+    给出 cache_dir 时检查结果、页面文本、修复副本等放在其中，随作业目录一起删除；
+    否则使用默认缓存目录。输出缓存总是使用默认缓存目录。
+    """
+    cache = MetadataCache(cache_dir) if cache_dir else None
+    output_cache = OutputCache(default_cache_dir(), metadata=cache) if options.get("output_cache") else None
+    return cache, output_cache
+
+
+def run_merge_job(pdf_files, output_path, options, passwords=None, plan_data=None, cache_dir=None):
+    """在工作进程中合并一批文件（给出 plan_data 时按合并方案合并），返回合并报告字典"""
+    plan = MergePlan.from_dict(plan_data) if plan_data else MergePlan.from_files(pdf_files)
+    cache, output_cache = job_caches(options, cache_dir)
+    worker = PDFMergerThread(None, output_path, options.get("backend", BACKEND_RAW),
+                             add_file_outline=options.get("file_outline", False),
+                             keep_source_outline=options.get("keep_source_outline", True),
+                             plan=plan,
+                             tolerant=options.get("tolerant", False),
+                             passwords=PasswordProvider.from_snapshot(passwords),
+                             read_ahead=options.get("read_ahead", DEFAULT_READ_AHEAD),
+                             cache=cache, output_cache=output_cache,
+                             linearize=options.get("linearize", False),
+                             stamper=stamper_from_options(options),
+                             remove_blank=blank_filter_from_options(options, "remove_blank"),
+                             deduplicate=duplicate_finder_from_options(options),
+                             image_optimizer=image_optimizer_from_options(options))
+    # 先写入临时文件，完成后再改名，下游不会读到写了一半的输出
+    worker.output_path = output_path + ".part"
+    result = run_worker(worker, 'merge_completed', 'merge_failed', progress=None)
+    if 'error' in result:
+        raise RuntimeError(result['error'])
+    os.replace(worker.output_path, output_path)
+
+    worker.report.output_path = output_path
+    if options.get("report"):
+        worker.report.save(os.path.splitext(output_path)[0] + ".json")
+    return worker.report.to_dict()
+
+
+def run_split_job(pdf_file, output_folder, options, passwords=None, cache_dir=None):
+    """在工作进程中拆分一个文件，返回输出文件列表"""
+    split_mode, split_value = split_mode_from_options(options)
+    cache, output_cache = job_caches(options, cache_dir)
+    worker = PDFSplitterThread(pdf_file, output_folder, split_mode, split_value,
+                               options.get("backend", BACKEND_RAW),
+                               passwords=PasswordProvider.from_snapshot(passwords),
+                               archive=options.get("archive"),
+                               cache=cache, output_cache=output_cache,
+                               linearize=options.get("linearize", False),
+                               stamper=stamper_from_options(options),
+                               remove_blank=blank_filter_from_options(options, "remove_blank"),
+                               image_optimizer=image_optimizer_from_options(options))
+    result = run_worker(worker, 'split_completed', 'split_failed', progress=None)
+    if 'error' in result:
+        raise RuntimeError(result['error'])
+    return result['completed'][0]
+
+
+# ========== 监视模式 ==========
+
+WATCH_ACTIONS = ('merge', 'split')
+DEFAULT_WATCH_WORKERS = 2
+WATCH_SETTLE_SECONDS = 5  # 文件大小和修改时间保持不变多久才视为写入完成
+WATCH_POLL_INTERVAL = 2  # 轮询间隔，同时也是检查文件是否稳定的间隔（秒）
+WATCH_BATCH_SECONDS = 30  # 合并规则在多久没有新文件后合并当前这一批
+WATCH_MAX_BATCH_FILES = 500  # 合并规则每批最多的文件数
+
+
+def watch_log(message):
+    print(f"[{datetime.now().strftime('%Y-%m-%d %H:%M:%S')}] {message}", file=sys.stderr, flush=True)
+
+
+def unique_path(path):
+    """目标已存在时在文件名后追加 _2、_3……"""
+    stem, ext = os.path.splitext(path)
+    candidate = path
+    number = 2
+    while os.path.exists(candidate):
+        candidate = f"{stem}_{number}{ext}"
+        number += 1
+    return candidate
+
+
+def move_to_dir(path, directory):
+    os.makedirs(directory, exist_ok=True)
+    target = unique_path(os.path.join(directory, os.path.basename(path)))
+    shutil.move(path, target)
+    return target
+
+
+def is_watched_pdf(name):
+    """只处理PDF，跳过隐藏文件和Office临时文件"""
+    return name.lower().endswith('.pdf') and not name.startswith(('.', '~$'))
+
+
+def real_directory(path):
+    return os.path.normcase(os.path.realpath(path))
+
+
+def same_directory(a, b):
+    """按解析符号链接后的真实路径比较"""
+    return real_directory(a) == real_directory(b)
+
+
+def is_same_or_inside(path, directory):
+    """path 与 directory 相同或位于其中（按解析符号链接后的真实路径比较）"""
+    path, directory = real_directory(path), real_directory(directory)
+    return path == directory or path.startswith(directory.rstrip(os.sep) + os.sep)
+
+
+def scan_pdf_files(directories):
+    paths = set()
+    for directory in directories:
+        try:
+            with os.scandir(directory) as entries:
+                paths.update(entry.path for entry in entries
+                             if entry.is_file() and is_watched_pdf(entry.name))
+        except OSError:
+            pass
+    return paths
+
+
+class WatchRule:
+    """监视规则：输入目录中写入完成的PDF按 action 合并或拆分，结果写入输出目录
+
+    处理成功的输入文件移入 done 目录，失败的移入 failed 目录（默认为输入目录下
+    的子目录），同一文件不会被重复处理。其余键作为合并或拆分选项：
+    合并 backend、file_outline、keep_source_outline、tolerant、report、read_ahead、
+    output_cache、linearize、find_duplicates、remove_duplicates、batch_seconds、max_files；拆分 backend、archive、
+    output_cache、linearize 以及 every、range、outline、blank、max_size、pattern
+    之一（含义同命令行参数）；两者都可以用 watermark、bates、bates_start、
+    bates_digits、stamp_position 盖章，用 remove_blank、blank_max_std 去掉空白页，
+    用 image_dpi、image_format、image_quality 压缩图像。
+
+    合并规则默认 tolerant：一批中无法读取的文件被跳过并移入 failed 目录，其余文件照常合并。
+
+    输出目录不能是输入目录或其子目录，done、failed 目录不能是输入目录或输出目录，
+    否则结果或处理过的文件会被当作新的输入再次处理。
+    """
+
+    def __init__(self, input_dir, output_dir, action, options=None, done_dir=None, failed_dir=None):
+        if action not in WATCH_ACTIONS:
+            raise ValueError(f"未知的监视动作: {action}")
+        self.input_dir = os.path.abspath(input_dir)
+        self.output_dir = os.path.abspath(output_dir)
+        self.action = action
+        self.options = dict(options or {})
+        self.done_dir = os.path.abspath(done_dir or os.path.join(self.input_dir, "done"))
+        self.failed_dir = os.path.abspath(failed_dir or os.path.join(self.input_dir, "failed"))
+        if is_same_or_inside(self.output_dir, self.input_dir):
+            raise ValueError(f"输出目录不能是输入目录或其子目录: {self.output_dir}")
+        for name, directory in (("done", self.done_dir), ("failed", self.failed_dir)):
+            if same_directory(directory, self.input_dir):
+                raise ValueError(f"{name} 目录不能是输入目录: {directory}")
+            if same_directory(directory, self.output_dir):
+                raise ValueError(f"{name} 目录不能是输出目录: {directory}")
+        self.batch_seconds = float(self.options.pop("batch_seconds", WATCH_BATCH_SECONDS))
+        self.max_files = int(self.options.pop("max_files", WATCH_MAX_BATCH_FILES))
+        # 配置错误在启动时报告
+        stamper_from_options(self.options)
+        blank_filter_from_options(self.options, "remove_blank")
+        image_optimizer_from_options(self.options)
+        if action == 'merge':
+            self.options.setdefault("tolerant", True)
+            duplicate_finder_from_options(self.options)
+        if action == 'split':
+            split_mode_from_options(self.options)
+            if self.options.get("archive") not in (None,) + ARCHIVE_FORMATS:
+                raise ValueError(f"不支持的归档格式: {self.options['archive']}")
+
+    @classmethod
+    def from_dict(cls, data, base_dir=None):
+        if not isinstance(data, dict):
+            raise ValueError("监视规则必须是对象")
+        data = dict(data)
+        for key in ("input", "output", "action"):
+            if not data.get(key):
+                raise ValueError(f"监视规则缺少 {key}")
+
+        def resolve(path):
+            if path and base_dir and not os.path.isabs(path):
+                return os.path.join(base_dir, path)
+            return path
+
+        return cls(resolve(data.pop("input")), resolve(data.pop("output")), data.pop("action"),
+                   options=data, done_dir=resolve(data.pop("done", None)),
+                   failed_dir=resolve(data.pop("failed", None)))
+
+
+def load_watch_config(config_path):
+    """读取监视配置，返回 (规则列表, 全局设置)
+
+    JSON 格式：
+    {"workers": 2, "settle_seconds": 5, "poll_interval": 2,
+     "rules": [{"input": "收件/合并", "output": "输出", "action": "merge", "batch_seconds": 60},
+               {"input": "收件/拆分", "output": "输出", "action": "split", "every": 10}]}
+    相对路径相对于配置文件所在目录。
+    """
+    with open(config_path, 'r', encoding='utf-8') as f:
+        data = json.load(f)
+    if not isinstance(data, dict) or not isinstance(data.get("rules"), list) or not data["rules"]:
+        raise ValueError("监视配置必须包含非空的 rules 列表")
+
+    base_dir = os.path.dirname(os.path.abspath(config_path))
+    rules = [WatchRule.from_dict(entry, base_dir) for entry in data["rules"]]
+    input_dirs = [rule.input_dir for rule in rules]
+    if len(set(input_dirs)) != len(input_dirs):
+        raise ValueError("每个输入目录只能对应一条规则")
+
+    settings = {key: data[key] for key in ("workers", "settle_seconds", "poll_interval") if key in data}
+    return rules, settings
+
+
+class PollingWatcher:
+    """定期扫描目录，适用于所有平台和网络文件系统"""
+    name = "轮询"
+    reports_changes = False  # 每次返回目录中的全部文件，而不是有变化的文件
+
+    def __init__(self, directories):
+        self.directories = list(directories)
+        self._stop = threading.Event()
+
+    def wait(self, timeout):
+        self._stop.wait(timeout)
+        return scan_pdf_files(self.directories)
+
+    def close(self):
+        self._stop.set()
+
+
+class InotifyWatcher:
+    """通过 ctypes 调用 Linux inotify，只返回有写入、关闭或移入事件的文件"""
+    name = "inotify"
+    reports_changes = True
+
+    IN_MODIFY = 0x00000002
+    IN_CLOSE_WRITE = 0x00000008
+    IN_MOVED_TO = 0x00000080
+    IN_CREATE = 0x00000100
+    IN_Q_OVERFLOW = 0x00004000
+
+    def __init__(self, directories):
+        import ctypes.util
+        import struct
+
+        self.event_header = struct.Struct("iIII")
+        libc = ctypes.CDLL(ctypes.util.find_library("c") or "libc.so.6", use_errno=True)
+        self.fd = libc.inotify_init1(os.O_NONBLOCK | os.O_CLOEXEC)
+        if self.fd < 0:
+            raise OSError(ctypes.get_errno(), "inotify_init1 失败")
+
+        self.directories = {}
+        mask = self.IN_MODIFY | self.IN_CLOSE_WRITE | self.IN_MOVED_TO | self.IN_CREATE
+        for directory in directories:
+            wd = libc.inotify_add_watch(self.fd, os.fsencode(directory), mask)
+            if wd < 0:
+                error = ctypes.get_errno()
+                os.close(self.fd)
+                raise OSError(error, f"无法监视目录: {directory}")
+            self.directories[wd] = directory
+
+    def wait(self, timeout):
+        ready, _, _ = select.select([self.fd], [], [], timeout)
+        if not ready:
+            return set()
+
+        changed = set()
+        while True:
+            try:
+                data = os.read(self.fd, 64 * 1024)
+            except BlockingIOError:
+                break
+            offset = 0
+            while offset < len(data):
+                wd, mask, _, length = self.event_header.unpack_from(data, offset)
+                offset += self.event_header.size
+                name = os.fsdecode(data[offset:offset + length].rstrip(b"\0"))
+                offset += length
+                if mask & self.IN_Q_OVERFLOW:
+                    # 事件队列溢出，退回全量扫描
+                    changed |= scan_pdf_files(self.directories.values())
+                elif name and wd in self.directories and is_watched_pdf(name):
+                    changed.add(os.path.join(self.directories[wd], name))
+        return changed
+
+    def close(self):
+        os.close(self.fd)
+
+
+def create_watcher(directories, use_inotify=True):
+    """Linux 上优先使用 inotify，不可用时退回轮询"""
+    if use_inotify and sys.platform.startswith("linux"):
+        try:
+            return InotifyWatcher(directories)
+        except (OSError, AttributeError):
+            pass
+    return PollingWatcher(directories)
+
+
+class WatchDaemon:
+    """无界面的监视模式
+
+    输入目录中出现的PDF在大小和修改时间稳定 settle_seconds 后视为写入完成，
+    按所在目录的规则处理：拆分规则逐个文件处理；合并规则把文件攒成一批，
+    batch_seconds 内没有新文件（或达到 max_files）时按文件名顺序合并。
+    任务在大小固定的进程池中执行，空闲工作进程不足时文件留在队列中等待。
+    """
+
+    def __init__(self, rules, workers=DEFAULT_WATCH_WORKERS, settle_seconds=WATCH_SETTLE_SECONDS,
+                 poll_interval=WATCH_POLL_INTERVAL, passwords=None, use_inotify=True, log=watch_log):
+        self.rules = {rule.input_dir: rule for rule in rules}
+        self.workers = max(1, workers)
+        self.settle_seconds = settle_seconds
+        self.poll_interval = poll_interval
+        self.passwords = passwords or PasswordProvider()
+        self.use_inotify = use_inotify
+        self.log = log
+
+        self.pending = {}  # 路径 -> ((大小, 修改时间ns) 或 None, 最后一次变化的时间)
+        self.claimed = set()  # 已进入批次、队列或正在处理的文件
+        self.batches = {input_dir: [] for input_dir, rule in self.rules.items() if rule.action == 'merge'}
+        self.batch_updated = {}  # 输入目录 -> 最后一次加入文件的时间
+        self.ready = deque()  # 等待空闲工作进程的任务 (规则, [文件])
+        self.in_flight = {}  # future -> (规则, [文件])
+        self.executor = None
+        self._stop = threading.Event()
+
+    def stop(self):
+        self._stop.set()
+
+    def run(self):
+        for rule in self.rules.values():
+            for directory in (rule.input_dir, rule.output_dir):
+                os.makedirs(directory, exist_ok=True)
+
+        watcher = create_watcher(self.rules, self.use_inotify)
+        self.executor = self.create_executor()
+        self.log(f"开始监视 {len(self.rules)} 个目录（{watcher.name}，{self.workers} 个工作进程）")
+        try:
+            self.observe(scan_pdf_files(self.rules), reset=False)
+            while not self._stop.is_set():
+                self.observe(watcher.wait(self.poll_interval), reset=watcher.reports_changes)
+                now = time.monotonic()
+                self.collect_settled(now)
+                self.flush_batches(now)
+                self.dispatch()
+                self.reap()
+        except KeyboardInterrupt:
+            pass
+        finally:
+            self.log("正在停止，等待进行中的任务完成...")
+            watcher.close()
+            self.executor.shutdown(wait=True)
+            self.reap()
+            self.log("已停止")
+
+    def create_executor(self):
+        return ProcessPoolExecutor(max_workers=self.workers, initializer=_ignore_interrupt)
+
+    def observe(self, paths, reset):
+        """记录新出现的文件；reset 时（inotify 事件）重新开始等待文件稳定"""
+        now = time.monotonic()
+        for path in paths:
+            path = os.path.abspath(path)
+            if path in self.claimed or os.path.dirname(path) not in self.rules:
+                continue
+            if path not in self.pending:
+                self.pending[path] = (None, now)
+            elif reset:
+                self.pending[path] = (self.pending[path][0], now)
+
+    def collect_settled(self, now):
+        """把写入完成的文件交给对应的规则"""
+        for path, (signature, last_change) in list(self.pending.items()):
+            try:
+                stat = os.stat(path)
+            except OSError:
+                del self.pending[path]
+                continue
+            current = (stat.st_size, stat.st_mtime_ns)
+            if current != signature:
+                self.pending[path] = (current, now)
+                continue
+            if stat.st_size == 0 or now - last_change < self.settle_seconds:
+                continue
+
+            del self.pending[path]
+            self.claimed.add(path)
+            rule = self.rules[os.path.dirname(path)]
+            if rule.action == 'merge':
+                self.batches[rule.input_dir].append(path)
+                self.batch_updated[rule.input_dir] = now
+            else:
+                self.ready.append((rule, [path]))
+
+    def flush_batches(self, now):
+        for input_dir, files in self.batches.items():
+            rule = self.rules[input_dir]
+            if files and (len(files) >= rule.max_files or
+                          now - self.batch_updated[input_dir] >= rule.batch_seconds):
+                files.sort(key=lambda path: os.path.basename(path).lower())
+                self.ready.append((rule, files[:rule.max_files]))
+                del files[:rule.max_files]
+
+    def dispatch(self):
+        """在有空闲工作进程时提交任务"""
+        while self.ready and len(self.in_flight) < self.workers:
+            rule, files = self.ready.popleft()
+            passwords = self.passwords.snapshot(files)
+            if rule.action == 'merge':
+                output_path = unique_path(os.path.join(
+                    rule.output_dir, f"合并_{datetime.now().strftime('%Y%m%d_%H%M%S')}.pdf"))
+                args = (run_merge_job, files, output_path, rule.options, passwords)
+                self.log(f"开始合并 {len(files)} 个文件 -> {output_path}")
+            else:
+                args = (run_split_job, files[0], rule.output_dir, rule.options, passwords)
+                self.log(f"开始拆分 {files[0]}")
+            try:
+                future = self.executor.submit(*args)
+            except BrokenProcessPool:
+                self.executor = self.create_executor()
+                future = self.executor.submit(*args)
+            self.in_flight[future] = (rule, files)
+
+    def reap(self):
+        """处理已完成的任务：输入文件移入 done 或 failed 目录"""
+        for future in [future for future in self.in_flight if future.done()]:
+            rule, files = self.in_flight.pop(future)
+            try:
+                value = future.result()
+            except Exception as e:
+                if isinstance(e, BrokenProcessPool):
+                    self.executor = self.create_executor()
+                self.log(f"处理失败: {e}")
+                failed = set(files)
+            else:
+                if rule.action == 'merge':
+                    failed = {entry["path"] for entry in value["skipped"]}
+                    for entry in value["skipped"]:
+                        self.log(f"跳过 {entry['path']}: {entry['reason']}")
+                    self.log(f"已合并 {len(files) - len(failed)} 个文件 -> "
+                             f"{value['output']}（{value['total_pages']}页）")
+                else:
+                    failed = set()
+                    self.log(f"已拆分 {files[0]} -> {len(value)} 个文件")
+
+            for path in files:
+                try:
+                    move_to_dir(path, rule.failed_dir if path in failed else rule.done_dir)
+                except OSError as e:
+                    # 移不走的文件保持占用状态，避免被反复处理
+                    self.log(f"无法移动 {path}: {e}")
+                else:
+                    self.claimed.discard(path)
+
+
+# ========== HTTP服务 ==========
+
+SERVER_HOST = "127.0.0.1"  # 只监听本机回环地址，不对外提供服务
+DEFAULT_SERVER_PORT = 8765
+DEFAULT_SERVER_WORKERS = 2
+DEFAULT_SERVER_QUEUE_DEPTH = 16  # 排队（尚未开始）的作业数上限，超出时返回 429
+DEFAULT_MAX_UPLOAD_MB = 512
+SERVER_JOB_TTL = 3600  # 已结束的作业及其输出保留多久（秒）
+STREAM_CHUNK_SIZE = 1024 * 1024
+MULTIPART_MAX_HEADER_BYTES = 16 * 1024  # multipart 每个部分头部的上限
+MULTIPART_MAX_FIELD_BYTES = 1024 * 1024  # options、password 等文本字段的上限
+CONTENT_TYPES = {'.pdf': 'application/pdf', '.zip': 'application/zip', '.tar': 'application/x-tar'}
+
+JOB_QUEUED = 'queued'
+JOB_RUNNING = 'running'
+JOB_DONE = 'done'
+JOB_FAILED = 'failed'
+
+
+class QueueFullError(Exception):
+    """作业队列已满"""
+
+
+class HTTPError(Exception):
+    def __init__(self, status, message):
+        super().__init__(message)
+        self.status = status
+
+
+class Job:
+    """一个合并或拆分作业"""
+
+    def __init__(self, action, work_dir):
+        self.id = uuid.uuid4().hex
+        self.action = action
+        self.work_dir = work_dir
+        self.status = JOB_QUEUED
+        self.created = time.time()
+        self.started = None
+        self.finished = None
+        self.outputs = []
+        self.archive = None  # 拆分结果写入的归档格式
+        self.report = None
+        self.error = None
+
+    @property
+    def cache_dir(self):
+        """本作业的分析缓存目录，随作业目录一起删除"""
+        return os.path.join(self.work_dir, "cache")
+
+    def to_dict(self):
+        data = {
+            "id": self.id,
+            "action": self.action,
+            "status": self.status,
+            "created": self.created,
+            "started": self.started,
+            "finished": self.finished,
+        }
+        if self.status == JOB_DONE:
+            data["outputs"] = [os.path.basename(path) for path in self.outputs]
+            data["result"] = f"/jobs/{self.id}/result"
+            if self.report is not None:
+                data["report"] = self.report
+        if self.error:
+            data["error"] = self.error
+        return data
+
+
+class JobManager:
+    """作业队列
+
+    所有作业共用一个固定大小的工作进程池；调度线程与工作进程一一对应，
+    因此作业状态能准确区分排队和运行。排队中的作业超过 queue_depth 时拒绝新作业。
+    上传的输入、生成的输出和分析缓存（检查结果、页面文本、修复副本）放在各作业的
+    临时目录中，作业结束 ttl 秒后清理。
+    """
+
+    def __init__(self, workers=DEFAULT_SERVER_WORKERS, queue_depth=DEFAULT_SERVER_QUEUE_DEPTH,
+                 ttl=SERVER_JOB_TTL, passwords=None):
+        self.workers = max(1, workers)
+        self.queue_depth = max(0, queue_depth)
+        self.ttl = ttl
+        self.passwords = passwords or PasswordProvider()
+        self.root_dir = tempfile.mkdtemp(prefix="pdftools_server_")
+        self.jobs = OrderedDict()
+        self._lock = threading.Lock()
+        self._threads = ThreadPoolExecutor(max_workers=self.workers)
+        self._processes = self.create_executor()
+        self.started = time.monotonic()
+        self.counters = {
+            "jobs_submitted": 0,
+            "jobs_completed": 0,
+            "jobs_failed": 0,
+            "jobs_rejected": 0,
+            "bytes_received": 0,
+            "bytes_sent": 0,
+            "job_seconds_total": 0.0,
+        }
+
+    def create_executor(self):
+        # 服务本身是多线程的，工作进程用 spawn 启动，避免 fork 时继承其他线程持有的锁
+        return ProcessPoolExecutor(max_workers=self.workers, initializer=_ignore_interrupt,
+                                   mp_context=multiprocessing.get_context("spawn"))
+
+    def new_job(self, action):
+        job = Job(action, None)
+        job.work_dir = os.path.join(self.root_dir, job.id)
+        os.makedirs(job.work_dir)
+        return job
+
+    def count(self, name, amount=1):
+        with self._lock:
+            self.counters[name] += amount
+
+    def submit(self, job, function, *args):
+        with self._lock:
+            active = sum(1 for other in self.jobs.values() if other.status in (JOB_QUEUED, JOB_RUNNING))
+            if active >= self.workers + self.queue_depth:
+                self.counters["jobs_rejected"] += 1
+                raise QueueFullError(f"队列已满（{active - self.workers} 个作业在排队）")
+            self.jobs[job.id] = job
+            self.counters["jobs_submitted"] += 1
+        self._threads.submit(self.run_job, job, function, args)
+
+    def run_job(self, job, function, args):
+        job.status = JOB_RUNNING
+        job.started = time.time()
+        try:
+            try:
+                value = self._processes.submit(function, *args).result()
+            except BrokenProcessPool:
+                # 工作进程崩溃（例如内存耗尽）会让整个进程池失效，换一个新的给后续作业使用
+                with self._lock:
+                    self._processes = self.create_executor()
+                raise RuntimeError("工作进程异常退出")
+            if job.action == 'merge':
+                job.report = value
+            else:
+                job.outputs = list(value)
+        except Exception as e:
+            job.error = str(e)
+            job.status = JOB_FAILED
+            self.count("jobs_failed")
+        else:
+            job.status = JOB_DONE
+            self.count("jobs_completed")
+        finally:
+            job.finished = time.time()
+            self.count("job_seconds_total", job.finished - job.started)
+
+    def get(self, job_id):
+        with self._lock:
+            job = self.jobs.get(job_id)
+        if job is None:
+            raise HTTPError(404, "作业不存在")
+        return job
+
+    def remove(self, job_id):
+        job = self.get(job_id)
+        if job.status in (JOB_QUEUED, JOB_RUNNING):
+            raise HTTPError(409, "作业尚未结束")
+        with self._lock:
+            self.jobs.pop(job_id, None)
+        shutil.rmtree(job.work_dir, ignore_errors=True)
+
+    def expire(self):
+        """清理超过保留时间的已结束作业"""
+        deadline = time.time() - self.ttl
+        with self._lock:
+            expired = [job for job in self.jobs.values()
+                       if job.finished is not None and job.finished < deadline]
+            for job in expired:
+                del self.jobs[job.id]
+        for job in expired:
+            shutil.rmtree(job.work_dir, ignore_errors=True)
+
+    def metrics(self):
+        with self._lock:
+            statuses = [job.status for job in self.jobs.values()]
+            data = dict(self.counters)
+        data.update({
+            "jobs_queued": statuses.count(JOB_QUEUED),
+            "jobs_running": statuses.count(JOB_RUNNING),
+            "jobs_stored": len(statuses),
+            "workers": self.workers,
+            "queue_depth": self.queue_depth,
+            "uptime_seconds": round(time.monotonic() - self.started, 3),
+        })
+        return data
+
+    def shutdown(self):
+        self._threads.shutdown(wait=True)
+        self._processes.shutdown(wait=True)
+        shutil.rmtree(self.root_dir, ignore_errors=True)
+
+
+class MultipartReader:
+    """按块解析 multipart/form-data 请求体
+
+    上传的文件边接收边写入磁盘，内存中只保留一个块和一个分隔行长度的尾部。
+    """
+
+    def __init__(self, rfile, length, content_type):
+        import email.parser
+        import email.policy
+
+        self.parser = email.parser.BytesHeaderParser(policy=email.policy.HTTP)
+        boundary = self.parser.parsebytes(b"Content-Type: " + content_type.encode('latin-1')).get_boundary()
+        if not boundary:
+            raise HTTPError(400, "multipart 请求缺少 boundary")
+        self.rfile = rfile
+        self.remaining = length
+        # 在请求体前补上换行，所有分隔行都以 \r\n-- 开头
+        self.delimiter = b"\r\n--" + boundary.encode('latin-1')
+        self.buffer = bytearray(b"\r\n")
+
+    def fill(self):
+        """再读入一块，请求体已读完时返回 False"""
+        if self.remaining <= 0:
+            return False
+        chunk = self.rfile.read(min(STREAM_CHUNK_SIZE, self.remaining))
+        if not chunk:
+            raise HTTPError(400, "请求体不完整")
+        self.remaining -= len(chunk)
+        self.buffer += chunk
+        return True
+
+    def read_until_delimiter(self):
+        """逐块返回下一个分隔行之前的内容，并跳过分隔行"""
+        keep = len(self.delimiter) - 1
+        while True:
+            index = self.buffer.find(self.delimiter)
+            if index >= 0:
+                if index:
+                    yield bytes(self.buffer[:index])
+                del self.buffer[:index + len(self.delimiter)]
+                return
+            if len(self.buffer) > keep:
+                yield bytes(self.buffer[:-keep])
+                del self.buffer[:-keep]
+            if not self.fill():
+                raise HTTPError(400, "multipart 请求缺少结束分隔行")
+
+    def parts(self):
+        """依次返回 (部分的头部, 内容块的迭代器)；未读完的内容在取下一个部分时跳过"""
+        for _ in self.read_until_delimiter():  # 第一个分隔行之前的内容
+            pass
+        while True:
+            while len(self.buffer) < 2 and self.fill():
+                pass
+            if self.buffer.startswith(b"--"):
+                # 结束分隔行，读完其后的内容，连接上的下一个请求才不会错位
+                while self.fill():
+                    self.buffer.clear()
+                return
+            index = self.buffer.find(b"\r\n\r\n")
+            while index < 0:
+                if len(self.buffer) > MULTIPART_MAX_HEADER_BYTES:
+                    raise HTTPError(400, "multipart 部分的头部过长")
+                if not self.fill():
+                    raise HTTPError(400, "multipart 请求格式错误")
+                index = self.buffer.find(b"\r\n\r\n")
+            headers = self.parser.parsebytes(bytes(self.buffer[2:index]))
+            del self.buffer[:index + 4]
+            chunks = self.read_until_delimiter()
+            yield headers, chunks
+            for _ in chunks:
+                pass
+
+    @staticmethod
+    def read_field(chunks):
+        """读取文本字段的全部内容"""
+        data = bytearray()
+        for chunk in chunks:
+            data += chunk
+            if len(data) > MULTIPART_MAX_FIELD_BYTES:
+                raise HTTPError(413, "multipart 文本字段过长")
+        return data.decode('utf-8')
+
+
+def parse_query_options(query):
+    """把查询字符串转换成作业选项：数字转成数值，true/false 转成布尔，重复的键合并为列表"""
+    options = {}
+    for key, values in urllib_parse.parse_qs(query).items():
+        parsed = []
+        for value in values:
+            if value.lower() in ('true', 'false'):
+                parsed.append(value.lower() == 'true')
+                continue
+            try:
+                parsed.append(int(value))
+            except ValueError:
+                try:
+                    parsed.append(float(value))
+                except ValueError:
+                    parsed.append(value)
+        # 页数范围总是列表，每一项生成一个文件
+        options[key] = parsed if len(parsed) > 1 or key == 'range' else parsed[0]
+    return options
+
+
+class JobRequestHandler:
+    """作业接口，与 http.server.BaseHTTPRequestHandler 组合后使用（见 create_job_server）
+
+    POST /jobs/merge、/jobs/split  提交作业，输入可以是：
+        application/json       {"inputs": [本机路径...], "options": {...}, "output": 可选输出路径}
+                               合并还可以用 "plan" 给出页面级合并方案，拆分用 "input" 给出单个文件
+        multipart/form-data    上传的PDF文件（按顺序）和可选的 options 字段（JSON）
+        application/pdf        请求体即一个PDF，选项放在查询字符串中（?every=10）
+    GET    /jobs                 所有作业
+    GET    /jobs/<id>            作业状态
+    GET    /jobs/<id>/result     合并作业返回PDF；拆分作业返回输出文件列表，
+                                 选项中指定 archive 时直接返回 ZIP 或 TAR 归档
+    GET    /jobs/<id>/files/<n>  拆分作业的第 n 个输出文件
+    DELETE /jobs/<id>            删除已结束的作业及其输出
+    GET    /metrics              计数器和队列状态
+    """
+
+    server_version = "PDFTools"
+    protocol_version = "HTTP/1.1"
+
+    @property
+    def manager(self):
+        return self.server.manager
+
+    def log_message(self, format, *args):
+        watch_log(f"{self.address_string()} {format % args}")
+
+    def do_GET(self):
+        self.handle_request(self.route_get)
+
+    def do_POST(self):
+        self.handle_request(self.route_post)
+
+    def do_DELETE(self):
+        self.handle_request(self.route_delete)
+
+    def handle_request(self, route):
+        self.manager.expire()
+        path, _, self.query = self.path.partition('?')
+        parts = [part for part in path.split('/') if part]
+        try:
+            route(parts)
+        except HTTPError as e:
+            self.send_json({"error": str(e)}, e.status)
+        except QueueFullError as e:
+            self.send_json({"error": str(e)}, 429, headers={"Retry-After": "5"})
+        except (OSError, ValueError) as e:
+            self.send_json({"error": str(e)}, 400)
+        except Exception as e:
+            # 其他错误也要回复，否则客户端只会看到连接被关闭
+            self.log_error("处理请求出错: %r", e)
+            self.send_json({"error": f"服务器内部错误: {e}"}, 500)
+
+    def route_get(self, parts):
+        if parts == ['metrics']:
+            self.send_json(self.manager.metrics())
+        elif parts == ['health']:
+            self.send_json({"status": "ok"})
+        elif parts == ['jobs']:
+            with self.manager._lock:
+                jobs = list(self.manager.jobs.values())
+            self.send_json({"jobs": [job.to_dict() for job in jobs]})
+        elif len(parts) == 2 and parts[0] == 'jobs':
+            self.send_json(self.manager.get(parts[1]).to_dict())
+        elif len(parts) == 3 and parts[0] == 'jobs' and parts[2] == 'result':
+            job = self.finished_job(parts[1])
+            if job.action == 'merge' or job.archive:
+                self.send_file(job.outputs[0])
+            else:
+                self.send_json({"files": [
+                    {"name": os.path.basename(path), "url": f"/jobs/{job.id}/files/{number}"}
+                    for number, path in enumerate(job.outputs, 1)]})
+        elif len(parts) == 4 and parts[0] == 'jobs' and parts[2] == 'files':
+            job = self.finished_job(parts[1])
+            try:
+                number = int(parts[3])
+            except ValueError:
+                number = 0
+            if not 1 <= number <= len(job.outputs):
+                raise HTTPError(404, "输出文件不存在")
+            self.send_file(job.outputs[number - 1])
+        else:
+            raise HTTPError(404, "未知的路径")
+
+    def route_post(self, parts):
+        if len(parts) != 2 or parts[0] != 'jobs' or parts[1] not in ('merge', 'split'):
+            raise HTTPError(404, "未知的路径")
+        action = parts[1]
+        job = self.manager.new_job(action)
+        try:
+            inputs, options, output, plan_data, passwords = self.read_job_request(job)
+            if action == 'merge':
+                if not inputs and not plan_data:
+                    raise HTTPError(400, "没有输入文件")
+                output_path = os.path.abspath(output) if output else os.path.join(job.work_dir, "merged.pdf")
+                job.outputs = [output_path]
+                snapshot = self.manager.passwords.snapshot(inputs)
+                snapshot["candidates"] += passwords
+                self.manager.submit(job, run_merge_job, inputs, output_path, options, snapshot, plan_data,
+                                    job.cache_dir)
+            else:
+                if len(inputs) != 1:
+                    raise HTTPError(400, "拆分作业需要且只能有一个输入文件")
+                split_mode_from_options(options)  # 提交前检查拆分方式
+                if options.get("archive") not in (None,) + ARCHIVE_FORMATS:
+                    raise HTTPError(400, f"不支持的归档格式: {options['archive']}")
+                job.archive = options.get("archive")
+                output_folder = os.path.abspath(output) if output else os.path.join(job.work_dir, "output")
+                os.makedirs(output_folder, exist_ok=True)
+                snapshot = self.manager.passwords.snapshot(inputs)
+                snapshot["candidates"] += passwords
+                self.manager.submit(job, run_split_job, inputs[0], output_folder, options, snapshot,
+                                    job.cache_dir)
+        except BaseException:
+            shutil.rmtree(job.work_dir, ignore_errors=True)
+            raise
+        self.send_json(job.to_dict(), 202, headers={"Location": f"/jobs/{job.id}"})
+
+    def route_delete(self, parts):
+        if len(parts) != 2 or parts[0] != 'jobs':
+            raise HTTPError(404, "未知的路径")
+        self.manager.remove(parts[1])
+        self.send_json({"deleted": parts[1]})
+
+    def finished_job(self, job_id):
+        job = self.manager.get(job_id)
+        if job.status == JOB_FAILED:
+            raise HTTPError(409, f"作业失败: {job.error}")
+        if job.status != JOB_DONE:
+            raise HTTPError(409, "作业尚未完成")
+        return job
+
+    def read_job_request(self, job):
+        """读取请求体，返回 (输入文件, 选项, 输出路径, 合并方案, 候选密码)"""
+        try:
+            length = int(self.headers.get("Content-Length", ""))
+        except ValueError:
+            raise HTTPError(411, "需要 Content-Length")
+        if length > self.server.max_upload_bytes:
+            raise HTTPError(413, f"请求体超过 {self.server.max_upload_bytes // (1024 * 1024)}MB")
+        self.manager.count("bytes_received", length)
+
+        content_type = self.headers.get("Content-Type", "")
+        media_type = content_type.split(';')[0].strip().lower()
+        upload_dir = os.path.join(job.work_dir, "input")
+
+        if media_type == 'application/pdf':
+            # 直接上传单个PDF：分块写入磁盘，不在内存中保留整个文件
+            os.makedirs(upload_dir)
+            input_path = os.path.join(upload_dir, "upload.pdf")
+            with open(input_path, 'wb') as f:
+                remaining = length
+                while remaining > 0:
+                    chunk = self.rfile.read(min(STREAM_CHUNK_SIZE, remaining))
+                    if not chunk:
+                        raise HTTPError(400, "请求体不完整")
+                    f.write(chunk)
+                    remaining -= len(chunk)
+            return [input_path], parse_query_options(self.query), None, None, []
+
+        if media_type == 'application/json':
+            try:
+                data = json.loads(self.rfile.read(length).decode('utf-8'))
+            except (UnicodeDecodeError, json.JSONDecodeError) as e:
+                raise HTTPError(400, f"JSON格式错误: {e}")
+            if not isinstance(data, dict):
+                raise HTTPError(400, "请求体应为JSON对象")
+            inputs = data.get("inputs") or ([data["input"]] if data.get("input") else [])
+            if not isinstance(inputs, list) or not all(isinstance(path, str) for path in inputs):
+                raise HTTPError(400, "inputs 应为文件路径列表，input 应为文件路径")
+            options = {} if data.get("options") is None else data["options"]
+            if not isinstance(options, dict):
+                raise HTTPError(400, "options 应为JSON对象")
+            if not isinstance(data.get("plan", {}), (dict, type(None))):
+                raise HTTPError(400, "plan 应为JSON对象")
+            if not isinstance(data.get("output", ""), (str, type(None))):
+                raise HTTPError(400, "output 应为路径字符串")
+            passwords = [] if data.get("passwords") is None else data["passwords"]
+            if not isinstance(passwords, list) or not all(isinstance(password, str) for password in passwords):
+                raise HTTPError(400, "passwords 应为字符串列表")
+            inputs = [os.path.abspath(path) for path in inputs]
+            plan_data = data.get("plan")
+            if plan_data is not None:
+                # 把方案中的相对路径解析成绝对路径，工作进程中不依赖当前目录
+                plan = MergePlan.from_dict(plan_data, os.getcwd())
+                inputs = plan.sources
+                plan_data = plan.to_dict()
+            for path in inputs:
+                if not os.path.isfile(path):
+                    raise HTTPError(400, f"文件不存在: {path}")
+            return inputs, options, data.get("output"), plan_data, passwords
+
+        if media_type == 'multipart/form-data':
+            # 各部分边接收边处理，上传的文件分块写入磁盘
+            reader = MultipartReader(self.rfile, length, content_type)
+            os.makedirs(upload_dir)
+            inputs, options, passwords = [], {}, []
+            for headers, chunks in reader.parts():
+                name = headers.get_param('name', header='content-disposition')
+                filename = headers.get_filename()
+                if filename:
+                    # 编号前缀保持上传顺序，也避免同名文件互相覆盖
+                    safe_name = sanitize_filename(os.path.basename(filename)) or "upload.pdf"
+                    input_path = os.path.join(upload_dir, f"{len(inputs) + 1:03d}_{safe_name}")
+                    with open(input_path, 'wb') as f:
+                        for chunk in chunks:
+                            f.write(chunk)
+                    inputs.append(input_path)
+                elif name == 'options':
+                    try:
+                        options = json.loads(reader.read_field(chunks))
+                    except json.JSONDecodeError as e:
+                        raise HTTPError(400, f"options 不是有效的JSON: {e}")
+                    if not isinstance(options, dict):
+                        raise HTTPError(400, "options 应为JSON对象")
+                elif name == 'password':
+                    passwords.append(reader.read_field(chunks))
+            return inputs, options, None, None, passwords
+
+        raise HTTPError(415, f"不支持的内容类型: {media_type or '未指定'}")
+
+    def send_json(self, data, status=200, headers=None):
+        body = json.dumps(data, ensure_ascii=False, indent=2).encode('utf-8')
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        for key, value in (headers or {}).items():
+            self.send_header(key, value)
+        if status >= 400:
+            # 出错时请求体可能还没读完，关闭连接以免下一个请求错位
+            self.send_header("Connection", "close")
+            self.close_connection = True
+        self.end_headers()
+        self.wfile.write(body)
+        self.manager.count("bytes_sent", len(body))
+
+    def byte_range(self, size):
+        """解析单个 Range 请求头，返回 (起点, 终点) 闭区间，起点大于终点表示范围无效；
+        没有或不支持（如多个范围）时返回 None，按整个文件返回
+
+        线性化的输出配合按范围读取，远程查看器只需取回文件开头就能显示第一页。
+        """
+        match = re.fullmatch(r'\s*bytes=(\d*)-(\d*)\s*', self.headers.get("Range", ""))
+        if not match or not any(match.groups()):
+            return None
+        first, last = match.groups()
+        if not first:
+            return max(0, size - int(last)), size - 1
+        return int(first), min(int(last), size - 1) if last else size - 1
+
+    def send_file(self, path):
+        """分块发送输出文件，支持单个字节范围"""
+        try:
+            f = open(path, 'rb')
+        except OSError:
+            raise HTTPError(410, "输出文件已不存在")
+        with f:
+            size = os.fstat(f.fileno()).st_size
+            byte_range = self.byte_range(size)
+            if byte_range is not None and byte_range[0] > byte_range[1]:
+                self.send_response(416)
+                self.send_header("Content-Range", f"bytes */{size}")
+                self.send_header("Content-Length", "0")
+                self.send_header("Connection", "close")
+                self.close_connection = True
+                self.end_headers()
+                return
+            first, last = byte_range or (0, size - 1)
+            length = last - first + 1
+            self.send_response(206 if byte_range else 200)
+            self.send_header("Content-Type", CONTENT_TYPES.get(os.path.splitext(path)[1].lower(),
+                                                              "application/octet-stream"))
+            self.send_header("Content-Length", str(length))
+            self.send_header("Accept-Ranges", "bytes")
+            if byte_range:
+                self.send_header("Content-Range", f"bytes {first}-{last}/{size}")
+            self.send_header("Content-Disposition",
+                             "attachment; filename*=UTF-8''" + urllib_parse.quote(os.path.basename(path)))
+            self.end_headers()
+            f.seek(first)
+            remaining = length
+            while remaining:
+                chunk = f.read(min(STREAM_CHUNK_SIZE, remaining))
+                if not chunk:
+                    break
+                self.wfile.write(chunk)
+                remaining -= len(chunk)
+        self.manager.count("bytes_sent", length - remaining)
+
+
+def create_job_server(port, manager, max_upload_bytes=DEFAULT_MAX_UPLOAD_MB * 1024 * 1024):
+    """创建作业服务；http.server 在此时才导入，界面启动时不必加载"""
+    from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+    handler = type("JobRequestHandler", (JobRequestHandler, BaseHTTPRequestHandler), {})
+    server = ThreadingHTTPServer((SERVER_HOST, port), handler)
+    server.daemon_threads = True
+    server.manager = manager
+    server.max_upload_bytes = max_upload_bytes
+    return server
+
+
+# ========== 命令行 ==========
+
+CLI_COMMANDS = ('merge', 'split', 'check', 'watch', 'serve', 'cache')
+# QApplication 自己处理的命令行选项，其余以 - 开头的参数交给命令行解析
+QT_OPTIONS = ('style', 'stylesheet', 'platform', 'platformpluginpath', 'platformtheme', 'plugin',
+              'qwindowgeometry', 'qwindowicon', 'qwindowtitle', 'reverse', 'session', 'widgetcount',
+              'qmljsdebugger', 'display', 'geometry', 'title', 'name', 'visual', 'ncols', 'cmap',
+              'sync', 'nograb', 'dograb')
+
+
+def is_cli_invocation(argv):
+    """argv（不含程序名）以子命令或 -h、--help、--version 等非 Qt 选项开头时按命令行模式运行"""
+    if not argv:
+        return False
+    if argv[0] in CLI_COMMANDS:
+        return True
+    return argv[0].startswith('-') and argv[0].lstrip('-').split('=', 1)[0] not in QT_OPTIONS
+
+
+def add_isolation_arguments(parser):
+    parser.add_argument("--isolated", action="store_true", help="在受监督的子进程中处理")
+    parser.add_argument("--timeout", type=int, default=ISOLATED_TASK_TIMEOUT, help="每个文件的超时（秒）")
+    parser.add_argument("--memory-mb", type=int, default=ISOLATED_MEMORY_LIMIT_MB,
+                        help="每个子进程的内存上限（MB，仅POSIX）")
+
+
+def add_staging_arguments(parser):
+    parser.add_argument("--stage", action="store_true",
+                        help="先把网络存储（SMB/NFS）上的输入复制到本地缓存，再从本地副本读取")
+
+
+def add_linearize_arguments(parser):
+    parser.add_argument("--linearize", action="store_true",
+                        help="写出线性化（快速网页浏览）的PDF，需要 pikepdf 或 qpdf")
+
+
+def add_stamp_arguments(parser):
+    parser.add_argument("--watermark", metavar="TEXT", help="在每页中央叠加半透明的斜向水印文字")
+    parser.add_argument("--bates", nargs="?", const="", metavar="PREFIX",
+                        help="在每页加 Bates 编号，可指定前缀（ASCII）；拆分时沿用原文件中的页码")
+    parser.add_argument("--bates-start", type=int, default=1, metavar="N", help="第一页的编号")
+    parser.add_argument("--bates-digits", type=int, default=DEFAULT_BATES_DIGITS, metavar="N",
+                        help="编号数字的位数，不足时补零")
+    parser.add_argument("--stamp-position", choices=STAMP_POSITIONS, default=DEFAULT_STAMP_POSITION,
+                        help="编号的位置")
+
+
+def cli_stamper(args):
+    return stamper_from_options({"watermark": args.watermark, "bates": args.bates,
+                                 "bates_start": args.bates_start, "bates_digits": args.bates_digits,
+                                 "stamp_position": args.stamp_position})
+
+
+def add_blank_arguments(parser):
+    parser.add_argument("--remove-blank", type=float, nargs="?", const=DEFAULT_BLANK_INK_RATIO * 100,
+                        metavar="PERCENT", help="去掉空白页（如双面扫描的空白背面），可指定墨迹占比阈值（%%）")
+    parser.add_argument("--blank-max-std", type=float, default=DEFAULT_BLANK_MAX_STD, metavar="STD",
+                        help="空白页的灰度标准差上限，高于此值的页面有浅色内容，不算空白")
+
+
+def add_duplicate_arguments(parser):
+    parser.add_argument("--find-duplicates", type=int, nargs="?", const=DEFAULT_DUPLICATE_DISTANCE,
+                        metavar="DISTANCE",
+                        help="检测近似重复页（如重新扫描、重复转发的页面）并列在报告中，可指定感知哈希的汉明距离上限")
+    parser.add_argument("--remove-duplicates", action="store_true", help="检测并去掉近似重复页，只保留最早的一页")
+
+
+def add_image_arguments(parser):
+    parser.add_argument("--image-dpi", type=int, nargs="?", const=DEFAULT_IMAGE_DPI, metavar="DPI",
+                        help=f"把有效分辨率高于此值的图像缩小到此分辨率并重新压缩（默认 {DEFAULT_IMAGE_DPI}）")
+    parser.add_argument("--image-format", choices=IMAGE_FORMATS, default='auto',
+                        help="重新压缩的格式：auto 时原来是 JPEG 的仍用 JPEG，其余用无损的 Flate")
+    parser.add_argument("--image-quality", type=int, default=DEFAULT_IMAGE_QUALITY, metavar="Q",
+                        help="JPEG 质量（1-100）")
+
+
+def print_image_stats(stats):
+    if stats and stats["images"]:
+        print(f"压缩图像 {stats['images']} 个，减小 {stats['saved_bytes'] / (1024 * 1024):.1f} MB", file=sys.stderr)
+
+
+def add_output_cache_arguments(parser):
+    parser.add_argument("--output-cache", action="store_true",
+                        help="输入内容和选项都与之前的作业相同时直接复用上次的输出")
+
+
+def print_cache_result(stats):
+    if stats is not None:
+        result = "命中" if stats["result"] == "hit" else "未命中"
+        print(f"输出缓存: {result}（累计命中率 {stats['hit_rate']:.0%}）", file=sys.stderr)
+
+
+def add_password_arguments(parser):
+    parser.add_argument("--password", action="append", default=[], metavar="PASSWORD",
+                        help="加密PDF的候选密码，可重复")
+    parser.add_argument("--password-file", metavar="FILE", help="候选密码文件，每行一个")
+
+
+def cli_password_provider(args):
+    passwords = list(args.password)
+    if args.password_file:
+        with open(args.password_file, encoding='utf-8') as f:
+            passwords += [line.rstrip('\r\n') for line in f if line.rstrip('\r\n')]
+    return PasswordProvider(passwords)
+
+
+def build_cli_parser():
+    parser = argparse.ArgumentParser(
+        prog="PDF_Tools",
+        description="PDF工具命令行模式；不带参数运行时启动图形界面")
+    parser.add_argument("--version", action="version",
+                        version=f"%(prog)s (Python {sys.version.split()[0]}, PyQt {PYQT_VERSION_STR}, Qt {QT_VERSION_STR})")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    merge_parser = subparsers.add_parser("merge", help="合并PDF")
+    merge_parser.add_argument("inputs", nargs="*", help="按顺序合并的PDF文件")
+    merge_parser.add_argument("--plan", help="JSON格式的页面级合并方案")
+    merge_parser.add_argument("-o", "--output", required=True, help="输出PDF文件")
+    merge_parser.add_argument("--backend", choices=[BACKEND_RAW, BACKEND_PYPDF2], default=BACKEND_RAW)
+    merge_parser.add_argument("--file-outline", action="store_true", help="为每个文件生成书签")
+    merge_parser.add_argument("--no-source-outline", action="store_true", help="不保留原文件书签")
+    merge_parser.add_argument("--tolerant", action="store_true", help="修复或跳过损坏的文件，继续合并")
+    merge_parser.add_argument("--no-repair", action="store_true", help="容错模式下不尝试修复，直接跳过")
+    merge_parser.add_argument("--report", metavar="JSON", help="把合并报告写入JSON文件")
+    merge_parser.add_argument("--append", action="store_true",
+                              help="追加到已有的输出文件末尾（增量更新，只写入新页面）；输出不存在时正常合并")
+    merge_parser.add_argument("--read-ahead", type=int, default=DEFAULT_READ_AHEAD, metavar="N",
+                              help="预读后续N个输入文件，0 表示不预读")
+    merge_parser.add_argument("--read-ahead-mb", type=int, default=DEFAULT_READ_AHEAD_BYTES // (1024 * 1024),
+                              help="预读内容占用的内存上限（MB）")
+    add_isolation_arguments(merge_parser)
+    add_staging_arguments(merge_parser)
+    add_output_cache_arguments(merge_parser)
+    add_linearize_arguments(merge_parser)
+    add_stamp_arguments(merge_parser)
+    add_blank_arguments(merge_parser)
+    add_duplicate_arguments(merge_parser)
+    add_image_arguments(merge_parser)
+    add_password_arguments(merge_parser)
+
+    split_parser = subparsers.add_parser("split", help="拆分PDF")
+    split_parser.add_argument("input", help="要拆分的PDF文件")
+    split_parser.add_argument("-o", "--output-folder", required=True, help="输出文件夹")
+    split_parser.add_argument("--backend", choices=[BACKEND_RAW, BACKEND_PYPDF2], default=BACKEND_RAW)
+    split_parser.add_argument("--inflight-mb", type=int, default=DEFAULT_INFLIGHT_BYTES // (1024 * 1024),
+                              help="写入缓冲上限（MB）")
+    split_parser.add_argument("--archive", choices=ARCHIVE_FORMATS,
+                              help="把所有部分写入输出文件夹中的一个 ZIP 或 TAR 归档")
+    add_isolation_arguments(split_parser)
+    add_staging_arguments(split_parser)
+    add_output_cache_arguments(split_parser)
+    add_linearize_arguments(split_parser)
+    add_stamp_arguments(split_parser)
+    add_blank_arguments(split_parser)
+    add_image_arguments(split_parser)
+    add_password_arguments(split_parser)
+    mode_group = split_parser.add_mutually_exclusive_group(required=True)
+    mode_group.add_argument("--every", type=int, metavar="N", help="每N页拆分")
+    mode_group.add_argument("--range", action="append", dest="ranges", metavar="SPEC",
+                            help="页数范围，每个 --range 生成一个文件，可重复")
+    mode_group.add_argument("--outline", type=int, metavar="LEVEL", help="按指定层级书签拆分")
+    mode_group.add_argument("--blank", type=float, nargs="?", const=DEFAULT_BLANK_INK_RATIO * 100,
+                            metavar="PERCENT", help="按空白分隔页拆分，可指定墨迹占比阈值（%%）")
+    mode_group.add_argument("--max-size", type=float, metavar="MB", help="每个文件不超过指定大小")
+    mode_group.add_argument("--pattern", metavar="REGEX", help="在页面文本匹配正则表达式处开始新的文件")
+    split_parser.add_argument("--name-from-match", action="store_true",
+                              help="按 --pattern 拆分时用第一个捕获组（或整个匹配）命名各文件")
+
+    check_parser = subparsers.add_parser("check", help="检查PDF是否可以合并（加密、损坏、不完整、无页面）")
+    check_parser.add_argument("inputs", nargs="+", help="要检查的PDF文件")
+    check_parser.add_argument("--backend", choices=[BACKEND_RAW, BACKEND_PYPDF2], default=BACKEND_RAW)
+    check_parser.add_argument("--repair", action="store_true", help="修复损坏的文件，输出修复副本路径")
+    add_isolation_arguments(check_parser)
+    add_password_arguments(check_parser)
+
+    watch_parser = subparsers.add_parser("watch", help="监视输入目录，自动合并或拆分新出现的PDF")
+    watch_parser.add_argument("config", help="JSON格式的监视配置")
+    watch_parser.add_argument("--workers", type=int, help="同时处理的任务数")
+    watch_parser.add_argument("--poll", action="store_true", help="不使用inotify，定期扫描目录")
+    add_password_arguments(watch_parser)
+
+    serve_parser = subparsers.add_parser("serve", help=f"在本机 {SERVER_HOST} 上提供合并和拆分作业接口")
+    serve_parser.add_argument("--port", type=int, default=DEFAULT_SERVER_PORT, help="监听端口")
+    serve_parser.add_argument("--workers", type=int, default=DEFAULT_SERVER_WORKERS, help="同时处理的作业数")
+    serve_parser.add_argument("--queue-depth", type=int, default=DEFAULT_SERVER_QUEUE_DEPTH,
+                              help="最多排队的作业数，超出时拒绝新作业")
+    serve_parser.add_argument("--max-upload-mb", type=int, default=DEFAULT_MAX_UPLOAD_MB,
+                              help="单个请求体的大小上限（MB）")
+    serve_parser.add_argument("--ttl", type=int, default=SERVER_JOB_TTL,
+                              help="已结束的作业及其输出保留多久（秒）")
+    add_password_arguments(serve_parser)
+
+    cache_parser = subparsers.add_parser("cache", help="查看或清理输出缓存和分析缓存")
+    cache_parser.add_argument("action", nargs="?", choices=("stats", "prune", "clear"), default="stats",
+                              help="stats 显示大小和命中率；prune 按上限淘汰；clear 删除全部结果")
+    cache_parser.add_argument("--max-mb", type=int,
+                              help=f"设置输出缓存的大小上限（MB，默认 {DEFAULT_OUTPUT_CACHE_BYTES // (1024 * 1024)}）"
+                                   "，之后的作业都使用它")
+    cache_parser.add_argument("--hardlink", choices=("on", "off"),
+                              help="复用输出时建硬链接（on）还是复制（off，默认）；硬链接省空间，"
+                                   "但就地修改一个输出会同时改动缓存和其他复用了它的输出")
+    cache_parser.add_argument("--metadata-max-mb", type=int,
+                              help="设置分析缓存（页面文本、页面指纹和修复副本）的大小上限"
+                                   f"（MB，默认 {DEFAULT_METADATA_CACHE_BYTES // (1024 * 1024)}），之后的作业都使用它")
+    return parser
+
+
+def run_cache_command(args):
+    """cache 命令：显示输出缓存和分析缓存的大小和命中率，按上限淘汰或清空"""
+    cache = OutputCache()
+    metadata = cache.metadata
+    if args.action == 'clear':
+        print(f"已删除 {cache.clear()} 个结果，{metadata.clear()} 项分析结果")
+    else:
+        if args.hardlink is not None:
+            cache.set_hardlink(args.hardlink == 'on')
+        if args.max_mb is not None:
+            print(f"已删除 {cache.set_limit(args.max_mb * 1024 * 1024)} 个结果")
+        if args.metadata_max_mb is not None:
+            print(f"已删除 {metadata.set_limit(args.metadata_max_mb * 1024 * 1024)} 项分析结果")
+        if args.action == 'prune' and args.max_mb is None and args.metadata_max_mb is None:
+            print(f"已删除 {cache.evict()} 个结果，{metadata.evict()} 项分析结果")
+    stats = cache.stats()
+    hit_rate = "-" if stats["hit_rate"] is None else f"{stats['hit_rate']:.1%}"
+    print(f"位置: {stats['path']}")
+    print(f"结果: {stats['entries']} 个，{stats['bytes'] / (1024 * 1024):.1f}MB / "
+          f"上限 {stats['max_bytes'] // (1024 * 1024)}MB")
+    print(f"复用方式: {'硬链接' if stats['hardlink'] else '复制'}")
+    print(f"命中: {stats['hits']}  未命中: {stats['misses']}  命中率: {hit_rate}")
+    stats = metadata.stats()
+    print(f"分析缓存: {stats['path']}")
+    print(f"已记录文件: {stats['documents']} 个  页面文本、指纹和修复副本: {stats['entries']} 项，"
+          f"{stats['bytes'] / (1024 * 1024):.1f}MB / 上限 {stats['max_bytes'] // (1024 * 1024)}MB")
+    return 0
+
+
+def run_cli(argv):
+    """命令行入口，返回进程退出码"""
+    args = build_cli_parser().parse_args(argv)
+    if args.command == 'cache':
+        return run_cache_command(args)
+
+    staging = StagingCache() if getattr(args, "stage", False) else None
+    output_cache = OutputCache() if getattr(args, "output_cache", False) else None
+    try:
+        passwords = cli_password_provider(args)
+        if args.command == 'merge':
+            if args.plan:
+                plan = MergePlan.load(args.plan)
+            elif args.inputs:
+                plan = MergePlan.from_files(args.inputs)
+            else:
+                print("错误: 需要输入文件或 --plan", file=sys.stderr)
+                return 2
+
+            worker = PDFMergerThread(plan.sources, args.output, args.backend,
+                                     add_file_outline=args.file_outline,
+                                     keep_source_outline=not args.no_source_outline,
+                                     plan=plan, isolated=args.isolated,
+                                     task_timeout=args.timeout, memory_limit_mb=args.memory_mb,
+                                     tolerant=args.tolerant, repair=not args.no_repair,
+                                     passwords=passwords, read_ahead=args.read_ahead,
+                                     read_ahead_bytes=args.read_ahead_mb * 1024 * 1024, staging=staging,
+                                     output_cache=output_cache, append=args.append,
+                                     linearize=args.linearize, stamper=cli_stamper(args),
+                                     remove_blank=blank_filter_from_options(vars(args), "remove_blank"),
+                                     deduplicate=duplicate_finder_from_options(vars(args)),
+                                     image_optimizer=image_optimizer_from_options(vars(args)))
+            worker.file_failed.connect(
+                lambda file_path, error: print(f"跳过 {file_path}: {error}", file=sys.stderr))
+            result = run_worker(worker, 'merge_completed', 'merge_failed')
+            if 'completed' in result:
+                output_path, total_pages = result['completed']
+                for path, reason in worker.report.repaired:
+                    print(f"修复 {path}: {reason}", file=sys.stderr)
+                for path, reason in worker.report.warnings:
+                    print(f"注意 {path}: {reason}", file=sys.stderr)
+                for path, pages in worker.report.blank_pages:
+                    print(f"去掉空白页 {path}: 第 {format_page_numbers(pages)} 页", file=sys.stderr)
+                action = "去掉重复页" if worker.report.duplicates_removed else "重复页"
+                for path, page, same_path, same_page in worker.report.duplicate_pages:
+                    print(f"{action} {path} 第 {page} 页: 同 {same_path} 第 {same_page} 页", file=sys.stderr)
+                print_image_stats(worker.report.images)
+                print_cache_result(worker.report.cache)
+                print(f"{output_path}: {total_pages}页")
+            if args.report:
+                worker.report.save(args.report)
+
+        elif args.command == 'check':
+            with ExitStack() as stack:
+                pool = None
+                if args.isolated:
+                    pool = stack.enter_context(IsolatedTaskPool(timeout=args.timeout,
+                                                                memory_limit_mb=args.memory_mb))
+                checker = PreflightChecker(pool=pool, passwords=passwords)
+                verdicts = [preflight_verdict(diagnosis, args.backend)
+                            for diagnosis in checker.check(args.inputs)]
+                to_repair = [path for path, (verdict, _) in zip(args.inputs, verdicts) if verdict == CHECK_REPAIR]
+                repaired = dict(zip(to_repair, checker.repair(to_repair))) if args.repair else {}
+
+            result = {}
+            for path, (verdict, reason) in zip(args.inputs, verdicts):
+                if path in repaired:
+                    repaired_path, error = repaired[path]
+                    reason = f"{reason} -> {repaired_path}" if repaired_path else f"{reason}，修复失败: {error}"
+                print(f"{verdict}\t{path}" + (f"\t{reason}" if reason else ""))
+                if verdict == CHECK_SKIPPED or (path in repaired and repaired[path][0] is None):
+                    result['error'] = "部分文件无法使用"
+
+        elif args.command == 'watch':
+            rules, settings = load_watch_config(args.config)
+            if args.workers:
+                settings["workers"] = args.workers
+            daemon = WatchDaemon(rules, passwords=passwords, use_inotify=not args.poll, **settings)
+            signal.signal(signal.SIGTERM, lambda signum, frame: daemon.stop())
+            daemon.run()
+            return 0
+
+        elif args.command == 'serve':
+            manager = JobManager(args.workers, args.queue_depth, args.ttl, passwords)
+            try:
+                server = create_job_server(args.port, manager, args.max_upload_mb * 1024 * 1024)
+            except OSError:
+                manager.shutdown()
+                raise
+            # serve_forever 所在线程不能直接调用 shutdown，交给另一个线程
+            signal.signal(signal.SIGTERM,
+                          lambda signum, frame: threading.Thread(target=server.shutdown).start())
+            watch_log(f"作业服务已启动: http://{SERVER_HOST}:{server.server_port}/")
+            try:
+                server.serve_forever()
+            except KeyboardInterrupt:
+                pass
+            finally:
+                watch_log("正在停止，等待进行中的作业完成...")
+                server.server_close()
+                manager.shutdown()
+                watch_log("已停止")
+            return 0
+
+        else:
+            split_mode, split_value = split_mode_from_options({
+                "every": args.every, "range": args.ranges, "outline": args.outline,
+                "blank": args.blank, "blank_max_std": args.blank_max_std, "max_size": args.max_size,
+                "pattern": args.pattern, "name_from_match": args.name_from_match})
+
+            os.makedirs(args.output_folder, exist_ok=True)
+            worker = PDFSplitterThread(args.input, args.output_folder, split_mode, split_value,
+                                       args.backend, max_inflight_bytes=args.inflight_mb * 1024 * 1024,
+                                       isolated=args.isolated, task_timeout=args.timeout,
+                                       memory_limit_mb=args.memory_mb, passwords=passwords,
+                                       archive=args.archive, staging=staging, output_cache=output_cache,
+                                       linearize=args.linearize, stamper=cli_stamper(args),
+                                       remove_blank=blank_filter_from_options(vars(args), "remove_blank"),
+                                       image_optimizer=image_optimizer_from_options(vars(args)))
+            result = run_worker(worker, 'split_completed', 'split_failed')
+            if 'completed' in result:
+                print_cache_result(worker.cache_stats)
+                print_image_stats(worker.image_stats)
+                if worker.blank_pages:
+                    print(f"去掉空白页: 第 {format_page_numbers(worker.blank_pages)} 页", file=sys.stderr)
+                for output_path in result['completed'][0]:
+                    print(output_path)
+
+    except (OSError, ValueError) as e:
+        print(f"错误: {e}", file=sys.stderr)
+        return 1
+    finally:
+        if staging is not None:
+            staging.close()
+
+    if 'error' in result:
+        print(f"错误: {result['error']}", file=sys.stderr)
+        return 1
+    return 0
+
+
 def main():
+    if is_cli_invocation(sys.argv[1:]):
+        sys.exit(run_cli(sys.argv[1:]))
+
+    startup_timer = StartupTimer()
+    startup_timer.mark("导入")
+
     app = QApplication(sys.argv)
     app.setApplicationName("PDF工具 - 合并与拆分")
     app.setOrganizationName("PDFTools")
+    startup_timer.mark("QApplication")
 
     # 同时设置应用程序图标
     try:
-        app_icon = QIcon()
-        # 创建简单的红色PDF图标
-        for size in [16, 24, 32, 48, 64]:
-            pixmap = QPixmap(size, size)
-            pixmap.fill(Qt.transparent)
-
-            painter = QPainter(pixmap)
-            painter.setRenderHint(QPainter.Antialiasing)
-
-            red_color = QColor(220, 50, 50)
-            margin = size * 0.15
-            doc_width = size - 2 * margin
-            doc_height = doc_width * 1.2
-
-            painter.setBrush(QBrush(red_color))
-            painter.setPen(QPen(red_color.darker(130), max(1, size * 0.02)))
-            painter.drawRoundedRect(int(margin), int(margin),
-                                    int(doc_width), int(doc_height),
-                                    int(size * 0.1), int(size * 0.1))
-
-            fold_size = min(doc_width * 0.3, doc_height * 0.3)
-            painter.setBrush(QBrush(red_color.darker(120)))
-            fold_points = [
-                QPoint(int(margin + doc_width - fold_size), int(margin)),
-                QPoint(int(margin + doc_width), int(margin)),
-                QPoint(int(margin + doc_width), int(margin + fold_size))
-            ]
-            painter.drawPolygon(fold_points)
-
-            painter.setPen(QPen(Qt.white, max(1, size * 0.02)))
-            font_size = int(size * 0.3)
-            font = QFont("Arial", font_size, QFont.Bold)
-            painter.setFont(font)
-            text = "P"
-            text_rect = painter.fontMetrics().boundingRect(text)
-            text_x = int((size - text_rect.width()) / 2)
-            text_y = int((size + text_rect.height()) / 2)
-            painter.drawText(text_x, text_y, text)
-
-            painter.end()
-            app_icon.addPixmap(pixmap)
-
-        app.setWindowIcon(app_icon)
+        app.setWindowIcon(app_icon())
     except Exception as e:
         print(f"设置应用程序图标失败: {e}")
+    startup_timer.mark("图标")
 
     window = PDFToolsApp()
+    startup_timer.mark("主窗口")
     window.show()
 
+    def first_paint():
+        startup_timer.mark("首次显示")
+        if not startup_timer.report():
+            window.statusBar().showMessage(
+                f"启动耗时 {startup_timer.elapsed_ms:.0f}ms，超出预算 {startup_timer.budget_ms}ms", 5000)
+
+    QTimer.singleShot(0, first_paint)
+
     sys.exit(app.exec_())
 
 
 if __name__ == '__main__':
+    multiprocessing.freeze_support()
     main()
\ No newline at end of file
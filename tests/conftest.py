@@ -0,0 +1,6 @@
+import os
+import sys
+
+# 无显示环境下也能导入 PyQt5
+os.environ.setdefault("QT_QPA_PLATFORM", "offscreen")
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
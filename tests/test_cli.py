@@ -0,0 +1,21 @@
+import pytest
+
+from PDF_Tools import build_cli_parser, is_cli_invocation
+
+
+@pytest.mark.parametrize("argv", [["merge", "a.pdf"], ["-h"], ["--help"], ["--version"], ["--bogus"]])
+def test_cli_invocation(argv):
+    assert is_cli_invocation(argv)
+
+
+@pytest.mark.parametrize("argv", [[], ["-style", "fusion"], ["--platform=offscreen"], ["-reverse"], ["a.pdf"]])
+def test_gui_invocation(argv):
+    assert not is_cli_invocation(argv)
+
+
+@pytest.mark.parametrize("flag", ["-h", "--version"])
+def test_help_and_version_exit_cleanly(flag, capsys):
+    with pytest.raises(SystemExit) as excinfo:
+        build_cli_parser().parse_args([flag])
+    assert excinfo.value.code == 0
+    assert "PDF_Tools" in capsys.readouterr().out
@@ -0,0 +1,28 @@
+import os
+
+import pytest
+
+from PDF_Tools import PAGE_TEXT_CACHE_KEY, run_split_job
+
+fitz = pytest.importorskip("fitz")
+
+
+def text_pdf(path, texts):
+    doc = fitz.open()
+    for text in texts:
+        doc.new_page().insert_text((72, 72), text)
+    doc.save(path)
+    doc.close()
+    return str(path)
+
+
+def test_job_cache_stays_in_job_directory(tmp_path, monkeypatch):
+    monkeypatch.setattr("PDF_Tools.default_cache_dir", lambda: str(tmp_path / "default"))
+    pdf = text_pdf(tmp_path / "a.pdf", ["Chapter 1", "text", "Chapter 2", "text"])
+    output = tmp_path / "out"
+    output.mkdir()
+    cache_dir = tmp_path / "job" / "cache"
+    outputs = run_split_job(pdf, str(output), {"pattern": "Chapter"}, cache_dir=str(cache_dir))
+    assert len(outputs) == 2
+    assert os.listdir(cache_dir / PAGE_TEXT_CACHE_KEY)
+    assert not (tmp_path / "default").exists()
@@ -0,0 +1,71 @@
+import os
+import time
+
+from PDF_Tools import (PAGE_TEXT_CACHE_KEY, PREFLIGHT_CACHE_KEY, MetadataCache, build_cli_parser,
+                       run_cache_command)
+
+BLOB = ["x" * 1000]  # 保存后约 1 KB
+
+
+def age(path, seconds):
+    """把最近使用时间提前，越过淘汰保护期"""
+    used = time.time() - seconds
+    os.utime(path, (used, used))
+
+
+def blob_path(cache, digest):
+    return os.path.join(cache.cache_dir, PAGE_TEXT_CACHE_KEY, f"{digest}.json")
+
+
+def test_blobs_are_evicted_least_recently_used_first(tmp_path):
+    cache = MetadataCache(str(tmp_path), max_bytes=2500)
+    for index, digest in enumerate(("a", "b", "c")):
+        cache.save_blob(digest, PAGE_TEXT_CACHE_KEY, BLOB)
+        age(blob_path(cache, digest), 3600 - index)
+    assert cache.load_blob("a", PAGE_TEXT_CACHE_KEY) == BLOB  # 读取后成为最近使用的
+    cache.save_blob("d", PAGE_TEXT_CACHE_KEY, BLOB)
+    cache.save()
+    assert cache.load_blob("b", PAGE_TEXT_CACHE_KEY) is None
+    assert cache.load_blob("c", PAGE_TEXT_CACHE_KEY) is None
+    assert cache.load_blob("a", PAGE_TEXT_CACHE_KEY) == BLOB
+    assert cache.load_blob("d", PAGE_TEXT_CACHE_KEY) == BLOB
+
+
+def test_recently_used_entries_are_kept(tmp_path):
+    cache = MetadataCache(str(tmp_path), max_bytes=1)
+    cache.save_blob("a", PAGE_TEXT_CACHE_KEY, BLOB)
+    cache.save()
+    assert cache.load_blob("a", PAGE_TEXT_CACHE_KEY) == BLOB
+
+
+def test_repaired_copies_count_towards_limit(tmp_path):
+    cache = MetadataCache(str(tmp_path), max_bytes=1)
+    path = cache.repaired_path("0123456789abcdef0123", "a.pdf")
+    os.makedirs(os.path.dirname(path))
+    with open(path, 'wb') as f:
+        f.write(b"%PDF" * 100)
+    age(path, 3600)
+    assert cache.stats()["entries"] == 1
+    assert cache.evict() == 1
+    assert not os.path.exists(os.path.dirname(path))
+
+
+def test_limit_is_persisted(tmp_path):
+    cache = MetadataCache(str(tmp_path))
+    cache.save_blob("a", PAGE_TEXT_CACHE_KEY, BLOB)
+    age(blob_path(cache, "a"), 3600)
+    assert cache.set_limit(100) == 1
+    assert MetadataCache(str(tmp_path)).max_bytes == 100
+
+
+def test_cache_command_clears_metadata(tmp_path, monkeypatch, capsys):
+    monkeypatch.setattr("PDF_Tools.default_cache_dir", lambda: str(tmp_path))
+    cache = MetadataCache()
+    cache.put("a", PREFLIGHT_CACHE_KEY, {"pages": 1})
+    cache.save_blob("a", PAGE_TEXT_CACHE_KEY, BLOB)
+    cache.save()
+    assert run_cache_command(build_cli_parser().parse_args(["cache", "clear"])) == 0
+    assert "1 项分析结果" in capsys.readouterr().out
+    cache = MetadataCache()
+    assert cache.get("a", PREFLIGHT_CACHE_KEY) is None
+    assert cache.stats()["entries"] == 0
@@ -0,0 +1,43 @@
+import os
+
+import pytest
+
+from PDF_Tools import OutputCache
+
+FINGERPRINT = "f" * 64
+
+
+@pytest.fixture
+def output(tmp_path):
+    path = tmp_path / "merged.pdf"
+    path.write_bytes(b"%PDF-1.7 original")
+    return path
+
+
+def test_outputs_are_copies_by_default(tmp_path, output):
+    cache = OutputCache(str(tmp_path / "cache"))
+    cache.store(FINGERPRINT, [str(output)])
+    restored = tmp_path / "restored.pdf"
+    cache.restore(FINGERPRINT, "merged.pdf", str(restored))
+    assert not os.path.samefile(output, restored)
+
+    # 就地修改复用出去的输出不影响缓存
+    with open(restored, 'r+b') as f:
+        f.write(b"changed!")
+    assert cache.lookup(FINGERPRINT) is not None
+    again = tmp_path / "again.pdf"
+    cache.restore(FINGERPRINT, "merged.pdf", str(again))
+    assert again.read_bytes() == b"%PDF-1.7 original"
+
+
+def test_hardlink_setting_is_persisted(tmp_path, output):
+    cache = OutputCache(str(tmp_path / "cache"))
+    cache.set_hardlink(True)
+    cache.set_limit(1024 * 1024)
+    cache = OutputCache(str(tmp_path / "cache"))
+    assert cache.hardlink and cache.max_bytes == 1024 * 1024
+
+    cache.store(FINGERPRINT, [str(output)])
+    restored = tmp_path / "restored.pdf"
+    cache.restore(FINGERPRINT, "merged.pdf", str(restored))
+    assert os.path.samefile(output, restored)
@@ -0,0 +1,76 @@
+import pytest
+
+from PDF_Tools import PageRangeError, PageSet, format_page_spec, parse_page_ranges, parse_page_spec
+
+
+def pages(text, total_pages=10):
+    return list(parse_page_spec(text, total_pages))
+
+
+@pytest.mark.parametrize("text, expected", [
+    ("5", [4]),
+    ("1-3, 8", [0, 1, 2, 7]),
+    ("8-", [7, 8, 9]),
+    ("1-10:3", [0, 3, 6, 9]),
+    ("odd", [0, 2, 4, 6, 8]),
+    ("偶数", [1, 3, 5, 7, 9]),
+    ("last", [9]),
+    ("-2-last", [8, 9]),
+    ("1-6, !2-3", [0, 3, 4, 5]),
+    ("!1-8", [8, 9]),
+    ("3-5；4-6", [2, 3, 4, 5]),
+])
+def test_parse_page_spec(text, expected):
+    assert pages(text) == expected
+
+
+@pytest.mark.parametrize("text, expected", [
+    ("1-100:2", [0, 2, 4, 6, 8]),
+    ("7-20", [6, 7, 8, 9]),
+    ("9-", [8, 9]),
+])
+def test_range_end_is_clamped_to_last_page(text, expected):
+    assert pages(text) == expected
+
+
+@pytest.mark.parametrize("text", ["0", "11", "12-20", "50-", "-11", "5-3", "3:2", "1-4:0", "abc", "", "!1-10"])
+def test_invalid_page_spec(text):
+    with pytest.raises(PageRangeError):
+        pages(text)
+
+
+def test_error_reports_line_and_term():
+    with pytest.raises(PageRangeError) as excinfo:
+        parse_page_ranges("1-3\n\n11", 10)
+    assert excinfo.value.line == 3
+    assert excinfo.value.term == "11"
+
+
+def test_parse_page_ranges_one_part_per_line():
+    assert [list(p) for p in parse_page_ranges("1-2\n\n last \n", 5)] == [[0, 1], [4]]
+
+
+def test_wide_range_is_not_expanded():
+    page_set = parse_page_spec("1-1000000:2", 10 ** 6)
+    assert page_set.ranges == [range(0, 10 ** 6, 2)]
+    assert len(page_set) == 500000
+    assert 999998 in page_set and 999999 not in page_set
+
+
+def test_set_operations():
+    a = PageSet([range(0, 5)])
+    b = PageSet([range(3, 8)])
+    assert list(a | b) == list(range(8))
+    assert list(b - a) == [5, 6, 7]
+    assert PageSet.from_pages([4, 2, 3, 9]) == PageSet([range(2, 5), range(9, 10)])
+    assert not PageSet([range(0, 3)], [range(0, 3)])
+
+
+def test_clip():
+    assert list(PageSet([range(-2, 6, 2), range(8, 20)]).clip(10)) == [0, 2, 4, 8, 9]
+
+
+def test_format_page_spec_round_trip():
+    text = format_page_spec([0, 1, 2, 5, 7, 8])
+    assert text == "1-3, 6, 8-9"
+    assert pages(text) == [0, 1, 2, 5, 7, 8]
@@ -0,0 +1,81 @@
+import types
+
+import pytest
+
+import PDF_Tools
+from PDF_Tools import (PREFLIGHT_CACHE_KEY, PROBLEM_UNREADABLE, MetadataCache, PreflightChecker,
+                       diagnose_pdf)
+
+fitz = pytest.importorskip("fitz")
+
+
+@pytest.fixture
+def in_process(monkeypatch):
+    """检查任务在本进程中执行，替换的任务函数才会生效"""
+    monkeypatch.setattr(PDF_Tools, "can_use_process_pool", lambda: False)
+
+
+def make_pdf(path, page_count=3):
+    doc = fitz.open()
+    for _ in range(page_count):
+        doc.new_page()
+    doc.save(path)
+    doc.close()
+    return str(path)
+
+
+def cached_diagnosis(cache_dir, path):
+    cache = MetadataCache(str(cache_dir))
+    return cache.get(cache.file_hash(path), PREFLIGHT_CACHE_KEY)
+
+
+def test_diagnosis_is_cached_by_content(tmp_path, in_process, monkeypatch):
+    pdf = make_pdf(tmp_path / "a.pdf")
+    cache_dir = tmp_path / "cache"
+    assert PreflightChecker(MetadataCache(str(cache_dir))).check([pdf])[0]["pages"] == 3
+    assert cached_diagnosis(cache_dir, pdf) == {"pages": 3, "problems": {}, "encrypted": False}
+
+    def fail(*args):
+        raise AssertionError("缓存命中时不应重新检查")
+
+    monkeypatch.setitem(PDF_Tools.ISOLATED_TASKS, "diagnose", fail)
+    assert PreflightChecker(MetadataCache(str(cache_dir))).check([pdf])[0]["pages"] == 3
+
+
+def test_unreadable_file_is_cached_with_reason(tmp_path, in_process):
+    bad = tmp_path / "bad.pdf"
+    bad.write_bytes(b"not a pdf at all")
+    cache_dir = tmp_path / "cache"
+    diagnosis = PreflightChecker(MetadataCache(str(cache_dir))).check([str(bad)])[0]
+    assert diagnosis["problems"][PROBLEM_UNREADABLE].startswith("无法作为PDF打开: ")
+    assert str(tmp_path) not in diagnosis["problems"][PROBLEM_UNREADABLE]
+    assert cached_diagnosis(cache_dir, str(bad)) == diagnosis
+
+
+def test_failed_check_is_not_cached(tmp_path, in_process, monkeypatch):
+    pdf = make_pdf(tmp_path / "a.pdf")
+    cache_dir = tmp_path / "cache"
+
+    def out_of_memory(*args):
+        raise MemoryError()
+
+    monkeypatch.setitem(PDF_Tools.ISOLATED_TASKS, "diagnose", out_of_memory)
+    diagnosis = PreflightChecker(MetadataCache(str(cache_dir))).check([pdf])[0]
+    assert "MemoryError" in diagnosis["problems"][PROBLEM_UNREADABLE]
+    assert cached_diagnosis(cache_dir, pdf) is None
+
+    monkeypatch.undo()
+    monkeypatch.setattr(PDF_Tools, "can_use_process_pool", lambda: False)
+    assert PreflightChecker(MetadataCache(str(cache_dir))).check([pdf])[0]["problems"] == {}
+
+
+def test_diagnose_lets_resource_errors_propagate(tmp_path, monkeypatch):
+    pdf = make_pdf(tmp_path / "a.pdf")
+
+    def open_out_of_memory(*args):
+        raise MemoryError()
+
+    monkeypatch.setattr(PDF_Tools, "fitz", types.SimpleNamespace(open=open_out_of_memory,
+                                                                 FileDataError=fitz.FileDataError))
+    with pytest.raises(MemoryError):
+        diagnose_pdf(pdf)
@@ -0,0 +1,71 @@
+import os
+
+import pytest
+
+from PDF_Tools import PageSizeEstimator, plan_size_bounded_parts
+
+fitz = pytest.importorskip("fitz")
+
+IMAGE_SIDE = 100  # 随机像素几乎不可压缩，每张图约 30 KB
+
+
+def noise_pixmap():
+    return fitz.Pixmap(fitz.csRGB, IMAGE_SIDE, IMAGE_SIDE, os.urandom(IMAGE_SIDE * IMAGE_SIDE * 3), False)
+
+
+def image_document(path, page_count, shared_image=False, links=False):
+    doc = fitz.open()
+    shared = noise_pixmap()
+    for _ in range(page_count):
+        page = doc.new_page()
+        page.insert_image(fitz.Rect(50, 50, 300, 300), pixmap=shared if shared_image else noise_pixmap())
+    if links:
+        for page in doc:
+            for target in range(page_count):
+                if target != page.number:
+                    page.insert_link({"kind": fitz.LINK_GOTO, "page": target,
+                                      "from": fitz.Rect(10, 10 + 20 * target, 100, 25 + 20 * target)})
+    doc.save(path)
+    doc.close()
+    return fitz.open(path)
+
+
+def page_estimate(doc, page_num):
+    estimator = PageSizeEstimator(doc)
+    return sum(estimator.object_size(xref) for xref in estimator.page_objects(page_num))
+
+
+def written_size(doc, part, tmp_path):
+    out = fitz.open()
+    out.insert_pdf(doc, from_page=part.start, to_page=part.stop - 1)
+    path = tmp_path / f"part{part.start}.pdf"
+    out.save(path, garbage=1)
+    out.close()
+    return os.path.getsize(path)
+
+
+def test_parts_stay_under_limit(tmp_path):
+    doc = image_document(tmp_path / "imgs.pdf", 6)
+    limit = 100 * 1024
+    parts = plan_size_bounded_parts(doc, limit)
+    assert [len(part) for part in parts] == [3, 3]
+    for part in parts:
+        assert written_size(doc, part, tmp_path) <= limit
+
+
+def test_links_to_other_pages_are_not_counted(tmp_path):
+    plain = image_document(tmp_path / "plain.pdf", 6)
+    linked = image_document(tmp_path / "linked.pdf", 6, links=True)
+    # 链接注释本身只有几百字节，不能把目标页的图像算进来
+    assert page_estimate(linked, 0) < page_estimate(plain, 0) + 2048
+    assert plan_size_bounded_parts(linked, 100 * 1024) == plan_size_bounded_parts(plain, 100 * 1024)
+
+
+def test_shared_image_is_counted_once_per_part(tmp_path):
+    doc = image_document(tmp_path / "shared.pdf", 8, shared_image=True)
+    assert plan_size_bounded_parts(doc, 64 * 1024) == [range(0, 8)]
+
+
+def test_oversized_page_gets_its_own_part(tmp_path):
+    doc = image_document(tmp_path / "imgs.pdf", 3)
+    assert plan_size_bounded_parts(doc, 1024) == [range(0, 1), range(1, 2), range(2, 3)]
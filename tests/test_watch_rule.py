@@ -0,0 +1,62 @@
+import json
+import os
+
+import pytest
+
+from PDF_Tools import WatchRule, load_watch_config
+
+
+def rule(tmp_path, **data):
+    data.setdefault("input", "in")
+    data.setdefault("output", "out")
+    data.setdefault("action", "split")
+    data.setdefault("every", 2)
+    return WatchRule.from_dict(data, str(tmp_path))
+
+
+def test_default_directories(tmp_path):
+    watch_rule = rule(tmp_path)
+    assert watch_rule.done_dir == os.path.join(str(tmp_path), "in", "done")
+    assert watch_rule.failed_dir == os.path.join(str(tmp_path), "in", "failed")
+
+
+@pytest.mark.parametrize("data", [
+    {"output": "in"},
+    {"output": "in/parts"},
+    {"output": "in/./"},
+    {"done": "in"},
+    {"failed": "in/"},
+    {"done": "out"},
+    {"failed": "out", "action": "merge"},
+    {"action": "copy"},
+])
+def test_invalid_rules(tmp_path, data):
+    with pytest.raises(ValueError):
+        rule(tmp_path, **data)
+
+
+def test_symlinked_output_is_rejected(tmp_path):
+    (tmp_path / "in").mkdir()
+    os.symlink(tmp_path / "in", tmp_path / "link")
+    with pytest.raises(ValueError):
+        rule(tmp_path, output="link")
+
+
+def test_load_watch_config_reports_invalid_rule(tmp_path):
+    config = tmp_path / "watch.json"
+    config.write_text(json.dumps({"rules": [{"input": "in", "output": "in", "action": "merge"}]}),
+                      encoding='utf-8')
+    with pytest.raises(ValueError, match="输出目录"):
+        load_watch_config(str(config))
+
+
+def test_load_watch_config(tmp_path):
+    config = tmp_path / "watch.json"
+    config.write_text(json.dumps({"workers": 2, "rules": [
+        {"input": "a", "output": "out", "action": "merge", "batch_seconds": 5},
+        {"input": "b", "output": "out", "action": "split", "every": 3},
+    ]}), encoding='utf-8')
+    rules, settings = load_watch_config(str(config))
+    assert [r.action for r in rules] == ["merge", "split"]
+    assert rules[0].batch_seconds == 5
+    assert settings == {"workers": 2}